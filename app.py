@@ -91,6 +91,15 @@ def create_app():
     app.register_blueprint(main)
     app.register_blueprint(admin)
     app.register_blueprint(cart)
+
+    # Servers that import app:app never run init_database, so the full-text index is built here
+    from utils.search_index import SearchIndex
+    with app.app_context():
+        SearchIndex.ensure_on_startup()
+
+    # Render per-visitor state into every page instead of fetching it from scripts
+    from utils.session_state import inject_session_state
+    app.context_processor(inject_session_state)
     
     # Error handlers
     @app.errorhandler(404)
@@ -112,16 +121,38 @@ def create_app():
     
     return app
 
-app = create_app()
+def init_database(app):
+    """Create missing tables plus the search, trigram and similar-books indexes.
 
-if __name__ == "__main__":
+    app.py, main.py and `flask init-db` run this; create_app itself only
+    builds the full-text index, once the tables exist.
+    """
     with app.app_context():
         try:
             db.create_all()
             logger.info("Database tables created successfully")
+            from utils.search_index import SearchIndex
+            if SearchIndex.ensure_index():
+                logger.info("Full-text search index ready")
+            from utils.fuzzy_search import FuzzySearch
+            if FuzzySearch.ensure_index():
+                logger.info("Trigram search index ready")
+            from utils.similarity import SimilarityEngine
+            if SimilarityEngine.ensure_index():
+                logger.info("Similar-books index ready")
         except Exception as e:
             logger.error(f"Error creating database tables: {str(e)}")
             raise e
+
+app = create_app()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables and search indexes"""
+    init_database(app)
+
+if __name__ == "__main__":
+    init_database(app)
     
     # Add host and port configuration
     app.run(
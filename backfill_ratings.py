@@ -0,0 +1,29 @@
+from app import app, db
+from sqlalchemy import text
+from migrations.add_rating_aggregates import upgrade
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def backfill_ratings():
+    """Recompute every book's rating aggregates from the reviews table"""
+    with app.app_context():
+        try:
+            upgrade()
+            result = db.session.execute(text("""
+                UPDATE books SET
+                    rating_count = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id),
+                    rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.book_id = books.id),
+                    rating_avg = (SELECT COALESCE(AVG(rating), 0) FROM reviews WHERE reviews.book_id = books.id)
+            """))
+            db.session.commit()
+            logger.info(f"Backfilled rating aggregates for {result.rowcount} books")
+
+        except Exception as e:
+            logger.error(f"Error backfilling ratings: {str(e)}")
+            db.session.rollback()
+            raise e
+
+if __name__ == "__main__":
+    backfill_ratings()
@@ -0,0 +1,99 @@
+from app import app, db
+from models import User, UserPreference, UserRecommendation
+from utils.preferences import PreferenceProfile
+from utils.recommender import BookFeatures
+from utils.factorization import CollaborativeModel
+from sqlalchemy import func, or_, delete, insert
+from multiprocessing import Pool
+from datetime import datetime
+import argparse
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Recommendations stored per user; requests for more fall back to live scoring
+TOP_N = 20
+SHARD_SIZE = 500
+
+def changed_user_ids(recompute_all=False):
+    """Users with a preference profile updated since their recommendations were last computed"""
+    last_run = db.session.query(UserRecommendation.user_id,
+                                func.max(UserRecommendation.computed_at).label('computed_at'))\
+        .group_by(UserRecommendation.user_id).subquery()
+    query = db.session.query(UserPreference.user_id)\
+        .outerjoin(last_run, last_run.c.user_id == UserPreference.user_id)\
+        .group_by(UserPreference.user_id, last_run.c.computed_at)
+    if not recompute_all:
+        query = query.having(or_(last_run.c.computed_at.is_(None),
+                                 func.max(UserPreference.updated_at) > last_run.c.computed_at))
+    return sorted(user_id for (user_id,) in query)
+
+def drop_orphaned_recommendations():
+    """Delete stored recommendations of users who no longer have a preference profile; returns the number of rows"""
+    has_profile = db.session.query(UserPreference.user_id)\
+        .filter(UserPreference.user_id == UserRecommendation.user_id).exists()
+    return db.session.execute(delete(UserRecommendation).where(~has_profile)).rowcount
+
+def recommend_shard(user_ids):
+    """Score one shard of users in a worker process and replace their stored rows"""
+    with app.app_context():
+        try:
+            computed_at = datetime.utcnow()
+            profiles = PreferenceProfile.load(user_ids)
+            interacted = User.get_interacted_book_ids_for(user_ids)
+            rows = []
+            for user_id in user_ids:
+                book_ids = BookFeatures.recommend(profiles.get(user_id, {}),
+                                                  exclude=interacted.get(user_id, set()),
+                                                  limit=TOP_N,
+                                                  collaborative=CollaborativeModel.user_scores(user_id))
+                rows.extend({'user_id': user_id, 'rank': rank, 'book_id': book_id, 'computed_at': computed_at}
+                            for rank, book_id in enumerate(book_ids))
+            db.session.execute(delete(UserRecommendation).where(UserRecommendation.user_id.in_(user_ids)))
+            if rows:
+                db.session.execute(insert(UserRecommendation), rows)
+            db.session.commit()
+            return len(user_ids)
+
+        except Exception as e:
+            logger.error(f"Error computing recommendations for shard starting at user {user_ids[0]}: {str(e)}")
+            db.session.rollback()
+            raise e
+
+def batch_recommendations(recompute_all=False, workers=None):
+    """Precompute top-N recommendations for every user whose activity changed since the last run"""
+    with app.app_context():
+        try:
+            db.create_all()
+            dropped = drop_orphaned_recommendations()
+            db.session.commit()
+            if dropped:
+                logger.info(f"Dropped {dropped} recommendations of users without a preference profile")
+            user_ids = changed_user_ids(recompute_all)
+            # Workers open their own connections; never share pooled ones across a fork
+            db.engine.dispose()
+        except Exception as e:
+            logger.error(f"Error finding users to recompute: {str(e)}")
+            db.session.rollback()
+            raise e
+
+    if not user_ids:
+        logger.info("No users with changed activity; nothing to recompute")
+        return 0
+
+    shards = [user_ids[i:i + SHARD_SIZE] for i in range(0, len(user_ids), SHARD_SIZE)]
+    logger.info(f"Recomputing recommendations for {len(user_ids)} users in {len(shards)} shards")
+    done = 0
+    with Pool(processes=workers) as pool:
+        for count in pool.imap_unordered(recommend_shard, shards):
+            done += count
+            logger.info(f"Stored recommendations for {done}/{len(user_ids)} users")
+    return done
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute stored book recommendations")
+    parser.add_argument('--all', action='store_true', help="recompute every user, not only changed ones")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+    batch_recommendations(recompute_all=args.all, workers=args.workers)
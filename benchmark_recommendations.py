@@ -0,0 +1,257 @@
+import os
+import time
+import random
+import argparse
+import logging
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CATEGORIES = 20
+TAGS = 300
+TAGS_PER_BOOK = 3
+BOOKS_PER_AUTHOR = 5
+# Share of a user's interactions drawn from their favourite categories
+TASTE_FOCUS = 0.8
+# Interaction mix: reviews, purchased order items, reading-list entries
+INTERACTION_MIX = (0.4, 0.4, 0.2)
+BATCH = 20000
+
+def zipf_weights(n, exponent=0.8):
+    return [1 / (rank + 1) ** exponent for rank in range(n)]
+
+def insert_batches(db, model, rows):
+    """Plain executemany INSERTs through the model's table, skipping ORM bulk processing"""
+    from sqlalchemy import insert
+
+    table = getattr(model, '__table__', model)
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(insert(table), rows[start:start + BATCH])
+
+def generate(db, users, books, interactions, holdout, seed):
+    """Fill an empty database with a synthetic catalog and history; returns held-out relevant books per user"""
+    from models import (User, Book, Category, Tag, book_tags, Review, Order, OrderItem,
+                        ReadingList, ReadingListItem)
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    categories = [f'Category {i}' for i in range(CATEGORIES)]
+    tags = [f'tag-{i}' for i in range(TAGS)]
+    tag_weights = zipf_weights(TAGS)
+    insert_batches(db, Category, [{'id': i + 1, 'name': name} for i, name in enumerate(categories)])
+    insert_batches(db, Tag, [{'id': i + 1, 'name': name} for i, name in enumerate(tags)])
+
+    book_rows, tag_rows = [], []
+    by_category = {name: [] for name in categories}
+    for book_id in range(1, books + 1):
+        category = rng.choice(categories)
+        book_tag_ids = set(rng.choices(range(TAGS), weights=tag_weights, k=TAGS_PER_BOOK))
+        book_rows.append({
+            'id': book_id,
+            'title': f'Synthetic Book {book_id}',
+            'author': f'Author {book_id // BOOKS_PER_AUTHOR}',
+            'price': round(rng.uniform(5, 80), 2),
+            'description': f'A {category.lower()} book about ' + ' and '.join(tags[t] for t in book_tag_ids),
+            'stock': rng.randint(0, 50),
+            'category': category,
+            'language': 'English',
+            'tags': ','.join(tags[t] for t in sorted(book_tag_ids)),
+            'created_at': now,
+            'rating_count': 0,
+            'rating_sum': 0,
+            'rating_avg': 0
+        })
+        tag_rows.extend({'book_id': book_id, 'tag_id': t + 1} for t in book_tag_ids)
+        by_category[category].append(book_id)
+    popularity = {name: zipf_weights(len(ids)) for name, ids in by_category.items()}
+    all_books, all_weights = list(range(1, books + 1)), zipf_weights(books)
+
+    insert_batches(db, User, [{'id': user_id, 'username': f'bench{user_id}', 'email': f'bench{user_id}@example.com',
+                               'password_hash': '', 'role': 'customer', 'created_at': now}
+                              for user_id in range(1, users + 1)])
+
+    review_rows, order_rows, item_rows, list_rows, list_item_rows = [], [], [], [], []
+    ratings = {}
+    held_out = {}
+    per_user = max(1, interactions // users)
+    for user_id in range(1, users + 1):
+        favourites = rng.sample(categories, rng.randint(1, 3))
+        count = max(1, int(rng.expovariate(1 / per_user)))
+        history = {}
+        for _ in range(count):
+            if rng.random() < TASTE_FOCUS:
+                category = rng.choice(favourites)
+                if not by_category[category]:
+                    continue
+                book_id = rng.choices(by_category[category], weights=popularity[category])[0]
+            else:
+                book_id = rng.choices(all_books, weights=all_weights)[0]
+            if book_id in history:
+                continue
+            kind = rng.choices(('review', 'purchase', 'list'), weights=INTERACTION_MIX)[0]
+            liked = book_rows[book_id - 1]['category'] in favourites
+            history[book_id] = (kind, rng.randint(4, 5) if liked else rng.randint(1, 3))
+
+        # Hold out a share of each user's positive interactions as the relevance set
+        positives = [book_id for book_id, (kind, rating) in history.items() if kind != 'review' or rating >= 4]
+        if len(history) >= 5 and positives:
+            test = set(rng.sample(positives, max(1, int(len(positives) * holdout))))
+            held_out[user_id] = test
+            history = {book_id: value for book_id, value in history.items() if book_id not in test}
+
+        order_id = list_id = None
+        for book_id, (kind, rating) in history.items():
+            if kind == 'review':
+                review_rows.append({'user_id': user_id, 'book_id': book_id, 'rating': rating,
+                                    'comment': 'Synthetic review', 'created_at': now})
+                ratings.setdefault(book_id, []).append(rating)
+            elif kind == 'purchase':
+                if order_id is None:
+                    order_id = len(order_rows) + 1
+                    order_rows.append({'id': order_id, 'user_id': user_id, 'total': 0, 'status': 'delivered',
+                                       'payment_status': 'paid', 'created_at': now})
+                price = book_rows[book_id - 1]['price']
+                item_rows.append({'order_id': order_id, 'book_id': book_id, 'quantity': 1, 'price': price})
+                order_rows[order_id - 1]['total'] += price
+            else:
+                if list_id is None:
+                    list_id = len(list_rows) + 1
+                    list_rows.append({'id': list_id, 'user_id': user_id, 'name': 'Want to read',
+                                      'created_at': now})
+                list_item_rows.append({'reading_list_id': list_id, 'book_id': book_id, 'added_at': now})
+
+    for book_id, values in ratings.items():
+        row = book_rows[book_id - 1]
+        row['rating_count'], row['rating_sum'] = len(values), sum(values)
+        row['rating_avg'] = sum(values) / len(values)
+    insert_batches(db, Book, book_rows)
+    insert_batches(db, book_tags, tag_rows)
+    insert_batches(db, Review, review_rows)
+    insert_batches(db, Order, order_rows)
+    insert_batches(db, OrderItem, item_rows)
+    insert_batches(db, ReadingList, list_rows)
+    insert_batches(db, ReadingListItem, list_item_rows)
+    db.session.commit()
+    logger.info(f"Generated {books} books, {users} users and "
+                f"{len(review_rows) + len(item_rows) + len(list_item_rows)} interactions "
+                f"({len(review_rows)} reviews, {len(item_rows)} order items, {len(list_item_rows)} reading-list items)")
+    return held_out
+
+def build_indexes(db, train_als):
+    from models import BookCoPurchase
+    from utils.similarity import SimilarityEngine
+    from utils.preferences import PreferenceProfile
+    from utils.factorization import CollaborativeModel
+
+    steps = [
+        ('similar books', SimilarityEngine.rebuild),
+        ('co-purchases', BookCoPurchase.rebuild),
+        ('preference profiles', PreferenceProfile.rebuild),
+    ]
+    if train_als:
+        steps.append(('ALS factors', lambda: CollaborativeModel.train(iterations=5)))
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        db.session.commit()
+        logger.info(f"Built {name} in {time.perf_counter() - started:.2f}s")
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+def measure(db, name, call, targets):
+    """Latency percentiles and query counts of call(target) over all targets, after one warm-up call"""
+    from utils.query_budget import QueryCounter
+
+    call(targets[0])
+    db.session.rollback()
+    timings, queries = [], []
+    for target in targets:
+        with QueryCounter() as counter:
+            started = time.perf_counter()
+            call(target)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+        # Drop loaded objects so every call pays for its own queries
+        db.session.expunge_all()
+    logger.info(f"{name:<36} p50 {percentile(timings, 0.5):8.2f}ms  p95 {percentile(timings, 0.95):8.2f}ms  "
+                f"p99 {percentile(timings, 0.99):8.2f}ms  queries/call {sum(queries) / len(queries):5.1f}")
+
+def evaluate(db, held_out, k, sample, total_books):
+    """precision@k, recall@k and catalog coverage of get_recommended_books on the held-out split"""
+    from models import User
+
+    precision, recall, recommended = [], [], set()
+    for user_id in sample:
+        user = db.session.get(User, user_id)
+        book_ids = [book.id for book in user.get_recommended_books(limit=k)]
+        hits = len(set(book_ids) & held_out[user_id])
+        precision.append(hits / k)
+        recall.append(hits / len(held_out[user_id]))
+        recommended.update(book_ids)
+        db.session.expunge_all()
+    logger.info(f"precision@{k} {sum(precision) / len(precision):.4f}  recall@{k} {sum(recall) / len(recall):.4f}  "
+                f"coverage {len(recommended) / total_books:.4f} over {len(sample)} held-out users")
+
+def benchmark_recommendations(args):
+    """Generate a synthetic catalog, then time and evaluate every recommendation entry point"""
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    database = os.path.join(workdir, 'benchmark.db')
+    if os.path.exists(database):
+        os.remove(database)
+    # The app reads its database URL at import time, so it is imported only once this is set
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    from app import app, db
+    from models import User, Book
+
+    # Keep benchmark model files away from the real instance folder
+    app.instance_path = workdir
+    with app.app_context():
+        try:
+            db.create_all()
+            held_out = generate(db, args.users, args.books, args.interactions, args.holdout, args.seed)
+            build_indexes(db, args.train_als)
+
+            rng = random.Random(args.seed)
+            user_ids = rng.sample(range(1, args.users + 1), min(args.samples, args.users))
+            book_ids = rng.sample(range(1, args.books + 1), min(args.samples, args.books))
+            user = lambda user_id: db.session.get(User, user_id)
+            book = lambda book_id: db.session.get(Book, book_id)
+
+            measure(db, 'User.get_recommended_books', lambda u: user(u).get_recommended_books(limit=args.k), user_ids)
+            measure(db, 'User.get_similar_users', lambda u: user(u).get_similar_users(limit=5), user_ids)
+            measure(db, 'User.get_reading_preferences', lambda u: user(u).get_reading_preferences(), user_ids)
+            measure(db, 'Book.get_similar_books', lambda b: book(b).get_similar_books(limit=5), book_ids)
+            measure(db, 'Book.get_frequently_bought_together',
+                    lambda b: book(b).get_frequently_bought_together(limit=3), book_ids)
+
+            evaluated = sorted(held_out)
+            sample = rng.sample(evaluated, min(args.samples, len(evaluated)))
+            if sample:
+                evaluate(db, held_out, args.k, sample, args.books)
+            else:
+                logger.info("No users with enough history to evaluate; raise --interactions")
+
+        except Exception as e:
+            logger.error(f"Error running recommendation benchmark: {str(e)}")
+            db.session.rollback()
+            raise e
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark and evaluate the recommendation engine on synthetic data")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--interactions', type=int, default=50000,
+                        help="approximate review, order item and reading-list rows to generate")
+    parser.add_argument('--holdout', type=float, default=0.2, help="share of each user's positives held out")
+    parser.add_argument('--samples', type=int, default=200, help="users and books timed per entry point")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--train-als', action='store_true', help="train collaborative factors before measuring")
+    parser.add_argument('--workdir', default=os.path.join('instance', 'benchmark'),
+                        help="directory for the generated SQLite database and model files")
+    benchmark_recommendations(parser.parse_args())
@@ -0,0 +1,30 @@
+from app import app, db
+from utils.similarity import SimilarityEngine
+import argparse
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def build_similarities(pending=False):
+    """Recompute the similar-books table for the whole catalog, or only for books queued by edits"""
+    with app.app_context():
+        try:
+            db.create_all()
+            if pending:
+                count = SimilarityEngine.process_pending()
+                logger.info(f"Refreshed similar books for {count} books affected by queued edits")
+            else:
+                count = SimilarityEngine.rebuild()
+                logger.info(f"Computed similar books for {count} books")
+
+        except Exception as e:
+            logger.error(f"Error building similar books: {str(e)}")
+            raise e
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the similar-books table")
+    parser.add_argument('--pending', action='store_true',
+                        help="only refresh books queued by catalog edits; run this periodically, e.g. from cron")
+    args = parser.parse_args()
+    build_similarities(pending=args.pending)
@@ -230,7 +230,7 @@ def fetch_and_add_books():
                         book.publication_date = pub_date
                         book.page_count = page_count
                         book.language = editions[0].get('languages', [{'key': '/languages/eng'}])[0]['key'].split('/')[-1] if editions and editions[0].get('languages') else 'eng'
-                        book.tags = ','.join(work_details.get('subjects', [])[:5]) if 'subjects' in work_details else ''
+                        book.set_tags(','.join(work_details.get('subjects', [])[:5]) if 'subjects' in work_details else '')
                         book.is_featured = False
                         
                         # Add series information if available
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, FloatField, TextAreaField, IntegerField, SelectField, DateTimeField, BooleanField, FieldList, FormField
+from wtforms import StringField, PasswordField, HiddenField, FloatField, TextAreaField, IntegerField, SelectField, DateTimeField, BooleanField, FieldList, FormField
 from wtforms.validators import DataRequired, Email, Length, NumberRange, EqualTo, Optional, ValidationError
 from datetime import datetime
 import re
@@ -7,11 +7,14 @@ import re
 class LoginForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired()])
+    # Guest cart JSON filled in by cart.js, merged into the account's cart
+    guest_cart = HiddenField()
 
 class RegisterForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=3, max=64)])
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired(), Length(min=6)])
+    guest_cart = HiddenField()
 
 class UserForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=3, max=64)])
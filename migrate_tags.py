@@ -0,0 +1,53 @@
+from app import app, db
+from sqlalchemy import insert
+from models import Book, Tag, book_tags
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_tags():
+    """Convert the comma-separated books.tags column into tags/book_tags rows"""
+    with app.app_context():
+        try:
+            db.create_all()
+
+            books = db.session.query(Book.id, Book.tags).filter(Book.tags.isnot(None)).all()
+            book_names = {book_id: Tag.normalize_names(csv) for book_id, csv in books}
+
+            # Create every missing tag in one batch
+            all_names = {name for names in book_names.values() for name in names}
+            existing = {name for (name,) in db.session.query(Tag.name).filter(Tag.name.in_(all_names))}
+            missing = sorted(all_names - existing)
+            if missing:
+                db.session.execute(insert(Tag), [{'name': name} for name in missing])
+            tag_ids = dict(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(all_names)))
+            logger.info(f"Created {len(missing)} tags")
+
+            # Link books to tags, skipping pairs that were already migrated
+            linked = set(db.session.query(book_tags.c.book_id, book_tags.c.tag_id))
+            rows = []
+            for book_id, names in book_names.items():
+                for name in names:
+                    if (book_id, tag_ids[name]) not in linked:
+                        rows.append({'book_id': book_id, 'tag_id': tag_ids[name]})
+            if rows:
+                db.session.execute(insert(book_tags), rows)
+
+            # Store the normalized form back so the column and the tag rows agree
+            for book_id, csv in books:
+                normalized = ','.join(book_names[book_id])
+                if csv != normalized:
+                    db.session.query(Book).filter_by(id=book_id).update(
+                        {Book.tags: normalized}, synchronize_session=False)
+
+            db.session.commit()
+            logger.info(f"Linked {len(rows)} book tags across {len(book_names)} books")
+
+        except Exception as e:
+            logger.error(f"Error migrating tags: {str(e)}")
+            db.session.rollback()
+            raise e
+
+if __name__ == "__main__":
+    migrate_tags()
@@ -0,0 +1,26 @@
+from app import app, db
+from sqlalchemy import text
+
+def upgrade():
+    # Merge duplicate lines for the same book into the oldest one, then enforce one line per book
+    db.session.execute(text('''
+        UPDATE cart_items SET quantity = (
+            SELECT SUM(other.quantity) FROM cart_items other
+            WHERE other.user_id = cart_items.user_id AND other.book_id = cart_items.book_id)
+        WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, book_id HAVING COUNT(*) > 1)
+    '''))
+    db.session.execute(text('''
+        DELETE FROM cart_items
+        WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, book_id)
+    '''))
+    db.session.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_cart_items_user_book ON cart_items (user_id, book_id)'))
+    db.session.commit()
+
+def downgrade():
+    db.session.execute(text('DROP INDEX IF EXISTS uq_cart_items_user_book'))
+    db.session.commit()
+
+if __name__ == "__main__":
+    with app.app_context():
+        upgrade()
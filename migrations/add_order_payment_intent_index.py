@@ -0,0 +1,16 @@
+from app import app, db
+from sqlalchemy import text
+
+def upgrade():
+    # One order per payment intent; fails if duplicate orders already exist and need resolving by hand
+    db.session.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_orders_payment_intent_id ON orders (payment_intent_id)'))
+    db.session.commit()
+
+def downgrade():
+    db.session.execute(text('DROP INDEX IF EXISTS ix_orders_payment_intent_id'))
+    db.session.commit()
+
+if __name__ == "__main__":
+    with app.app_context():
+        upgrade()
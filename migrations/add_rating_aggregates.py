@@ -0,0 +1,28 @@
+from app import app, db
+from sqlalchemy import text, inspect
+
+RATING_COLUMNS = {
+    'rating_count': 'INTEGER NOT NULL DEFAULT 0',
+    'rating_sum': 'INTEGER NOT NULL DEFAULT 0',
+    'rating_avg': 'FLOAT NOT NULL DEFAULT 0',
+}
+
+def upgrade():
+    # Add denormalized rating aggregate columns to books table
+    existing = {column['name'] for column in inspect(db.engine).get_columns('books')}
+    for name, definition in RATING_COLUMNS.items():
+        if name not in existing:
+            db.session.execute(text(f'ALTER TABLE books ADD COLUMN {name} {definition}'))
+    db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_books_rating_avg ON books (rating_avg)'))
+    db.session.commit()
+
+def downgrade():
+    # Remove rating aggregate columns from books table
+    db.session.execute(text('DROP INDEX IF EXISTS ix_books_rating_avg'))
+    for name in RATING_COLUMNS:
+        db.session.execute(text(f'ALTER TABLE books DROP COLUMN {name}'))
+    db.session.commit()
+
+if __name__ == "__main__":
+    with app.app_context():
+        upgrade()
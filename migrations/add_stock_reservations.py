@@ -0,0 +1,20 @@
+from app import app, db
+from sqlalchemy import text, inspect
+
+def upgrade():
+    # Copies held by checkouts in progress, and the holds themselves
+    existing = {column['name'] for column in inspect(db.engine).get_columns('books')}
+    if 'reserved' not in existing:
+        db.session.execute(text('ALTER TABLE books ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0'))
+    db.session.commit()
+    from models import StockReservation
+    StockReservation.__table__.create(db.engine, checkfirst=True)
+
+def downgrade():
+    db.session.execute(text('DROP TABLE IF EXISTS stock_reservations'))
+    db.session.execute(text('ALTER TABLE books DROP COLUMN reserved'))
+    db.session.commit()
+
+if __name__ == "__main__":
+    with app.app_context():
+        upgrade()
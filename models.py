@@ -1,10 +1,17 @@
 from flask_login import UserMixin
 from datetime import datetime
-from sqlalchemy import func, text
+from sqlalchemy import func, text, update, case, event, inspect
+from sqlalchemy.orm import Session
 from sqlalchemy.ext.hybrid import hybrid_property
 from extensions import db
 from werkzeug.security import check_password_hash
 from utils.image_optimizer import ImageOptimizer
+from utils.similarity import SimilarityEngine
+from utils.recommender import BookFeatures
+from utils.factorization import CollaborativeModel
+from utils.similar_users import SimilarUsers
+from utils.preferences import PreferenceProfile
+from utils.model_events import record_change
 from collections import Counter
 import numpy as np
 from sqlalchemy import and_
@@ -63,6 +70,57 @@ class User(UserMixin, db.Model):
     def can(self, permission):
         return permission in self.get_permissions() or self.is_admin
 
+    @classmethod
+    def get_interacted_book_ids_for(cls, user_ids):
+        """{user_id: IDs of books the user has reviewed or purchased} for several users at once"""
+        user_ids = list(user_ids)
+        reviewed = db.session.query(Review.user_id, Review.book_id).filter(Review.user_id.in_(user_ids))
+        purchased = db.session.query(Order.user_id, OrderItem.book_id).join(Order)\
+            .filter(Order.user_id.in_(user_ids))
+        interacted = {}
+        for user_id, book_id in reviewed.union(purchased):
+            if book_id:
+                interacted.setdefault(user_id, set()).add(book_id)
+        return interacted
+
+    def get_interacted_book_ids(self):
+        """IDs of books the user has reviewed or purchased"""
+        return self.get_interacted_book_ids_for([self.id]).get(self.id, set())
+
+    @classmethod
+    def get_book_weights_for(cls, user_ids=None):
+        """{user_id: Counter(book_id: weight)} for the given users, or for everyone"""
+        def scoped(query, column):
+            return query if user_ids is None else query.filter(column.in_(list(user_ids)))
+
+        book_weights = {}
+
+        # Add weights from reviews, considering only positive reviews
+        positive_reviews = scoped(db.session.query(Review.user_id, Review.book_id)
+                                  .filter(Review.rating >= 4), Review.user_id)
+        for user_id, book_id in positive_reviews:
+            book_weights.setdefault(user_id, Counter())[book_id] += 2
+
+        # Add weights from purchases
+        purchases = scoped(db.session.query(Order.user_id, OrderItem.book_id, func.count(OrderItem.id))
+                           .join(Order).filter(OrderItem.book_id.isnot(None)), Order.user_id)\
+            .group_by(Order.user_id, OrderItem.book_id)
+        for user_id, book_id, count in purchases:
+            book_weights.setdefault(user_id, Counter())[book_id] += count
+
+        # Add weights from reading lists
+        listed = scoped(db.session.query(ReadingList.user_id, ReadingListItem.book_id, func.count(ReadingListItem.id))
+                        .join(ReadingList), ReadingList.user_id)\
+            .group_by(ReadingList.user_id, ReadingListItem.book_id)
+        for user_id, book_id, count in listed:
+            book_weights.setdefault(user_id, Counter())[book_id] += count
+
+        return book_weights
+
+    def get_preference_profile(self):
+        """{(kind, value): weight} of the user's stored category, tag and author preferences"""
+        return PreferenceProfile.load([self.id]).get(self.id, {})
+
     def get_reading_preferences(self):
         """Get user's reading preferences based on ratings, purchases, and reading lists"""
         preferences = {
@@ -70,112 +128,50 @@ class User(UserMixin, db.Model):
             'tags': Counter(),
             'authors': Counter()
         }
-        
-        # Add weights from reviews
-        for review in self.reviews.all():
-            if review.rating >= 4:  # Consider only positive reviews
-                preferences['categories'][review.book.category] += 2
-                if review.book.tags:
-                    for tag in review.book.tags.split(','):
-                        preferences['tags'][tag.strip()] += 2
-                preferences['authors'][review.book.author] += 2
-
-        # Add weights from purchases
-        for order in self.orders.all():
-            for item in order.items:
-                preferences['categories'][item.book.category] += 1
-                if item.book.tags:
-                    for tag in item.book.tags.split(','):
-                        preferences['tags'][tag.strip()] += 1
-                preferences['authors'][item.book.author] += 1
-
-        # Add weights from reading lists
-        for reading_list in self.reading_lists.all():
-            for item in reading_list.items:
-                preferences['categories'][item.book.category] += 1
-                if item.book.tags:
-                    for tag in item.book.tags.split(','):
-                        preferences['tags'][tag.strip()] += 1
-                preferences['authors'][item.book.author] += 1
-
+        for (kind, value), weight in self.get_preference_profile().items():
+            preferences[PreferenceProfile.KINDS[kind]][value] += weight
         return preferences
 
     def get_recommended_books(self, limit=10):
         """Get personalized book recommendations for the user"""
-        preferences = self.get_reading_preferences()
-        
-        # Get books the user has already interacted with
-        interacted_books = set()
-        for review in self.reviews.all():
-            interacted_books.add(review.book_id)
-        for order in self.orders.all():
-            for item in order.items:
-                interacted_books.add(item.book_id)
-
-        # Calculate recommendation scores for all other books
-        all_books = Book.query.filter(Book.id.notin_(interacted_books)).all()
-        book_scores = []
-
-        for book in all_books:
-            score = 0
-            
-            # Category match
-            if book.category in preferences['categories']:
-                score += preferences['categories'][book.category] * 2
-            
-            # Tag matches
-            if book.tags:
-                for tag in book.tags.split(','):
-                    tag = tag.strip()
-                    if tag in preferences['tags']:
-                        score += preferences['tags'][tag]
-            
-            # Author match
-            if book.author in preferences['authors']:
-                score += preferences['authors'][book.author] * 1.5
-            
-            # Rating factor
-            score *= (1 + book.average_rating / 5.0)
-            
-            book_scores.append((book, score))
-
-        # Sort by score and return top recommendations
-        book_scores.sort(key=lambda x: x[1], reverse=True)
-        return [book for book, _ in book_scores[:limit]]
+        book_ids = BookFeatures.recommend(self.get_preference_profile(),
+                                          exclude=self.get_interacted_book_ids(),
+                                          limit=limit,
+                                          collaborative=CollaborativeModel.user_scores(self.id))
+        books = {book.id: book for book in Book.query.filter(Book.id.in_(book_ids))}
+        return [books[book_id] for book_id in book_ids if book_id in books]
+
+    def get_stored_recommendations(self, limit=10):
+        """Unseen books from the precomputed user_recommendations table, or [] if too few are stored"""
+        books = Book.query.join(UserRecommendation, UserRecommendation.book_id == Book.id)\
+            .filter(UserRecommendation.user_id == self.id,
+                    Book.id.notin_(self.get_interacted_book_ids()))\
+            .order_by(UserRecommendation.rank)\
+            .limit(limit).all()
+        return books if len(books) == limit else []
 
     def get_similar_users(self, limit=5):
         """Find users with similar reading preferences"""
-        user_scores = {}
-        
-        # Get all users except self
-        other_users = User.query.filter(User.id != self.id).all()
-        
-        my_prefs = self.get_reading_preferences()
-        
-        for other_user in other_users:
-            score = 0
-            other_prefs = other_user.get_reading_preferences()
-            
-            # Compare category preferences
-            for category, weight in my_prefs['categories'].items():
-                if category in other_prefs['categories']:
-                    score += min(weight, other_prefs['categories'][category])
-            
-            # Compare tag preferences
-            for tag, weight in my_prefs['tags'].items():
-                if tag in other_prefs['tags']:
-                    score += min(weight, other_prefs['tags'][tag])
-            
-            # Compare author preferences
-            for author, weight in my_prefs['authors'].items():
-                if author in other_prefs['authors']:
-                    score += min(weight, other_prefs['authors'][author])
-            
-            user_scores[other_user] = score
-        
-        # Sort by score and return top similar users
-        similar_users = sorted(user_scores.items(), key=lambda x: x[1], reverse=True)
-        return [user for user, _ in similar_users[:limit]]
+        user_ids = SimilarUsers.similar(self.id, limit=limit)
+        users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+        return [users[user_id] for user_id in user_ids if user_id in users]
+
+class UserPreference(db.Model):
+    """Weight of a category, tag or author in a user's reading profile, kept by PreferenceProfile"""
+    __tablename__ = 'user_preferences'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(200), primary_key=True)
+    weight = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserRecommendation(db.Model):
+    """Top-N recommended books per user, precomputed by batch_recommendations.py"""
+    __tablename__ = 'user_recommendations'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Category(db.Model):
     __tablename__ = 'categories'
@@ -187,6 +183,47 @@ class Category(db.Model):
     parent_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
     children = db.relationship('Category', backref=db.backref('parent', remote_side=[id]))
 
+# Inverted index from tags to books; the composite primary key covers book -> tags
+book_tags = db.Table(
+    'book_tags',
+    db.Column('book_id', db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_book_tags_tag_id_book_id', 'tag_id', 'book_id')
+)
+
+class Tag(db.Model):
+    __tablename__ = 'tags'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False, index=True)
+
+    @staticmethod
+    def normalize_names(csv):
+        """Split a comma-separated tag string into unique, lowercase tag names"""
+        names = []
+        for name in (csv or '').split(','):
+            name = ' '.join(name.split()).lower()[:100]
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    @classmethod
+    def get_or_create(cls, names):
+        """Fetch tags by name in one query, adding any that do not exist yet"""
+        if not names:
+            return []
+        # Include tags added earlier in this unit of work but not flushed yet
+        existing = {obj.name: obj for obj in db.session.new if isinstance(obj, cls)}
+        with db.session.no_autoflush:
+            existing.update({tag.name: tag for tag in cls.query.filter(cls.name.in_(names)).all()})
+        tags = []
+        for name in names:
+            tag = existing.get(name)
+            if tag is None:
+                tag = cls(name=name)
+                db.session.add(tag)
+            tags.append(tag)
+        return tags
+
 class BookFormat(db.Model):
     __tablename__ = 'book_formats'
     id = db.Column(db.Integer, primary_key=True)
@@ -221,9 +258,16 @@ class Book(db.Model):
     wishlisted_by = db.relationship('Wishlist', backref='book', lazy=True, cascade='all, delete-orphan')
     reading_list_items = db.relationship('ReadingListItem', backref='book', lazy=True, cascade='all, delete-orphan')
     formats = db.relationship('BookFormat', back_populates='book', lazy=True, cascade='all, delete-orphan')
+    tag_list = db.relationship('Tag', secondary=book_tags, lazy=True,
+                               backref=db.backref('books', lazy='dynamic'))
     is_featured = db.Column(db.Boolean, default=False)
     series_id = db.Column(db.Integer, db.ForeignKey('book_series.id', ondelete='SET NULL'))
     series_order = db.Column(db.Integer)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_avg = db.Column(db.Float, nullable=False, default=0, index=True)
+    # Copies held by unexpired checkout reservations (see utils/reservations.py)
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     @property
     def thumbnail_url(self):
@@ -240,37 +284,135 @@ class Book(db.Model):
         """Get large version of book cover"""
         return ImageOptimizer.get_optimized_url(self.image_url, 'large')
 
-    @property
+    def set_tags(self, csv):
+        """Set tags from a comma-separated string, keeping the tags column and tag_list in step"""
+        names = Tag.normalize_names(csv)
+        self.tags = ','.join(names)
+        self.tag_list = Tag.get_or_create(names)
+
+    @hybrid_property
     def average_rating(self):
-        if not self.reviews:
-            return 0
-        rating = db.session.query(func.avg(Review.rating)).filter(Review.book_id == self.id).scalar()
-        return rating if rating is not None else 0
+        return self.rating_avg or 0
+
+    @average_rating.expression
+    def average_rating(cls):
+        return cls.rating_avg
+
+    @hybrid_property
+    def available_stock(self):
+        """Copies that can still be sold: stock not held by a checkout in progress"""
+        return (self.stock or 0) - (self.reserved or 0)
+
+    @available_stock.expression
+    def available_stock(cls):
+        return func.coalesce(cls.stock, 0) - cls.reserved
+
+    @classmethod
+    def apply_rating_deltas(cls, conn, deltas):
+        """Add {book_id: (count delta, sum delta)} to the books' rating aggregates in one UPDATE through conn"""
+        if not deltas:
+            return
+        count = cls.rating_count + case({book_id: delta[0] for book_id, delta in deltas.items()},
+                                        value=cls.id, else_=0)
+        total = cls.rating_sum + case({book_id: delta[1] for book_id, delta in deltas.items()},
+                                      value=cls.id, else_=0)
+        conn.execute(update(cls).where(cls.id.in_(list(deltas))).values(
+            rating_count=count,
+            rating_sum=total,
+            rating_avg=case((count > 0, total * 1.0 / count), else_=0)))
 
     def get_similar_books(self, limit=5):
-        """Get similar books based on category and tags"""
+        """Get the most similar books from the precomputed neighbour table"""
+        books = Book.query.join(BookSimilarity, BookSimilarity.similar_book_id == Book.id)\
+            .filter(BookSimilarity.book_id == self.id)\
+            .order_by(BookSimilarity.rank)\
+            .limit(limit).all()
+        if books:
+            return books
+        # Not indexed yet: fall back to books in the same category
         return Book.query.filter(
             Book.category == self.category,
             Book.id != self.id
         ).limit(limit).all()
 
     def get_frequently_bought_together(self, limit=3):
-        """Get books frequently bought together"""
-        query = text("""
-            SELECT b.id, COUNT(*) as purchase_count
-            FROM books b
-            JOIN order_items oi1 ON b.id = oi1.book_id
-            JOIN orders o1 ON oi1.order_id = o1.id
-            JOIN orders o2 ON o1.user_id = o2.user_id
-            JOIN order_items oi2 ON o2.id = oi2.order_id
-            WHERE oi2.book_id = :book_id AND b.id != :book_id
-            GROUP BY b.id
-            ORDER BY purchase_count DESC
-            LIMIT :limit
-        """)
-        result = db.session.execute(query, {'book_id': self.id, 'limit': limit})
-        book_ids = [row[0] for row in result]
-        return Book.query.filter(Book.id.in_(book_ids)).all()
+        """Get the books most often bought by customers who bought this one"""
+        return Book.query.join(BookCoPurchase, BookCoPurchase.other_book_id == Book.id)\
+            .filter(BookCoPurchase.book_id == self.id)\
+            .order_by(BookCoPurchase.count.desc(), Book.id)\
+            .limit(limit).all()
+
+class BookSimilarity(db.Model):
+    """Content-based nearest neighbours of each book, maintained by SimilarityEngine"""
+    __tablename__ = 'book_similarities'
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    similar_book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+class PendingSimilarity(db.Model):
+    """Books whose neighbours need recomputing, queued by commits and drained by build_similarities.py --pending"""
+    __tablename__ = 'pending_similarities'
+    # No foreign key: deleted books stay queued so their neighbours' lists get recomputed
+    book_id = db.Column(db.Integer, primary_key=True)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    queued_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class BookCoPurchase(db.Model):
+    """How many customers bought both books, stored in both directions"""
+    __tablename__ = 'book_copurchases'
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    other_book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_book_copurchases_book_count', 'book_id', 'count'),
+    )
+
+    @classmethod
+    def record_purchase(cls, user_id, book_ids):
+        """Count the pairs a new order adds to the user's purchase history, in the current transaction.
+
+        Must run before the new order is flushed, so the history lookup only
+        sees earlier orders.
+        """
+        from utils.bulk import upsert
+
+        book_ids = {book_id for book_id in book_ids if book_id is not None}
+        previous = {book_id for book_id, in db.session.query(OrderItem.book_id).distinct()
+                    .join(Order, Order.id == OrderItem.order_id)
+                    .filter(Order.user_id == user_id, OrderItem.book_id.isnot(None))}
+        new = book_ids - previous
+        pairs = {(a, b) for a in new for b in (previous | book_ids) if a != b}
+        pairs |= {(b, a) for a, b in pairs}
+        upsert(cls, [{'book_id': a, 'other_book_id': b, 'count': 1} for a, b in sorted(pairs)],
+               keys=('book_id', 'other_book_id'), increment=('count',))
+
+    @classmethod
+    def rebuild(cls):
+        """Recount every pair from order history in one statement"""
+        db.session.execute(cls.__table__.delete())
+        # INSERT comes first so SQLite's driver reports the row count
+        result = db.session.execute(text("""
+            INSERT INTO book_copurchases (book_id, other_book_id, count)
+            WITH purchases AS (
+                SELECT DISTINCT o.user_id, oi.book_id
+                FROM orders o
+                JOIN order_items oi ON oi.order_id = o.id
+                WHERE oi.book_id IS NOT NULL
+            )
+            SELECT a.book_id, b.book_id, COUNT(*)
+            FROM purchases a
+            JOIN purchases b ON a.user_id = b.user_id AND a.book_id != b.book_id
+            GROUP BY a.book_id, b.book_id
+        """))
+        return result.rowcount
+
+class BookTrigram(db.Model):
+    """Posting list of title/author trigrams for fuzzy search where pg_trgm is unavailable"""
+    __tablename__ = 'book_trigrams'
+    trigram = db.Column(db.String(3), primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True, index=True)
 
 class Review(db.Model):
     __tablename__ = 'reviews'
@@ -308,7 +450,8 @@ class Order(db.Model):
     status = db.Column(db.String(20), default='pending')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
-    payment_intent_id = db.Column(db.String(255))
+    # Unique so a payment can only ever finalize one order
+    payment_intent_id = db.Column(db.String(255), unique=True, index=True)
     payment_status = db.Column(db.String(50), default='pending')
     payment_method = db.Column(db.String(50))
     payment_date = db.Column(db.DateTime)
@@ -317,6 +460,17 @@ class Order(db.Model):
     shipping_date = db.Column(db.DateTime)
     shipping_address = db.Column(db.Text)
 
+class StockReservation(db.Model):
+    """Copies of a book held for a user's checkout until expires_at"""
+    __tablename__ = 'stock_reservations'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    payment_intent_id = db.Column(db.String(255), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
     id = db.Column(db.Integer, primary_key=True)
@@ -333,6 +487,11 @@ class CartItem(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # One line per book, which bulk cart upserts conflict on
+    __table_args__ = (
+        db.Index('uq_cart_items_user_book', 'user_id', 'book_id', unique=True),
+    )
+
     @property
     def total(self):
         """Calculate total price for cart item"""
@@ -361,4 +520,32 @@ class ReadingListItem(db.Model):
     reading_list_id = db.Column(db.Integer, db.ForeignKey('reading_lists.id', ondelete='CASCADE'), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), nullable=False)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
-    notes = db.Column(db.Text)
\ No newline at end of file
+    notes = db.Column(db.Text)
+
+@event.listens_for(Session, 'after_flush')
+def update_book_ratings(session, flush_context):
+    """Fold reviews added, deleted (including by a user's cascade) or re-rated into their books' aggregates"""
+    deleted_books = {book.id for book in session.deleted if isinstance(book, Book)}
+    deltas = {}
+
+    def add(review, count, rating):
+        if review.book_id is not None and review.book_id not in deleted_books:
+            current = deltas.get(review.book_id, (0, 0))
+            deltas[review.book_id] = (current[0] + count, current[1] + rating)
+
+    for review in session.new:
+        if isinstance(review, Review):
+            add(review, 1, review.rating)
+    for review in session.deleted:
+        if isinstance(review, Review):
+            add(review, -1, -review.rating)
+    for review in session.dirty:
+        if isinstance(review, Review):
+            history = inspect(review).attrs.rating.history
+            if history.deleted:
+                add(review, 0, review.rating - history.deleted[0])
+
+    deltas = {book_id: delta for book_id, delta in deltas.items() if delta != (0, 0)}
+    Book.apply_rating_deltas(session.connection(), deltas)
+    for book_id in deltas:
+        record_change(session, 'Book', book_id, attrs=('rating_count', 'rating_sum', 'rating_avg'))
@@ -0,0 +1,23 @@
+from app import app, db
+from models import BookCoPurchase
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def rebuild_copurchases():
+    """Recompute the frequently-bought-together table from all past orders"""
+    with app.app_context():
+        try:
+            db.create_all()
+            count = BookCoPurchase.rebuild()
+            db.session.commit()
+            logger.info(f"Rebuilt {count} co-purchase pairs")
+
+        except Exception as e:
+            logger.error(f"Error rebuilding co-purchases: {str(e)}")
+            db.session.rollback()
+            raise e
+
+if __name__ == "__main__":
+    rebuild_copurchases()
@@ -0,0 +1,23 @@
+from app import app, db
+from utils.preferences import PreferenceProfile
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def rebuild_preferences():
+    """Recompute every user's stored preference profile from their reviews, orders and reading lists"""
+    with app.app_context():
+        try:
+            db.create_all()
+            count = PreferenceProfile.rebuild()
+            db.session.commit()
+            logger.info(f"Rebuilt preference profiles for {count} users")
+
+        except Exception as e:
+            logger.error(f"Error rebuilding preference profiles: {str(e)}")
+            db.session.rollback()
+            raise e
+
+if __name__ == "__main__":
+    rebuild_preferences()
@@ -196,7 +196,9 @@ def seed_books():
             existing_isbns = {book.isbn for book in Book.query.all()}
             for book_data in books:
                 if book_data['isbn'] not in existing_isbns:
+                    tags = book_data.pop('tags', '')
                     book = Book(**book_data)
+                    book.set_tags(tags)
                     
                     # Add formats for each book
                     formats = [
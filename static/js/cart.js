@@ -6,43 +6,204 @@ document.addEventListener('DOMContentLoaded', function() {
         console.error('CSRF token not found');
     }
 
-    // Update cart count
-    function updateCartCount() {
-        fetch('/cart/count', {
+    // Update the navbar badge; the server renders the initial count into the page
+    // and every cart mutation returns the new one, so there is nothing to poll
+    function setCartCount(count) {
+        const cartCount = document.getElementById('cart-count');
+        if (cartCount && typeof count === 'number') {
+            cartCount.textContent = count;
+            cartCount.style.display = count > 0 ? 'inline' : 'none';
+        }
+    }
+
+    const isAuthenticated = document.body.dataset.authenticated === 'true';
+
+    // Guest cart: {bookId: {quantity, title, author, price, stock, imageUrl}} in localStorage.
+    // It never touches the server until the login or register form posts it for merging.
+    const GUEST_CART_KEY = 'guestCart';
+    // Matches CartService.MAX_BATCH_ITEMS
+    const GUEST_CART_MAX_ITEMS = 100;
+    const guestCart = {
+        load() {
+            try {
+                return JSON.parse(localStorage.getItem(GUEST_CART_KEY)) || {};
+            } catch (error) {
+                return {};
+            }
+        },
+        save(items) {
+            try {
+                if (Object.keys(items).length) {
+                    localStorage.setItem(GUEST_CART_KEY, JSON.stringify(items));
+                } else {
+                    localStorage.removeItem(GUEST_CART_KEY);
+                }
+            } catch (error) {
+                console.error('Error saving guest cart:', error.message);
+            }
+            setCartCount(this.count(items));
+        },
+        count(items) {
+            return Object.values(items).reduce((sum, item) => sum + item.quantity, 0);
+        },
+        clear() {
+            try {
+                localStorage.removeItem(GUEST_CART_KEY);
+            } catch (error) {
+                // Storage unavailable, so there is nothing to clear
+            }
+        }
+    };
+
+    function addToGuestCart(data) {
+        const items = guestCart.load();
+        const stock = parseInt(data.stock);
+        const item = items[data.bookId] || { quantity: 0 };
+        if (!items[data.bookId] && Object.keys(items).length >= GUEST_CART_MAX_ITEMS) {
+            showToast('Error', 'Your cart is full', 'danger');
+            return;
+        }
+        if (item.quantity >= stock) {
+            showToast('Error', 'Not enough stock available', 'danger');
+            return;
+        }
+        // Refresh the book details on every add so the guest cart page stays current
+        Object.assign(item, {
+            quantity: item.quantity + 1,
+            title: data.title,
+            author: data.author,
+            price: parseFloat(data.price),
+            stock: stock,
+            imageUrl: data.imageUrl
+        });
+        items[data.bookId] = item;
+        guestCart.save(items);
+        showToast('Success', 'Book added to cart!', 'success');
+    }
+
+    // Render the guest cart page from localStorage
+    function renderGuestCart() {
+        const container = document.getElementById('guest-cart');
+        if (!container) return;
+
+        const items = guestCart.load();
+        const body = document.getElementById('guest-cart-body');
+        body.replaceChildren();
+        let total = 0;
+        Object.entries(items).forEach(([bookId, item]) => {
+            total += item.price * item.quantity;
+            const row = document.createElement('tr');
+            row.innerHTML = `
+                <td>
+                    <div class="d-flex align-items-center">
+                        <img class="img-thumbnail me-3" style="width: 60px;">
+                        <div>
+                            <h6 class="mb-0"></h6>
+                            <small class="text-muted"></small>
+                        </div>
+                    </div>
+                </td>
+                <td class="guest-cart-price"></td>
+                <td>
+                    <input type="number" class="form-control guest-cart-quantity" style="width: 80px" min="1">
+                </td>
+                <td class="guest-cart-line-total"></td>
+                <td>
+                    <button class="btn btn-danger btn-sm guest-cart-remove">
+                        <i class="bi bi-trash"></i>
+                    </button>
+                </td>
+            `;
+            // Book details come from page data attributes, so set them as text rather than markup
+            const image = row.querySelector('img');
+            image.src = item.imageUrl || '';
+            image.alt = item.title;
+            row.querySelector('h6').textContent = item.title;
+            row.querySelector('small').textContent = `by ${item.author}`;
+            row.querySelector('.guest-cart-price').textContent = `$${item.price.toFixed(2)}`;
+            row.querySelector('.guest-cart-line-total').textContent = `$${(item.price * item.quantity).toFixed(2)}`;
+            const input = row.querySelector('.guest-cart-quantity');
+            input.value = item.quantity;
+            input.max = item.stock;
+            input.dataset.bookId = bookId;
+            row.querySelector('.guest-cart-remove').dataset.bookId = bookId;
+            body.appendChild(row);
+        });
+
+        document.getElementById('guest-cart-total').textContent = `$${total.toFixed(2)}`;
+        const empty = Object.keys(items).length === 0;
+        container.querySelector('.guest-cart-items').style.display = empty ? 'none' : '';
+        container.querySelector('.guest-cart-empty').style.display = empty ? '' : 'none';
+    }
+
+    const guestCartContainer = document.getElementById('guest-cart');
+    if (guestCartContainer) {
+        guestCartContainer.addEventListener('change', function(event) {
+            if (!event.target.matches('.guest-cart-quantity')) return;
+            const items = guestCart.load();
+            const item = items[event.target.dataset.bookId];
+            if (!item) return;
+            const newQuantity = parseInt(event.target.value);
+            if (isNaN(newQuantity) || newQuantity < 0) {
+                showToast('Error', 'Invalid quantity', 'danger');
+            } else if (newQuantity > item.stock) {
+                showToast('Error', 'Not enough stock available', 'danger');
+            } else if (newQuantity === 0) {
+                delete items[event.target.dataset.bookId];
+            } else {
+                item.quantity = newQuantity;
+            }
+            guestCart.save(items);
+            renderGuestCart();
+        });
+        guestCartContainer.addEventListener('click', function(event) {
+            const button = event.target.closest('.guest-cart-remove');
+            if (!button) return;
+            const items = guestCart.load();
+            delete items[button.dataset.bookId];
+            guestCart.save(items);
+            renderGuestCart();
+        });
+    }
+
+    // Pages restored from the back/forward cache show the badge from when they were left,
+    // while the cart may have changed since; refresh it without reloading the page
+    window.addEventListener('pageshow', function(event) {
+        if (!event.persisted) return;
+        if (!isAuthenticated) {
+            setCartCount(guestCart.count(guestCart.load()));
+            return;
+        }
+        fetch('/api/session-state', {
             headers: {
                 'X-Requested-With': 'XMLHttpRequest',
-                'Accept': 'application/json',
-                'X-CSRF-Token': csrfToken || ''
-            },
-            credentials: 'same-origin'
-        })
-        .then(response => {
-            if (response.status === 401) {
-                // Don't redirect on cart count - just show 0
-                return { success: true, count: 0 };
-            }
-            if (!response.ok) {
-                return response.json().then(data => {
-                    throw new Error(data.error || `HTTP error! status: ${response.status}`);
-                });
+                'Accept': 'application/json'
             }
-            return response.json();
         })
+        .then(response => response.json())
         .then(data => {
             if (data.success) {
-                const cartCount = document.getElementById('cart-count');
-                if (cartCount) {
-                    cartCount.textContent = data.count;
-                    cartCount.style.display = data.count > 0 ? 'inline' : 'none';
-                }
-            } else {
-                throw new Error(data.error || 'Failed to update cart count');
+                setCartCount(data.cart_count);
             }
         })
-        .catch(error => {
-            console.error('Error fetching cart count:', error.message);
-            // Don't update badge on error
-        });
+        .catch(error => console.error('Error refreshing session state:', error.message));
+    });
+
+    if (isAuthenticated) {
+        // Only once the server confirms the login or register form merged it into the account;
+        // otherwise the guest cart stays in this browser rather than being silently dropped
+        if (document.body.dataset.guestCartMerged === 'true') {
+            guestCart.clear();
+        }
+    } else {
+        const items = guestCart.load();
+        setCartCount(guestCart.count(items));
+        renderGuestCart();
+        const guestCartField = document.getElementById('guest-cart-field');
+        if (guestCartField) {
+            guestCartField.value = JSON.stringify(Object.entries(items).map(
+                ([bookId, item]) => ({ book_id: parseInt(bookId), quantity: item.quantity })));
+        }
     }
 
     // Handle authentication redirects
@@ -64,6 +225,10 @@ document.addEventListener('DOMContentLoaded', function() {
     document.querySelectorAll('.add-to-cart').forEach(button => {
         button.addEventListener('click', function(event) {
             event.preventDefault();
+            if (!isAuthenticated) {
+                addToGuestCart(this.dataset);
+                return;
+            }
             const bookId = this.dataset.bookId;
             
             this.disabled = true;
@@ -93,7 +258,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (!data) return;
                 
                 if (data.success) {
-                    updateCartCount();
+                    setCartCount(data.count);
                     showToast('Success', 'Book added to cart!', 'success');
                 } else {
                     throw new Error(data.error || 'Failed to add book to cart');
@@ -109,9 +274,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Initialize cart count on page load
-    updateCartCount();
-
     // Cart quantity update functionality
     document.querySelectorAll('.cart-quantity').forEach(input => {
         let previousValue = input.value;
@@ -151,7 +313,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (!data) return;
                 
                 if (data.success) {
-                    updateCartCount();
+                    setCartCount(data.count);
                     if (newQuantity === 0) {
                         window.location.reload();
                     } else {
@@ -203,7 +365,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (!data) return;
                 
                 if (data.success) {
-                    updateCartCount();
+                    setCartCount(data.count);
                     const row = this.closest('tr');
                     if (row) {
                         row.remove();
@@ -0,0 +1,22 @@
+from app import app, db
+from utils.reservations import StockReservations
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def sweep_reservations():
+    """Hand the stock held by expired checkout reservations back; run periodically, e.g. from cron"""
+    with app.app_context():
+        try:
+            released = StockReservations.release_expired()
+            db.session.commit()
+            logger.info(f"Released {released} reserved copies from expired checkouts")
+
+        except Exception as e:
+            logger.error(f"Error sweeping stock reservations: {str(e)}")
+            db.session.rollback()
+            raise e
+
+if __name__ == "__main__":
+    sweep_reservations()
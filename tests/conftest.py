@@ -0,0 +1,114 @@
+import os
+import sys
+import tempfile
+import pytest
+from sqlalchemy import event, text
+from werkzeug.security import generate_password_hash
+
+# The app reads its database URL at import time. CI points DATABASE_URL at a disposable
+# Postgres database; anywhere else the suite runs against a throwaway SQLite file.
+# Every test drops all tables, so never point it at a database you want to keep.
+if not os.environ.get('DATABASE_URL'):
+    _database = os.path.join(tempfile.mkdtemp(), 'test.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{_database}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app
+from extensions import db
+
+with flask_app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        # Enforce foreign keys like Postgres does, so cascades and FK violations behave the same
+        @event.listens_for(db.engine, 'connect')
+        def enable_foreign_keys(dbapi_connection, connection_record):
+            dbapi_connection.execute('PRAGMA foreign_keys=ON')
+        # create_app may already have pooled a connection without it
+        db.engine.dispose()
+
+def reset_caches():
+    """Forget every process-local cache, which would otherwise outlive the tables they describe"""
+    from utils.facets import FacetEngine
+    from utils.factorization import CollaborativeModel
+    from utils.pagination import count_cache
+    from utils.recommender import BookFeatures
+    from utils.reference_cache import ReferenceCache
+    from utils.response_cache import ResponseCache
+    from utils.search_index import SearchIndex
+    from utils.similar_users import SimilarUsers
+    from utils.suggest_index import SuggestIndex
+
+    FacetEngine._cache.clear()
+    count_cache.clear()
+    ReferenceCache.clear()
+    ResponseCache.clear()
+    BookFeatures.invalidate()
+    CollaborativeModel._model, CollaborativeModel._checked_at, CollaborativeModel._mtime = None, 0, None
+    SearchIndex._available, SearchIndex._checked_at = None, 0
+    SimilarUsers._loaded_at = None
+    SimilarUsers._stale.clear()
+    SuggestIndex._loaded_at = None
+    SuggestIndex._stale.clear()
+
+@pytest.fixture
+def app(tmp_path):
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, SESSION_COOKIE_SECURE=False)
+    # Trained models and indexes are written under the instance folder
+    flask_app.instance_path = str(tmp_path)
+    with flask_app.app_context():
+        db.create_all()
+    reset_caches()
+    # Requests get their own app context, and with it a fresh session and no cached current_user
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+        # The SQLite full-text table is created outside the models (the Postgres column goes with books)
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.begin() as conn:
+                conn.execute(text('DROP TABLE IF EXISTS books_fts'))
+    reset_caches()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def login(client, email, password='pw123456'):
+    return client.post('/login', data={'email': email, 'password': password})
+
+def add_users(count):
+    """Ids of count new customers, reader0@example.com and up, all with password pw123456"""
+    from models import User
+
+    users = [User(username=f'reader{i}', email=f'reader{i}@example.com',
+                  password_hash=generate_password_hash('pw123456')) for i in range(count)]
+    db.session.add_all(users)
+    db.session.commit()
+    return [user.id for user in users]
+
+# (title, author, price, category, tags, description)
+CATALOG = [
+    ('Clean Code', 'Robert C. Martin', 30.0, 'Programming', 'craftsmanship,clean code',
+     'A handbook of agile software craftsmanship'),
+    ('Refactoring', 'Martin Fowler', 45.0, 'Programming', 'refactoring,design',
+     'Improving the design of existing code'),
+    ('The Road', 'Cormac McCarthy', 12.0, 'Fiction', 'post-apocalyptic,novel',
+     'A father and son walk alone through burned America'),
+    ('Blood Meridian', 'Cormac McCarthy', 14.0, 'Fiction', 'western,novel',
+     'An epic novel of violence in the American west'),
+    ('Deep Learning', 'Ian Goodfellow', 70.0, 'AI', 'neural networks,machine learning',
+     'An introduction to deep learning'),
+    ('Artificial Intelligence', 'Stuart Russell', 90.0, 'AI', 'machine learning,search',
+     'The leading textbook in artificial intelligence'),
+]
+
+def add_catalog(stock=5):
+    """Ids of the CATALOG books, in order, with their categories; the first two are featured"""
+    from models import Book, Category
+
+    db.session.add_all([Category(name=name) for name in ('Programming', 'Fiction', 'AI')])
+    books = [Book(title=title, author=author, price=price, category=category, tags=tags,
+                  description=description, stock=stock, language='English', is_featured=i < 2)
+             for i, (title, author, price, category, tags, description) in enumerate(CATALOG)]
+    db.session.add_all(books)
+    db.session.commit()
+    return [book.id for book in books]
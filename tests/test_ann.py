@@ -0,0 +1,42 @@
+import os
+import numpy as np
+from utils.ann import RandomProjectionIndex
+from utils.factorization import CollaborativeModel
+from test_factorization import add_orders
+from conftest import add_users, add_catalog
+
+def test_query_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(3)
+    vectors = rng.standard_normal((2000, 16)).astype(np.float32)
+    ids = np.arange(100, 2100)
+    index = RandomProjectionIndex.build(ids, vectors)
+
+    query = vectors[7] + 0.05 * rng.standard_normal(16).astype(np.float32)
+    found, scores = index.query(query, k=5)
+    assert found[0] == 107
+    assert np.all(np.diff(scores) <= 0)
+    assert 107 not in index.query(query, k=5, exclude=107)[0]
+    # Fewer candidates than k falls back to scanning every vector
+    assert len(index.query(query, k=1500)[0]) == 1500
+
+    path = str(tmp_path / 'index')
+    index.save(path)
+    loaded = RandomProjectionIndex.load(path)
+    assert isinstance(loaded.vectors, np.memmap)
+    assert np.array_equal(loaded.query(query, k=5)[0], found)
+    assert RandomProjectionIndex.load(str(tmp_path / 'missing')) is None
+
+def test_training_keeps_the_current_and_previous_index(app):
+    with app.app_context():
+        user_ids = add_users(2)
+        book_ids = add_catalog()
+        add_orders({user_ids[0]: book_ids[:2], user_ids[1]: book_ids[1:3]})
+
+        versions = [str(CollaborativeModel.train(factors=4, iterations=1)['index_version']) for _ in range(3)]
+        kept = sorted(name for name in os.listdir(app.instance_path)
+                      if name.startswith(CollaborativeModel.INDEX_DIR + '.'))
+        assert kept == [CollaborativeModel.INDEX_DIR + '.' + version for version in versions[1:]]
+
+        model = CollaborativeModel.current()
+        assert np.array_equal(model['index'].ids, model['book_ids'])
+        assert model['book_factors'] is model['index'].vectors
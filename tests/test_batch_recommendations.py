@@ -0,0 +1,45 @@
+from extensions import db
+from models import Review, User, UserRecommendation
+from batch_recommendations import changed_user_ids, drop_orphaned_recommendations, recommend_shard
+from conftest import add_users, add_catalog
+from test_preferences import add_activity
+
+def stored(user_id):
+    return [row.book_id for row in UserRecommendation.query.filter_by(user_id=user_id)
+            .order_by(UserRecommendation.rank)]
+
+def test_only_changed_users_are_recomputed(app):
+    with app.app_context():
+        reader, idle = add_users(2)
+        book_ids = add_catalog()
+        add_activity(reader, book_ids[:2])
+        assert changed_user_ids() == [reader]
+
+        assert recommend_shard([reader]) == 1
+        db.session.expire_all()
+        recommended = stored(reader)
+        assert recommended and not set(recommended) & set(book_ids[:2])
+        assert changed_user_ids() == []
+        assert changed_user_ids(recompute_all=True) == [reader]
+        user = db.session.get(User, reader)
+        assert [book.id for book in user.get_stored_recommendations(len(recommended))] == recommended
+        # Too few stored rows leaves the request to live scoring
+        assert user.get_stored_recommendations(len(recommended) + 1) == []
+
+        db.session.add(Review(user_id=reader, book_id=book_ids[2], rating=4, comment='Bleak'))
+        db.session.commit()
+        assert changed_user_ids() == [reader]
+
+def test_recommendations_of_users_without_a_profile_are_dropped(app):
+    with app.app_context():
+        reader, idle = add_users(2)
+        book_ids = add_catalog()
+        add_activity(reader, book_ids[:2])
+        recommend_shard([reader])
+        db.session.add(UserRecommendation(user_id=idle, rank=0, book_id=book_ids[3]))
+        db.session.commit()
+
+        assert drop_orphaned_recommendations() == 1
+        db.session.commit()
+        assert stored(idle) == []
+        assert stored(reader)
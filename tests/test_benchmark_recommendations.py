@@ -0,0 +1,41 @@
+import logging
+from sqlalchemy import func
+from extensions import db
+from models import Book, Order, OrderItem, ReadingList, ReadingListItem, Review, User
+from benchmark_recommendations import generate, build_indexes, measure, evaluate
+
+def history(user_id):
+    reviewed = {book_id for (book_id,) in db.session.query(Review.book_id).filter_by(user_id=user_id)}
+    bought = {book_id for (book_id,) in db.session.query(OrderItem.book_id).join(Order)
+              .filter(Order.user_id == user_id)}
+    listed = {book_id for (book_id,) in db.session.query(ReadingListItem.book_id).join(ReadingList)
+              .filter(ReadingList.user_id == user_id)}
+    return reviewed | bought | listed
+
+def test_synthetic_history_holds_out_unseen_positives(app):
+    with app.app_context():
+        held_out = generate(db, users=40, books=80, interactions=800, holdout=0.2, seed=7)
+
+        assert User.query.count() == 40 and Book.query.count() == 80
+        assert held_out
+        for user_id, book_ids in held_out.items():
+            assert book_ids and not book_ids & history(user_id)
+        book = db.session.query(Book).filter(Book.rating_count > 0).first()
+        assert book.rating_sum == db.session.query(func.sum(Review.rating)).filter_by(book_id=book.id).scalar()
+        assert book.rating_avg == book.rating_sum / book.rating_count
+
+def test_benchmark_reports_latency_and_quality(app, caplog):
+    caplog.set_level(logging.INFO, logger='benchmark_recommendations')
+    with app.app_context():
+        held_out = generate(db, users=40, books=80, interactions=800, holdout=0.2, seed=7)
+        build_indexes(db, train_als=True)
+        user_ids = sorted(held_out)[:5]
+
+        measure(db, 'User.get_recommended_books',
+                lambda user_id: db.session.get(User, user_id).get_recommended_books(limit=5), user_ids)
+        evaluate(db, held_out, 5, user_ids, 80)
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith('User.get_recommended_books') and 'queries/call' in message
+               for message in messages)
+    assert any(message.startswith('precision@5') and 'over 5 held-out users' in message for message in messages)
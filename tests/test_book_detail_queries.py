@@ -0,0 +1,56 @@
+from extensions import db
+from models import Book, BookFormat, BookSeries, Category, Review
+from utils.query_budget import QueryCounter
+from utils.response_cache import ResponseCache
+from views.main import DETAIL_QUERY_BUDGET
+from conftest import login, add_users
+
+def add_book(reviewer_ids):
+    """A book in a series with formats and one review per reviewer"""
+    db.session.add(Category(name='Fiction'))
+    series = BookSeries(title='Trilogy')
+    book = Book(title='The Road', author='Cormac McCarthy', price=12.0, category='Fiction',
+                tags='novel,western', description='A father and son walk through burned America',
+                stock=5, language='English', series=series, series_order=1)
+    db.session.add_all([series, book])
+    db.session.flush()
+    db.session.add_all([BookFormat(book_id=book.id, format_type=format_type, price=12.0, stock=5)
+                        for format_type in ('hardcover', 'paperback', 'ebook')])
+    db.session.add(Book(title='Blood Meridian', author='Cormac McCarthy', price=14.0, category='Fiction',
+                        tags='novel,western', description='Violence in the American west', stock=5,
+                        language='English', series=series, series_order=2))
+    book_id = book.id
+    for user_id in reviewer_ids:
+        db.session.add(Review(user_id=user_id, book_id=book_id, rating=4, comment='A bleak, beautiful novel'))
+    db.session.commit()
+    return book_id
+
+def render(client, book_id):
+    ResponseCache.clear()
+    with QueryCounter() as counter:
+        response = client.get(f'/book/{book_id}')
+    assert response.status_code == 200
+    return counter.count
+
+def test_book_detail_stays_within_query_budget(app, client):
+    with app.app_context():
+        book_id = add_book(add_users(6))
+    # Under app.testing, query_budget raises if the view goes over DETAIL_QUERY_BUDGET
+    render(client, book_id)
+    login(client, 'reader0@example.com')
+    assert render(client, book_id) <= DETAIL_QUERY_BUDGET + 2  # plus the user loader and session
+
+def test_book_detail_queries_do_not_grow_with_reviews(app, client):
+    with app.app_context():
+        users = add_users(12)
+        book_id = add_book(users[:2])
+    login(client, 'reader0@example.com')
+    # The first render also fills process and session caches (series books, cart count)
+    render(client, book_id)
+    few = render(client, book_id)
+
+    with app.app_context():
+        for user_id in users[2:]:
+            db.session.add(Review(user_id=user_id, book_id=book_id, rating=5, comment='Unforgettable and harrowing'))
+        db.session.commit()
+    assert render(client, book_id) == few
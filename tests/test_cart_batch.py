@@ -0,0 +1,40 @@
+from models import CartItem
+from conftest import login, add_users, add_catalog
+
+def cart(user_id):
+    return {item.book_id: item.quantity for item in CartItem.query.filter_by(user_id=user_id)}
+
+def batch(client, items, mode='add'):
+    return client.post('/cart/batch', json={'items': items, 'mode': mode})
+
+def test_batch_adds_and_sets_quantities(client, app):
+    with app.app_context():
+        user_id, = add_users(1)
+        book_ids = add_catalog(stock=5)
+    login(client, 'reader0@example.com')
+
+    # Clean Code 30.0, Refactoring 45.0; repeated books are summed when adding
+    response = batch(client, [{'book_id': book_ids[0], 'quantity': 2}, {'book_id': book_ids[1]},
+                              {'book_id': book_ids[0]}])
+    assert response.json == {'success': True, 'count': 4, 'total': 135.0}
+    response = batch(client, [{'book_id': book_ids[0], 'quantity': 1}, {'book_id': book_ids[1], 'quantity': 0}],
+                     mode='set')
+    assert response.json == {'success': True, 'count': 1, 'total': 30.0}
+    with app.app_context():
+        assert cart(user_id) == {book_ids[0]: 1}
+
+def test_batch_rejects_the_whole_request(client, app):
+    with app.app_context():
+        user_id, = add_users(1)
+        book_ids = add_catalog(stock=2)
+    login(client, 'reader0@example.com')
+
+    response = batch(client, [{'book_id': book_ids[0]}, {'book_id': book_ids[-1] + 1}])
+    assert response.status_code == 404
+    assert response.json['book_ids'] == [book_ids[-1] + 1]
+    response = batch(client, [{'book_id': book_ids[0]}, {'book_id': book_ids[1], 'quantity': 3}])
+    assert response.json == {'success': False, 'error': 'Not enough stock available', 'book_ids': [book_ids[1]]}
+    assert batch(client, [{'book_id': book_ids[0], 'quantity': 0}]).status_code == 400
+    assert batch(client, [{'book_id': book_ids[0]}], mode='replace').status_code == 400
+    with app.app_context():
+        assert cart(user_id) == {}
@@ -0,0 +1,43 @@
+from extensions import db
+from models import CartItem
+from utils.cart_service import CartService
+from conftest import login, add_users, add_catalog
+
+def add_lines(user_id, quantities):
+    """Cart line ids for {book_id: quantity}, in the given order"""
+    items = [CartItem(user_id=user_id, book_id=book_id, quantity=quantity)
+             for book_id, quantity in quantities.items()]
+    db.session.add_all(items)
+    db.session.commit()
+    return [item.id for item in items]
+
+def test_summary_and_set_quantity(app):
+    with app.app_context():
+        user_id, other_id = add_users(2)
+        book_ids = add_catalog(stock=5)
+        # Clean Code 30.0, Refactoring 45.0
+        line_ids = add_lines(user_id, {book_ids[0]: 2, book_ids[1]: 1})
+        add_lines(other_id, {book_ids[0]: 4})
+        assert CartService.summary(user_id) == (3, 105.0)
+
+        assert CartService.set_quantity(user_id, line_ids[0], 3) == (book_ids[0], 4, 135.0)
+        assert CartService.set_quantity(user_id, line_ids[0], 6) == (None, None, None)
+        assert CartService.set_quantity(other_id, line_ids[1], 2) == (None, None, None)
+        assert CartService.set_quantity(user_id, line_ids[1], 0) == (book_ids[1], 3, 90.0)
+        db.session.commit()
+        assert CartService.summary(user_id) == (3, 90.0)
+        assert CartService.summary(other_id) == (4, 120.0)
+
+def test_update_cart_route(client, app):
+    with app.app_context():
+        user_id, = add_users(1)
+        book_ids = add_catalog(stock=5)
+        line_id, = add_lines(user_id, {book_ids[2]: 1})
+    login(client, 'reader0@example.com')
+
+    response = client.post(f'/cart/update/{line_id}', json={'quantity': 2})
+    assert response.json == {'success': True, 'count': 2, 'total': 24.0}
+    response = client.post(f'/cart/update/{line_id}', json={'quantity': 9})
+    assert response.json['success'] is False
+    with app.app_context():
+        assert db.session.get(CartItem, line_id).quantity == 2
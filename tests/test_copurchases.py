@@ -0,0 +1,38 @@
+from extensions import db
+from models import Book, BookCoPurchase, CartItem
+from utils.cart_service import CartService
+from conftest import add_users, add_catalog
+
+def buy(user_id, book_ids, payment_intent_id):
+    db.session.add_all([CartItem(user_id=user_id, book_id=book_id, quantity=1) for book_id in book_ids])
+    db.session.commit()
+    assert CartService.place_order(user_id, payment_intent_id, CartService.items(user_id)) is not None
+    db.session.commit()
+
+def pairs():
+    return {(row.book_id, row.other_book_id): row.count for row in BookCoPurchase.query}
+
+def bought_with(book_id):
+    return [book.title for book in db.session.get(Book, book_id).get_frequently_bought_together()]
+
+def test_orders_count_each_pair_once_per_customer(app):
+    with app.app_context():
+        first, second = add_users(2)
+        clean_code, refactoring, the_road = add_catalog()[:3]
+
+        buy(first, [clean_code, refactoring], 'pi_1')
+        # Buying a title again adds no new pairs; a new title pairs with the whole history
+        buy(first, [clean_code, the_road], 'pi_2')
+        buy(second, [clean_code, refactoring], 'pi_3')
+        counted = pairs()
+        assert counted == {(clean_code, refactoring): 2, (refactoring, clean_code): 2,
+                           (clean_code, the_road): 1, (the_road, clean_code): 1,
+                           (refactoring, the_road): 1, (the_road, refactoring): 1}
+        assert bought_with(clean_code) == ['Refactoring', 'The Road']
+
+        # The offline rebuild recounts the same pairs from order history
+        BookCoPurchase.query.delete()
+        db.session.commit()
+        assert BookCoPurchase.rebuild() == 6
+        db.session.commit()
+        assert pairs() == counted
@@ -0,0 +1,34 @@
+from extensions import db
+from models import Book
+from utils.facets import FacetEngine
+from conftest import add_catalog
+
+NOTHING_SELECTED = (None, None, None)
+
+def test_facet_counts(client, app):
+    with app.app_context():
+        add_catalog()
+        facets = FacetEngine.compute(Book.query, ('', ''))
+        assert facets.categories(NOTHING_SELECTED) == {'Programming': 2, 'Fiction': 2, 'AI': 2}
+        assert facets.price_ranges(NOTHING_SELECTED)['10-25'] == 2
+        # Each facet ignores its own selection but applies the others
+        assert facets.categories(('Fiction', '50-100', None)) == {'AI': 2}
+        assert facets.price_ranges(('Fiction', '50-100', None)) == {'10-25': 2}
+        assert facets.total(('AI', '50-100', 'English')) == 2
+
+    response = client.get('/?category=AI')
+    assert response.status_code == 200
+
+def test_stock_changes_keep_cached_facets(app):
+    with app.app_context():
+        book_ids = add_catalog()
+        facets = FacetEngine.compute(Book.query, ('', ''))
+
+        book = db.session.get(Book, book_ids[0])
+        book.stock, book.reserved = 1, 1
+        db.session.commit()
+        assert FacetEngine.compute(Book.query, ('', '')) is facets
+
+        db.session.get(Book, book_ids[0]).price = 5.0
+        db.session.commit()
+        assert FacetEngine.compute(Book.query, ('', '')).price_ranges(NOTHING_SELECTED)['0-10'] == 1
@@ -0,0 +1,49 @@
+import os
+import numpy as np
+from extensions import db
+from models import Order, OrderItem
+from utils.factorization import CollaborativeModel
+from conftest import add_users, add_catalog
+
+def add_orders(purchases):
+    """One order per {user_id: [book_id, ...]} entry"""
+    for user_id, book_ids in purchases.items():
+        order = Order(user_id=user_id, total=10.0 * len(book_ids), status='processing')
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all([OrderItem(order_id=order.id, book_id=book_id, quantity=1, price=10.0)
+                            for book_id in book_ids])
+    db.session.commit()
+
+def scores(user_id):
+    book_ids, values = CollaborativeModel.user_scores(user_id)
+    return dict(zip(book_ids.tolist(), values.tolist()))
+
+def test_trained_factors_score_books_bought_by_similar_customers(app):
+    with app.app_context():
+        user_ids = add_users(6)
+        book_ids = add_catalog()
+        programmers, novel_readers = user_ids[:3], user_ids[3:]
+        add_orders({user_id: book_ids[:2] for user_id in programmers[1:]})
+        add_orders({user_id: book_ids[2:4] for user_id in novel_readers})
+        add_orders({programmers[0]: book_ids[:1]})
+
+        model = CollaborativeModel.train(factors=4, iterations=10)
+        assert os.path.exists(CollaborativeModel.path())
+        assert model['user_ids'].tolist() == sorted(user_ids)
+
+        predicted = scores(programmers[0])
+        assert predicted[book_ids[1]] > max(predicted[book_ids[2]], predicted[book_ids[3]])
+        assert CollaborativeModel.user_scores(user_ids[-1] + 1) is None
+
+def test_warm_start_reuses_saved_factors(app):
+    with app.app_context():
+        user_ids = add_users(2)
+        book_ids = add_catalog()
+        add_orders({user_ids[0]: book_ids[:2], user_ids[1]: book_ids[1:3]})
+
+        first = CollaborativeModel.train(factors=4, iterations=0)
+        warm = CollaborativeModel.train(factors=4, iterations=0, seed=1)
+        cold = CollaborativeModel.train(factors=4, iterations=0, seed=1, warm_start=False)
+        assert np.array_equal(warm['book_factors'], first['book_factors'])
+        assert not np.array_equal(cold['book_factors'], first['book_factors'])
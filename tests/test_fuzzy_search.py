@@ -0,0 +1,28 @@
+from extensions import db
+from models import Book
+from utils.fuzzy_search import FuzzySearch
+from conftest import add_catalog
+
+def test_misspelled_titles_and_authors_still_match(app):
+    with app.app_context():
+        book_ids = add_catalog()
+        FuzzySearch.ensure_index()
+
+        assert FuzzySearch.search('refactorng')[0][0] == book_ids[1]
+        assert {book_id for book_id, _ in FuzzySearch.search('mccarty')} == {book_ids[2], book_ids[3]}
+        assert FuzzySearch.search('zzzz') == []
+
+        # Renamed books are re-indexed when the rename commits
+        db.session.get(Book, book_ids[0]).title = 'Working Effectively with Legacy Code'
+        db.session.commit()
+        assert FuzzySearch.search('legacy cod')[0][0] == book_ids[0]
+
+def test_catalog_falls_back_to_close_matches(client, app):
+    with app.app_context():
+        add_catalog()
+        FuzzySearch.ensure_index()
+
+    response = client.get('/?search=refactorng')
+    assert response.status_code == 200
+    assert b'(including close matches for "refactorng")' in response.data
+    assert b'<h5 class="card-title">Refactoring</h5>' in response.data
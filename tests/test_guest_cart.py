@@ -0,0 +1,44 @@
+import json
+from extensions import db
+from models import CartItem
+from conftest import add_users, add_catalog
+
+MERGED = b'data-guest-cart-merged="true"'
+
+def log_in_with(client, guest_cart):
+    return client.post('/login', data={'email': 'reader0@example.com', 'password': 'pw123456',
+                                       'guest_cart': guest_cart})
+
+def cart(user_id):
+    return {item.book_id: item.quantity for item in CartItem.query.filter_by(user_id=user_id)}
+
+def test_login_merges_the_guest_cart(client, app):
+    with app.app_context():
+        user_id, = add_users(1)
+        book_ids = add_catalog(stock=3)
+        db.session.add(CartItem(user_id=user_id, book_id=book_ids[0], quantity=2))
+        db.session.commit()
+
+    # Quantities add to the saved cart up to the copies available; unknown books are skipped
+    guest_cart = [{'book_id': book_ids[0], 'quantity': 2}, {'book_id': book_ids[1], 'quantity': 1},
+                  {'book_id': book_ids[-1] + 1, 'quantity': 1}]
+    assert log_in_with(client, json.dumps(guest_cart)).status_code == 302
+    with app.app_context():
+        assert cart(user_id) == {book_ids[0]: 3, book_ids[1]: 1}
+
+    # The next page tells cart.js to clear localStorage, once
+    page = client.get('/')
+    assert MERGED in page.data
+    assert b'<span id="cart-count" class="badge bg-primary">4</span>' in page.data
+    assert MERGED not in client.get('/').data
+
+def test_unreadable_guest_cart_does_not_block_login(client, app):
+    with app.app_context():
+        user_id, = add_users(1)
+        add_catalog()
+
+    response = log_in_with(client, '{not json')
+    assert response.status_code == 302
+    with app.app_context():
+        assert cart(user_id) == {}
+    assert b'reader0' in client.get('/').data
@@ -0,0 +1,38 @@
+import pytest
+from extensions import db
+from models import Book
+from utils.pagination import keyset_paginate, decode_cursor
+from views.main import CATALOG_SORTS
+
+def add_books(count):
+    # Only three distinct prices, so pages must break ties on the id
+    db.session.add_all([Book(title=f'Book {i}', author='Anon', price=float(10 + i % 3), stock=1)
+                        for i in range(count)])
+    db.session.commit()
+
+@pytest.mark.parametrize('sort', ['price_low', 'price_high', 'newest'])
+def test_cursor_pages_cover_every_book_once_in_order(app, sort):
+    with app.app_context():
+        add_books(29)
+        sort_columns = CATALOG_SORTS[sort]
+        expected = [book.id for book in Book.query.order_by(
+            *[column.desc() if descending else column for column, descending in sort_columns])]
+
+        seen, cursor = [], None
+        while True:
+            page = keyset_paginate(Book.query, sort_columns, cursor, per_page=5)
+            seen.extend(book.id for book in page.items)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        assert seen == expected
+
+def test_malformed_cursors(client, app):
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor', CATALOG_SORTS['price_low'])
+    with app.app_context():
+        add_books(15)
+
+    response = client.get('/?sort=price_low&cursor=garbage')
+    assert response.status_code == 200
+    assert b'rel="next"' in response.data
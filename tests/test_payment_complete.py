@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+import pytest
+import stripe
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import CartItem, Order
+from utils.cart_service import CartService
+from conftest import login, add_users, add_catalog
+
+@pytest.fixture
+def retrieved(app, monkeypatch):
+    """Fake PaymentIntent.retrieve returning a succeeded intent; returns the ids retrieved"""
+    calls = []
+
+    def retrieve(intent_id):
+        calls.append(intent_id)
+        return SimpleNamespace(id=intent_id, status='succeeded')
+    monkeypatch.setitem(app.config, 'STRIPE_SECRET_KEY', 'sk_test')
+    monkeypatch.setattr(stripe.PaymentIntent, 'retrieve', retrieve)
+    return calls
+
+def complete(client, intent_id='pi_1'):
+    """The response and the last message flashed while handling it"""
+    response = client.get(f'/cart/payment-complete?payment_intent={intent_id}')
+    with client.session_transaction() as state:
+        flashes = [message for _, message in state.pop('_flashes', [])]
+    return response, flashes[-1:]
+
+def shopper_with_cart(app, users=1):
+    with app.app_context():
+        user_ids = add_users(users)
+        book_id = add_catalog(stock=5)[0]
+        db.session.add(CartItem(user_id=user_ids[0], book_id=book_id, quantity=2))
+        db.session.commit()
+    return user_ids
+
+def test_refreshing_the_return_url_places_one_order(client, app, retrieved):
+    user_id, other_id = shopper_with_cart(app, users=2)
+    login(client, 'reader0@example.com')
+
+    response, flashes = complete(client)
+    assert response.headers['Location'].endswith('/orders')
+    assert flashes == ['Thank you for your purchase! Your order has been placed.']
+    # The second visit finds the order without asking Stripe again
+    response, flashes = complete(client)
+    assert response.headers['Location'].endswith('/orders')
+    assert flashes == ['Your order has already been placed.']
+    assert retrieved == ['pi_1']
+    with app.app_context():
+        assert Order.query.filter_by(payment_intent_id='pi_1').one().user_id == user_id
+
+    client.get('/logout')
+    login(client, 'reader1@example.com')
+    assert complete(client)[1] == ['Invalid payment session.']
+
+def test_concurrent_completion_of_the_same_payment(client, app, retrieved, monkeypatch):
+    user_id, = shopper_with_cart(app)
+    login(client, 'reader0@example.com')
+
+    place_order = CartService.place_order
+
+    def raced(user_id, payment_intent_id, cart_items):
+        # Another request for the same payment commits its order first
+        with db.engine.begin() as conn:
+            conn.execute(insert(Order), {'user_id': user_id, 'total': 60.0, 'status': 'processing',
+                                         'payment_intent_id': payment_intent_id, 'payment_status': 'paid'})
+        return place_order(user_id, payment_intent_id, cart_items)
+    monkeypatch.setattr(CartService, 'place_order', raced)
+
+    response, flashes = complete(client)
+    assert response.headers['Location'].endswith('/orders')
+    assert flashes == ['Your order has already been placed.']
+    with app.app_context():
+        assert Order.query.count() == 1
+        # The losing request rolled back, so the cart and stock are untouched
+        assert CartItem.query.filter_by(user_id=user_id).one().quantity == 2
+
+def test_payment_intent_places_at_most_one_order(app):
+    with app.app_context():
+        user_id, = add_users(1)
+        db.session.add_all([Order(user_id=user_id, total=1.0, payment_intent_id='pi_1') for _ in range(2)])
+        with pytest.raises(IntegrityError):
+            db.session.commit()
@@ -0,0 +1,58 @@
+from extensions import db
+from models import Book, Order, OrderItem, Review, User, UserPreference
+from utils.preferences import PreferenceProfile, REVIEW_WEIGHT, PURCHASE_WEIGHT
+from conftest import add_users, add_catalog
+
+def add_activity(user_id, book_ids):
+    """A positive review of the first book and an order of the second"""
+    db.session.add(Review(user_id=user_id, book_id=book_ids[0], rating=5, comment='Loved it'))
+    order = Order(user_id=user_id, total=45.0, status='processing')
+    db.session.add(order)
+    db.session.flush()
+    db.session.add(OrderItem(order_id=order.id, book_id=book_ids[1], quantity=1, price=45.0))
+    db.session.commit()
+
+def test_reviews_and_orders_update_the_profile(app):
+    with app.app_context():
+        user_id, = add_users(1)
+        book_ids = add_catalog()
+        add_activity(user_id, book_ids)
+
+        profile = PreferenceProfile.load([user_id])[user_id]
+        assert profile[('category', 'Programming')] == REVIEW_WEIGHT + PURCHASE_WEIGHT
+        assert profile[('author', 'Robert C. Martin')] == REVIEW_WEIGHT
+        assert profile[('author', 'Martin Fowler')] == PURCHASE_WEIGHT
+
+        db.session.delete(Review.query.filter_by(user_id=user_id).one())
+        db.session.commit()
+        profile = PreferenceProfile.load([user_id])[user_id]
+        assert ('author', 'Robert C. Martin') not in profile
+        assert profile[('category', 'Programming')] == PURCHASE_WEIGHT
+
+def test_deleting_a_user_with_activity(app):
+    with app.app_context():
+        user_id, other_id = add_users(2)
+        book_ids = add_catalog()
+        add_activity(user_id, book_ids)
+        add_activity(other_id, book_ids)
+
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+
+        assert db.session.get(User, user_id) is None
+        assert Review.query.filter_by(user_id=user_id).count() == 0
+        assert UserPreference.query.filter_by(user_id=user_id).count() == 0
+        assert PreferenceProfile.load([other_id])[other_id][('category', 'Programming')] == \
+            REVIEW_WEIGHT + PURCHASE_WEIGHT
+
+def test_deleting_a_reviewed_book(app):
+    with app.app_context():
+        user_id, = add_users(1)
+        book_ids = add_catalog()
+        add_activity(user_id, book_ids)
+
+        db.session.delete(db.session.get(Book, book_ids[0]))
+        db.session.commit()
+
+        assert db.session.get(Book, book_ids[0]) is None
+        assert PreferenceProfile.load([user_id])[user_id][('author', 'Martin Fowler')] == PURCHASE_WEIGHT
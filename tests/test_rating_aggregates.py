@@ -0,0 +1,40 @@
+from extensions import db
+from models import Book, Review, User
+from conftest import login, add_users, add_catalog
+
+def aggregates(book_id):
+    db.session.expire_all()
+    book = db.session.get(Book, book_id)
+    return book.rating_count, book.rating_sum, book.rating_avg
+
+def test_review_form_updates_aggregates(client, app):
+    with app.app_context():
+        add_users(1)
+        book_id = add_catalog()[0]
+    login(client, 'reader0@example.com')
+    client.post(f'/add_review/{book_id}', data={'rating': 4, 'comment': 'Practical and well argued'})
+    with app.app_context():
+        assert aggregates(book_id) == (1, 4, 4.0)
+
+def test_aggregates_follow_review_inserts_edits_and_deletes(app):
+    with app.app_context():
+        user_ids = add_users(3)
+        book_id = add_catalog()[0]
+        for user_id, rating in zip(user_ids, (3, 4, 5)):
+            db.session.add(Review(user_id=user_id, book_id=book_id, rating=rating, comment='Worth reading'))
+        db.session.commit()
+        assert aggregates(book_id) == (3, 12, 4.0)
+
+        Review.query.filter_by(user_id=user_ids[1]).one().rating = 1
+        db.session.commit()
+        assert aggregates(book_id) == (3, 9, 3.0)
+
+        # Deleting a user cascades to their review through the ORM
+        db.session.delete(db.session.get(User, user_ids[2]))
+        db.session.commit()
+        assert aggregates(book_id) == (2, 4, 2.0)
+
+        for review in Review.query.all():
+            db.session.delete(review)
+        db.session.commit()
+        assert aggregates(book_id) == (0, 0, 0)
@@ -0,0 +1,30 @@
+from extensions import db
+from models import Book, Review, User
+from utils.recommender import BookFeatures
+from conftest import add_users, add_catalog
+
+def test_recommendations_follow_the_preference_profile(app):
+    with app.app_context():
+        user_id, = add_users(1)
+        book_ids = add_catalog()
+        # The Road: Fiction, Cormac McCarthy
+        db.session.add(Review(user_id=user_id, book_id=book_ids[2], rating=5, comment='Devastating'))
+        db.session.commit()
+
+        recommended = db.session.get(User, user_id).get_recommended_books(limit=3)
+        assert recommended[0].id == book_ids[3]
+        assert book_ids[2] not in [book.id for book in recommended]
+
+def test_stock_changes_keep_the_feature_matrix(app):
+    with app.app_context():
+        book_ids = add_catalog()
+        matrix = BookFeatures.current()
+
+        book = db.session.get(Book, book_ids[0])
+        book.stock, book.reserved = 2, 1
+        db.session.commit()
+        assert BookFeatures.current() is matrix
+
+        db.session.get(Book, book_ids[0]).category = 'AI'
+        db.session.commit()
+        assert BookFeatures.current() is not matrix
@@ -0,0 +1,53 @@
+from extensions import db
+from models import Book, BookSeries, Category
+from utils.query_budget import QueryCounter
+from utils.reference_cache import ReferenceCache
+from conftest import add_catalog
+
+def test_categories_and_featured_books_are_cached(app):
+    with app.app_context():
+        book_ids = add_catalog()
+        assert sorted(ReferenceCache.get_categories()) == ['AI', 'Fiction', 'Programming']
+        assert [book['id'] for book in ReferenceCache.get_featured_books()] == book_ids[:2]
+
+        with QueryCounter() as counter:
+            ReferenceCache.get_categories()
+            ReferenceCache.get_featured_books()
+        assert counter.count == 0
+
+def test_commits_invalidate_only_what_they_change(app):
+    with app.app_context():
+        book_ids = add_catalog()
+        featured = ReferenceCache.get_featured_books()
+
+        db.session.get(Book, book_ids[0]).stock = 1
+        db.session.commit()
+        assert ReferenceCache.get_featured_books() is featured
+
+        db.session.get(Book, book_ids[0]).title = 'Clean Code, 2nd Edition'
+        db.session.commit()
+        assert ReferenceCache.get_featured_books()[0]['title'] == 'Clean Code, 2nd Edition'
+
+        db.session.get(Book, book_ids[2]).is_featured = True
+        db.session.add(Category(name='Poetry'))
+        db.session.get(Book, book_ids[3]).category = 'Poetry'
+        db.session.commit()
+        assert [book['id'] for book in ReferenceCache.get_featured_books()] == book_ids[:3]
+        assert 'Poetry' in ReferenceCache.get_categories()
+
+def test_series_books_follow_reading_order(app):
+    with app.app_context():
+        series = BookSeries(title='Border Trilogy')
+        db.session.add(series)
+        db.session.flush()
+        for order, title in ((2, 'The Crossing'), (1, 'All the Pretty Horses')):
+            db.session.add(Book(title=title, author='Cormac McCarthy', price=15.0, stock=1,
+                                series_id=series.id, series_order=order))
+        db.session.commit()
+        assert [book['title'] for book in ReferenceCache.get_series_books(series.id)] == \
+            ['All the Pretty Horses', 'The Crossing']
+
+        db.session.add(Book(title='Cities of the Plain', author='Cormac McCarthy', price=15.0, stock=1,
+                            series_id=series.id, series_order=3))
+        db.session.commit()
+        assert len(ReferenceCache.get_series_books(series.id)) == 3
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+import stripe
+from extensions import db
+from models import Book, CartItem, StockReservation
+from utils.cart_service import CartService
+from utils.reservations import StockReservations
+from conftest import login, add_users, add_catalog
+
+@pytest.fixture
+def stripe_intents(app, monkeypatch):
+    """Fake PaymentIntent.create; returns the list of intents created"""
+    created = []
+
+    def create(**kwargs):
+        created.append(SimpleNamespace(id=f'pi_{len(created) + 1}', client_secret='secret', **kwargs))
+        return created[-1]
+    monkeypatch.setitem(app.config, 'STRIPE_SECRET_KEY', 'sk_test')
+    monkeypatch.setattr(stripe.PaymentIntent, 'create', create)
+    monkeypatch.setattr(stripe.PaymentIntent, 'cancel', lambda intent_id: None)
+    return created
+
+def stock(book_id):
+    db.session.expire_all()
+    book = db.session.get(Book, book_id)
+    return book.stock, book.reserved
+
+def test_holds_never_oversell(app):
+    with app.app_context():
+        first, second = add_users(2)
+        book_id = add_catalog(stock=5)[0]
+
+        assert StockReservations.hold(first, {book_id: 4}) == []
+        db.session.commit()
+        assert StockReservations.hold(second, {book_id: 2}) == [book_id]
+        db.session.rollback()
+        assert stock(book_id) == (5, 4)
+
+        StockReservation.query.update({'expires_at': datetime.utcnow() - timedelta(minutes=1)})
+        assert StockReservations.release_expired() == 4
+        db.session.commit()
+        assert stock(book_id) == (5, 0)
+
+def test_cart_guards_skip_copies_held_by_others(client, app):
+    with app.app_context():
+        shopper, other = add_users(2)
+        book_id = add_catalog(stock=5)[0]
+        StockReservations.hold(other, {book_id: 4})
+        db.session.commit()
+    login(client, 'reader0@example.com')
+
+    assert client.post('/cart/add', json={'book_id': book_id}).json['success'] is True
+    assert client.post('/cart/add', json={'book_id': book_id}).json['success'] is False
+    response = client.post('/cart/batch', json={'items': [{'book_id': book_id, 'quantity': 2}], 'mode': 'set'})
+    assert response.json['book_ids'] == [book_id]
+    with app.app_context():
+        line = CartItem.query.filter_by(user_id=shopper).one()
+        assert CartService.set_quantity(shopper, line.id, 2) == (None, None, None)
+        # The shopper's own holds still count as theirs
+        StockReservations.hold(shopper, {book_id: 1})
+        db.session.commit()
+        assert CartService.set_quantity(shopper, line.id, 1)[0] == book_id
+
+def test_failed_checkout_releases_holds(client, app, monkeypatch, stripe_intents):
+    with app.app_context():
+        user_id, = add_users(1)
+        book_id = add_catalog(stock=5)[0]
+        db.session.add(CartItem(user_id=user_id, book_id=book_id, quantity=2))
+        db.session.commit()
+    login(client, 'reader0@example.com')
+
+    response = client.post('/cart/create-payment-intent', json={})
+    assert response.json['success'] is True
+    with app.app_context():
+        assert stock(book_id) == (5, 2)
+        assert StockReservation.query.one().payment_intent_id == 'pi_1'
+
+    def fail(**kwargs):
+        raise RuntimeError('network down')
+    monkeypatch.setattr(stripe.PaymentIntent, 'create', fail)
+    assert client.post('/cart/create-payment-intent', json={}).status_code == 500
+    with app.app_context():
+        assert stock(book_id) == (5, 0)
+        assert StockReservation.query.count() == 0
+
+def test_order_releases_holds_for_titles_left_out_of_the_cart(app):
+    with app.app_context():
+        user_id, other_id = add_users(2)
+        book_ids = add_catalog(stock=5)
+        StockReservations.hold(user_id, {book_ids[0]: 2, book_ids[1]: 3})
+        StockReservations.attach(user_id, 'pi_1')
+        StockReservations.hold(other_id, {book_ids[1]: 2})
+        # The shopper then dropped one title and lowered the other, and a stock count
+        # corrected the dropped title below the copies other shoppers hold
+        db.session.add(CartItem(user_id=user_id, book_id=book_ids[0], quantity=1))
+        db.session.get(Book, book_ids[1]).stock = 1
+        db.session.commit()
+
+        order = CartService.place_order(user_id, 'pi_1', CartService.items(user_id))
+        db.session.commit()
+        assert order is not None
+        assert stock(book_ids[0]) == (4, 0)
+        assert stock(book_ids[1]) == (1, 2)
+        assert StockReservation.query.filter_by(user_id=user_id).count() == 0
@@ -0,0 +1,34 @@
+from extensions import db
+from models import Book
+from utils.query_budget import QueryCounter
+from conftest import login, add_users, add_catalog
+
+def test_anonymous_pages_revalidate_with_etags(client, app):
+    with app.app_context():
+        book_ids = add_catalog()
+
+    first = client.get(f'/book/{book_ids[0]}')
+    assert first.status_code == 200 and first.headers['ETag']
+    with QueryCounter() as counter:
+        cached = client.get(f'/book/{book_ids[0]}')
+    assert counter.count == 0
+    assert cached.data == first.data
+
+    revalidated = client.get(f'/book/{book_ids[0]}', headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+
+    with app.app_context():
+        db.session.get(Book, book_ids[0]).price = 25.0
+        db.session.commit()
+    changed = client.get(f'/book/{book_ids[0]}', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert b'25.00' in changed.data
+
+def test_logged_in_pages_are_not_cached(client, app):
+    with app.app_context():
+        add_users(1)
+        add_catalog()
+    login(client, 'reader0@example.com')
+    response = client.get('/')
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
@@ -0,0 +1,42 @@
+from app import create_app
+from extensions import db
+from models import Book
+from utils.search_index import SearchIndex
+from conftest import add_catalog
+
+def titles(query, search):
+    query, rank = SearchIndex.filter(query, search)
+    if rank is not None:
+        query = query.order_by(rank)
+    return [book.title for book in query]
+
+def test_app_factory_builds_the_index(app):
+    with app.app_context():
+        add_catalog()
+        assert not SearchIndex.is_available()
+
+    # What a WSGI server importing app:app runs
+    create_app()
+    SearchIndex._available = None
+    with app.app_context():
+        assert SearchIndex.is_available()
+        # Stemmed, ranked matches: the title outweighs the description
+        assert titles(Book.query, 'roads')[0] == 'The Road'
+        assert set(titles(Book.query, 'machine learning')[:2]) == {'Deep Learning', 'Artificial Intelligence'}
+
+        # Rows written after the index exists are picked up by the database itself
+        db.session.add(Book(title='Dune', author='Frank Herbert', price=10.0, stock=1))
+        db.session.commit()
+        assert titles(Book.query, 'dune') == ['Dune']
+
+def test_search_falls_back_to_ilike_without_the_index(client, app):
+    with app.app_context():
+        add_catalog()
+        assert not SearchIndex.is_available()
+        query, rank = SearchIndex.filter(Book.query, 'mccarthy')
+        assert rank is None
+        assert sorted(book.title for book in query) == ['Blood Meridian', 'The Road']
+
+    response = client.get('/?search=meridian')
+    assert response.status_code == 200
+    assert b'Blood Meridian' in response.data
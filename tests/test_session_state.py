@@ -0,0 +1,31 @@
+from flask import session
+from extensions import db
+from models import CartItem
+from utils.session_state import SessionState, inject_session_state
+from conftest import login, add_users, add_catalog
+
+def test_cart_count_is_rendered_and_cached_in_the_session(client, app):
+    with app.app_context():
+        user_id, = add_users(1)
+        book_id = add_catalog()[0]
+        db.session.add(CartItem(user_id=user_id, book_id=book_id, quantity=2))
+        db.session.commit()
+    login(client, 'reader0@example.com')
+
+    assert b'<span id="cart-count" class="badge bg-primary">2</span>' in client.get('/').data
+    with client.session_transaction() as state:
+        assert state['cart_count'] == [user_id, 2]
+
+    response = client.get('/api/session-state')
+    assert response.json['cart_count'] == 2
+    assert response.json['user']['username'] == 'reader0'
+    assert response.headers['Cache-Control'] == 'private, no-store'
+
+def test_rendering_leaves_the_session_unmodified(app):
+    with app.test_request_context('/'):
+        assert inject_session_state() == {'cart_count': 0, 'guest_cart_merged': False}
+        assert not session.modified
+
+        SessionState.mark_guest_cart_merged()
+        assert inject_session_state()['guest_cart_merged'] is True
+        assert inject_session_state()['guest_cart_merged'] is False
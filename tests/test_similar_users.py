@@ -0,0 +1,40 @@
+import time
+from utils.similar_users import SimilarUsers
+from conftest import add_users, add_catalog
+from test_preferences import add_activity
+
+def test_similar_readers_follow_profile_changes(app):
+    with app.app_context():
+        reader, twin, novelist, newcomer = add_users(4)
+        book_ids = add_catalog()
+        add_activity(reader, book_ids[:2])
+        add_activity(twin, book_ids[:2])
+        add_activity(novelist, book_ids[2:4])
+
+        assert SimilarUsers.similar(reader) == [twin]
+        assert SimilarUsers.similar(newcomer) == []
+
+        # This process's commits re-index the users they touch on the next lookup
+        add_activity(newcomer, book_ids[:2])
+        assert SimilarUsers.similar(reader) == [twin, newcomer]
+
+def test_expired_index_is_rebuilt_in_the_background(app):
+    with app.app_context():
+        reader, twin, other = add_users(3)
+        book_ids = add_catalog()
+        add_activity(reader, book_ids[:2])
+        add_activity(twin, book_ids[:2])
+        assert SimilarUsers.similar(reader) == [twin]
+
+        # As if another worker process had committed the change
+        add_activity(other, book_ids[:2])
+        SimilarUsers._stale.clear()
+        assert SimilarUsers.similar(reader) == [twin]
+
+        # The lookup that finds the index expired starts the rebuild and carries on
+        SimilarUsers._loaded_at -= SimilarUsers.MAX_AGE + 1
+        assert SimilarUsers.similar(reader)[0] == twin
+        deadline = time.monotonic() + 5
+        while SimilarUsers._reloading and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert SimilarUsers.similar(reader) == [twin, other]
@@ -0,0 +1,39 @@
+from extensions import db
+from models import Book, BookSimilarity, PendingSimilarity
+from utils.similarity import SimilarityEngine
+from conftest import add_catalog
+
+def similar_titles(book_id, limit=5):
+    db.session.expire_all()
+    return [book.title for book in db.session.get(Book, book_id).get_similar_books(limit)]
+
+def test_rebuild_ranks_books_by_shared_metadata(app):
+    with app.app_context():
+        book_ids = add_catalog()
+        # Unindexed books fall back to their category
+        assert similar_titles(book_ids[2]) == ['Blood Meridian']
+
+        assert SimilarityEngine.rebuild() == 6
+        assert similar_titles(book_ids[2], 1) == ['Blood Meridian']
+        assert similar_titles(book_ids[4], 1) == ['Artificial Intelligence']
+        assert PendingSimilarity.query.count() == 0
+
+def test_edits_are_queued_and_refreshed(app):
+    with app.app_context():
+        book_ids = add_catalog()
+        SimilarityEngine.rebuild()
+
+        suttree = Book(title='Suttree', author='Cormac McCarthy', price=13.0, category='Fiction',
+                       tags='novel,southern gothic', description='A novel of the Knoxville river',
+                       stock=1)
+        db.session.add(suttree)
+        db.session.delete(db.session.get(Book, book_ids[3]))
+        db.session.commit()
+        assert {(row.book_id, row.deleted) for row in PendingSimilarity.query} == \
+            {(suttree.id, False), (book_ids[3], True)}
+
+        assert SimilarityEngine.process_pending() > 0
+        assert PendingSimilarity.query.count() == 0
+        assert similar_titles(suttree.id, 1) == ['The Road']
+        assert similar_titles(book_ids[2], 1) == ['Suttree']
+        assert BookSimilarity.query.filter_by(similar_book_id=book_ids[3]).count() == 0
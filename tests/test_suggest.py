@@ -0,0 +1,33 @@
+from extensions import db
+from models import Book
+from utils.suggest_index import SuggestIndex
+from conftest import add_catalog
+
+def test_suggestions_match_title_author_and_tag_prefixes(client, app):
+    with app.app_context():
+        book_ids = add_catalog()
+
+    def suggest(prefix):
+        return [item['id'] for item in client.get('/api/suggest', query_string={'q': prefix}).json['suggestions']]
+
+    assert suggest('refac') == [book_ids[1]]
+    assert sorted(suggest('mccar')) == [book_ids[2], book_ids[3]]
+    assert suggest('clean co') == [book_ids[0]]
+    assert suggest('post apoc') == [book_ids[2]]
+    assert suggest('c') == []
+
+def test_commits_and_max_age_refresh_the_index(app):
+    with app.app_context():
+        book_ids = add_catalog()
+        assert SuggestIndex.suggest('zebra') == []
+
+        db.session.get(Book, book_ids[0]).title = 'Zebra Crossings'
+        db.session.commit()
+        assert [item['id'] for item in SuggestIndex.suggest('zebra')] == [book_ids[0]]
+
+        # A commit in another worker process only shows up after MAX_AGE
+        db.session.execute(db.update(Book).where(Book.id == book_ids[1]).values(title='Zebra Stripes'))
+        db.session.commit()
+        assert len(SuggestIndex.suggest('zebra')) == 1
+        SuggestIndex._loaded_at -= SuggestIndex.MAX_AGE + 1
+        assert len(SuggestIndex.suggest('zebra')) == 2
@@ -0,0 +1,32 @@
+from extensions import db
+from models import Book, Tag
+from migrate_tags import migrate_tags
+from conftest import add_catalog
+
+def test_set_tags_normalizes_and_shares_tag_rows(app):
+    with app.app_context():
+        first = Book(title='Dune', author='Frank Herbert', price=10.0, stock=1)
+        second = Book(title='Hyperion', author='Dan Simmons', price=11.0, stock=1)
+        first.set_tags(' Science  Fiction,space, SPACE ')
+        second.set_tags('space,classics')
+        db.session.add_all([first, second])
+        db.session.commit()
+
+        assert first.tags == 'science fiction,space'
+        assert sorted(tag.name for tag in first.tag_list) == ['science fiction', 'space']
+        assert Tag.query.count() == 3
+        assert sorted(book.title for book in Tag.query.filter_by(name='space').one().books) == ['Dune', 'Hyperion']
+
+def test_migrated_tags_drive_the_catalog_tag_filter(client, app):
+    with app.app_context():
+        add_catalog()
+    migrate_tags()
+    with app.app_context():
+        assert sorted(book.title for book in Tag.query.filter_by(name='novel').one().books) == \
+            ['Blood Meridian', 'The Road']
+
+    response = client.get('/?tag=novel')
+    assert b'<h5 class="card-title">Blood Meridian</h5>' in response.data
+    assert b'<h5 class="card-title">The Road</h5>' in response.data
+    # Clean Code is still in the featured carousel, just not in the results
+    assert b'<h5 class="card-title">Clean Code</h5>' not in response.data
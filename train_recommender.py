@@ -0,0 +1,33 @@
+from app import app
+from utils.factorization import CollaborativeModel
+import argparse
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def train_recommender(factors=32, iterations=10, regularization=0.1, alpha=10.0, implicit=True, warm_start=True):
+    """Retrain the collaborative filtering factors from reviews and purchases"""
+    with app.app_context():
+        try:
+            model = CollaborativeModel.train(factors=factors, iterations=iterations,
+                                             regularization=regularization, alpha=alpha,
+                                             implicit=implicit, warm_start=warm_start)
+            logger.info(f"Trained factors for {len(model['user_ids'])} users and "
+                        f"{len(model['book_ids'])} books into {CollaborativeModel.path()}")
+
+        except Exception as e:
+            logger.error(f"Error training recommender: {str(e)}")
+            raise e
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the ALS collaborative filtering model")
+    parser.add_argument('--factors', type=int, default=32)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--regularization', type=float, default=0.1)
+    parser.add_argument('--alpha', type=float, default=10.0, help="confidence scale for implicit feedback")
+    parser.add_argument('--explicit', action='store_true', help="fit review ratings instead of implicit feedback")
+    parser.add_argument('--cold', action='store_true', help="ignore the saved model instead of warm-starting from it")
+    args = parser.parse_args()
+    train_recommender(factors=args.factors, iterations=args.iterations, regularization=args.regularization,
+                      alpha=args.alpha, implicit=not args.explicit, warm_start=not args.cold)
@@ -1,8 +1,8 @@
 from flask import request
 from models import UserActivity, db
 
-def log_user_activity(user, activity_type, description):
-    """Log user activity with IP address"""
+def log_user_activity(user, activity_type, description, commit=True):
+    """Log user activity with IP address; commit=False leaves it to the caller's transaction"""
     activity = UserActivity(
         user_id=user.id,
         activity_type=activity_type,
@@ -10,4 +10,5 @@ def log_user_activity(user, activity_type, description):
         ip_address=request.remote_addr
     )
     db.session.add(activity)
-    db.session.commit()
+    if commit:
+        db.session.commit()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import numpy as np
+
+class RandomProjectionIndex:
+    """Approximate nearest-neighbour search with random-projection LSH.
+
+    Each of `tables` hash tables signs the vectors against `bits` random
+    hyperplanes; vectors with the same sign pattern share a bucket. Buckets are
+    stored as codes sorted per table, so probing one is a binary search. A query
+    gathers its own bucket plus, with multi-probe, the buckets across its
+    `probes` least certain hyperplanes, and re-ranks those candidates exactly.
+    More tables or probes raise recall; more bits shrink buckets and latency.
+
+    Saved as plain .npy files and loaded memory-mapped, so every worker
+    process shares one copy through the page cache.
+    """
+
+    FILES = ('ids', 'vectors', 'norms', 'planes', 'order', 'sorted_codes')
+
+    def __init__(self, ids, vectors, norms, planes, order, sorted_codes):
+        self.ids = ids
+        self.vectors = vectors
+        self.norms = norms
+        self.planes = planes
+        self.order = order
+        self.sorted_codes = sorted_codes
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _codes(vectors, planes):
+        """Bucket code of every vector in every table, as a (tables, n) int64 array"""
+        weights = np.int64(1) << np.arange(planes.shape[1], dtype=np.int64)
+        return np.stack([(vectors @ table.T > 0) @ weights for table in planes])
+
+    @classmethod
+    def build(cls, ids, vectors, tables=8, bits=12, seed=0):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        planes = rng.standard_normal((tables, bits, vectors.shape[1])).astype(np.float32)
+        codes = cls._codes(vectors, planes)
+        order = np.argsort(codes, axis=1, kind='stable')
+        return cls(np.asarray(ids, dtype=np.int64), vectors, np.linalg.norm(vectors, axis=1),
+                   planes, order, np.take_along_axis(codes, order, axis=1))
+
+    def save(self, path):
+        """Write the index to directory path, which only appears once every file is complete.
+
+        Directories cannot be swapped atomically over a populated one, so
+        callers that replace a live index should save each version under a new
+        path and publish that path instead of overwriting it.
+        """
+        staging = path + '.new'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name in self.FILES:
+            np.save(os.path.join(staging, f'{name}.npy'), getattr(self, name))
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.isdir(path):
+            return None
+        try:
+            return cls(*(np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in cls.FILES))
+        except (OSError, ValueError):
+            return None
+
+    def candidates(self, vector, probes=2):
+        """Positions of the vectors sharing a probed bucket with vector"""
+        weights = np.int64(1) << np.arange(self.planes.shape[1], dtype=np.int64)
+        found = []
+        for table, planes in enumerate(self.planes):
+            projection = planes @ vector
+            code = int((projection > 0) @ weights)
+            codes = [code] + [code ^ (1 << int(bit)) for bit in np.argsort(np.abs(projection))[:probes]]
+            sorted_codes = self.sorted_codes[table]
+            for probe in codes:
+                start = np.searchsorted(sorted_codes, probe, side='left')
+                end = np.searchsorted(sorted_codes, probe, side='right')
+                if end > start:
+                    found.append(self.order[table, start:end])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def query(self, vector, k=10, probes=2, metric='cosine', exclude=None):
+        """(ids, scores) of the approximate top k by cosine or dot product, best first.
+
+        Falls back to an exact scan when the probed buckets hold fewer than k
+        candidates.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        positions = self.candidates(vector, probes)
+        if exclude is not None:
+            positions = positions[self.ids[positions] != exclude]
+        if len(positions) < k:
+            positions = np.arange(len(self.ids))
+            if exclude is not None:
+                positions = positions[self.ids != exclude]
+        scores = self.vectors[positions] @ vector
+        if metric == 'cosine':
+            scores = scores / np.maximum(self.norms[positions] * np.linalg.norm(vector), 1e-12)
+        if len(positions) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            positions, scores = positions[top], scores[top]
+        best = np.argsort(-scores, kind='stable')
+        return np.asarray(self.ids[positions[best]]), np.asarray(scores[best])
@@ -0,0 +1,23 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from extensions import db
+
+def upsert_statement(model, rows, keys, increment=(), replace=()):
+    """INSERT ... ON CONFLICT statement for rows, updating the existing row on a conflict over keys.
+
+    Columns in increment are added to the stored value; columns in replace
+    overwrite it. Needs PostgreSQL or SQLite 3.24+.
+    """
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    table = model.__table__
+    stmt = dialect.insert(table).values(rows)
+    updates = {name: table.c[name] + stmt.excluded[name] for name in increment}
+    updates.update({name: stmt.excluded[name] for name in replace})
+    if updates:
+        return stmt.on_conflict_do_update(index_elements=list(keys), set_=updates)
+    return stmt.on_conflict_do_nothing(index_elements=list(keys))
+
+def upsert(model, rows, keys, increment=(), replace=()):
+    """Insert or update rows in one statement, in the current session's transaction"""
+    if not rows:
+        return
+    db.session.execute(upsert_statement(model, rows, keys, increment, replace))
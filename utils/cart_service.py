@@ -0,0 +1,241 @@
+import json
+from datetime import datetime
+from sqlalchemy import func, select, update, delete, insert, and_, or_, case
+from sqlalchemy.orm import aliased, contains_eager
+from extensions import db
+from utils.bulk import upsert
+from utils.model_events import record_change
+from utils.preferences import PreferenceProfile, PURCHASE_WEIGHT
+from utils.reservations import StockReservations
+
+class CartService:
+    """Set-based reads and writes of a user's cart.
+
+    Totals come from one aggregate over cart_items joined to books instead of
+    summing CartItem.total, which lazily loads every line's book. Quantity
+    changes are a single conditional UPDATE guarded by the book's stock.
+    Every guard counts only copies not held by other shoppers' checkouts.
+    """
+
+    # Largest number of operations accepted by one batch or guest cart merge
+    MAX_BATCH_ITEMS = 100
+
+    @staticmethod
+    def items(user_id):
+        """A user's cart lines with their books loaded by the same query"""
+        from models import CartItem, Book
+
+        return CartItem.query.join(Book, Book.id == CartItem.book_id)\
+            .options(contains_eager(CartItem.book))\
+            .filter(CartItem.user_id == user_id)\
+            .order_by(CartItem.created_at, CartItem.id).all()
+
+    @staticmethod
+    def available(user_id):
+        """SQL expression for the copies of a Book a user may have in their cart.
+
+        Unreserved stock plus the user's own checkout holds, so going back to
+        the cart during checkout does not count their holds against them.
+        """
+        from models import Book, StockReservation
+
+        own_holds = select(func.coalesce(func.sum(StockReservation.quantity), 0))\
+            .where(StockReservation.user_id == user_id, StockReservation.book_id == Book.id)\
+            .scalar_subquery()
+        return Book.available_stock + own_holds
+
+    @staticmethod
+    def summary(user_id):
+        """(item count, total price) of a user's cart"""
+        from models import CartItem, Book
+
+        count, total = db.session.query(
+            func.coalesce(func.sum(CartItem.quantity), 0),
+            func.coalesce(func.sum(CartItem.quantity * Book.price), 0))\
+            .join(Book, Book.id == CartItem.book_id)\
+            .filter(CartItem.user_id == user_id).one()
+        return int(count), round(float(total), 2)
+
+    @staticmethod
+    def totals(items):
+        """(item count, total price) of cart lines already loaded by items()"""
+        return sum(item.quantity for item in items), round(sum(item.total for item in items), 2)
+
+    @classmethod
+    def set_quantity(cls, user_id, item_id, quantity):
+        """Set a cart line's quantity, or remove it at 0, unless stock is short.
+
+        Returns (book_id, count, total) from one UPDATE or DELETE ... RETURNING;
+        all three are None when the line does not exist or the book lacks the
+        stock. The totals add the user's other lines, which the statement leaves
+        untouched, to the changed line's new quantity and price, so they do not
+        depend on whether RETURNING subqueries see the row before or after the
+        change. Leaves committing to the caller.
+        """
+        from models import CartItem, Book
+
+        other = aliased(CartItem)
+        other_lines = select(func.coalesce(func.sum(other.quantity), 0))\
+            .where(other.user_id == user_id, other.id != item_id).scalar_subquery()
+        # Prices come from correlated subqueries rather than a join: SQLite renders RETURNING
+        # columns unqualified, and a join would make their names ambiguous
+        other_price = select(Book.price).where(Book.id == other.book_id).scalar_subquery()
+        other_total = select(func.coalesce(func.sum(other.quantity * other_price), 0))\
+            .where(other.user_id == user_id, other.id != item_id).scalar_subquery()
+        price = select(Book.price).where(Book.id == CartItem.book_id).scalar_subquery()
+
+        if quantity == 0:
+            stmt = delete(CartItem)
+        else:
+            in_stock = select(cls.available(user_id)).where(Book.id == CartItem.book_id).scalar_subquery()
+            stmt = update(CartItem).where(in_stock >= quantity).values(quantity=quantity)
+        stmt = stmt.where(CartItem.id == item_id, CartItem.user_id == user_id)\
+            .returning(CartItem.book_id, other_lines + quantity, other_total + price * quantity)\
+            .execution_options(synchronize_session=False)
+        row = db.session.execute(stmt).first()
+        if row is None:
+            return None, None, None
+        book_id, count, total = row
+        return book_id, int(count), round(float(total), 2)
+
+    @classmethod
+    def parse_items(cls, items, replace=False):
+        """{book_id: quantity} from a list of {"book_id", "quantity"} operations.
+
+        Repeated books are summed when adding; the last quantity wins when
+        replacing. Raises ValueError with a user-facing message on bad input.
+        """
+        if not isinstance(items, list) or not items or len(items) > cls.MAX_BATCH_ITEMS:
+            raise ValueError('Invalid request data')
+        quantities = {}
+        for item in items:
+            try:
+                book_id, quantity = int(item['book_id']), int(item.get('quantity', 1))
+            except (TypeError, ValueError, KeyError, AttributeError):
+                raise ValueError('Invalid request data')
+            if quantity < (0 if replace else 1):
+                raise ValueError('Invalid quantity')
+            quantities[book_id] = quantity if replace else quantities.get(book_id, 0) + quantity
+        return quantities
+
+    @classmethod
+    def lines(cls, user_id, book_ids):
+        """{book_id: (copies available to the user, quantity in their cart)} for the books that exist, from one IN query"""
+        from models import CartItem, Book
+
+        rows = db.session.query(Book.id, cls.available(user_id), CartItem.quantity)\
+            .outerjoin(CartItem, and_(CartItem.book_id == Book.id, CartItem.user_id == user_id))\
+            .filter(Book.id.in_(list(book_ids))).all()
+        return {book_id: (max(available or 0, 0), in_cart or 0) for book_id, available, in_cart in rows}
+
+    @classmethod
+    def apply_batch(cls, user_id, quantities, replace=False):
+        """Add {book_id: quantity} to a user's cart, or set those quantities when replace is true.
+
+        The changes go in as one upsert, plus one DELETE for lines set to 0.
+        Returns (missing, unavailable) book ids; nothing is written unless both
+        are empty. Leaves committing to the caller.
+        """
+        from models import CartItem
+
+        found = cls.lines(user_id, quantities)
+        missing = sorted(set(quantities) - set(found))
+        unavailable = sorted(
+            book_id for book_id, quantity in quantities.items() if book_id in found
+            and (quantity if replace else found[book_id][1] + quantity) > found[book_id][0])
+        if missing or unavailable:
+            return missing, unavailable
+
+        now = datetime.utcnow()
+        upsert(CartItem, [{'user_id': user_id, 'book_id': book_id, 'quantity': quantity, 'created_at': now}
+                          for book_id, quantity in sorted(quantities.items()) if quantity > 0],
+               keys=('user_id', 'book_id'),
+               increment=() if replace else ('quantity',),
+               replace=('quantity',) if replace else ())
+        removed = [book_id for book_id, quantity in quantities.items() if quantity == 0]
+        if removed:
+            db.session.execute(delete(CartItem).where(CartItem.user_id == user_id, CartItem.book_id.in_(removed)))
+        return [], []
+
+    @classmethod
+    def merge_guest_cart(cls, user_id, payload):
+        """Add a guest cart, posted as JSON by cart.js, to a user's cart in one upsert.
+
+        Unknown books are skipped and quantities capped at available copies, so a stale
+        guest cart never blocks logging in. Returns the number of lines changed.
+        Leaves committing to the caller.
+        """
+        from models import CartItem
+
+        try:
+            quantities = cls.parse_items(json.loads(payload))
+        except (TypeError, ValueError):
+            return 0
+        found = cls.lines(user_id, quantities)
+        now = datetime.utcnow()
+        rows = []
+        for book_id, quantity in sorted(quantities.items()):
+            if book_id not in found:
+                continue
+            available, in_cart = found[book_id]
+            merged = min(in_cart + quantity, available)
+            if merged > in_cart:
+                rows.append({'user_id': user_id, 'book_id': book_id, 'quantity': merged, 'created_at': now})
+        upsert(CartItem, rows, keys=('user_id', 'book_id'), replace=('quantity',))
+        return len(rows)
+
+    @classmethod
+    def place_order(cls, user_id, payment_intent_id, cart_items):
+        """Turn cart lines loaded by items() into a paid order; returns it, or None if a title sold out.
+
+        Flushing the order raises IntegrityError if the payment intent already
+        has one. Stock and reservations change in one UPDATE ... CASE, order
+        items go in as one INSERT and the cart is cleared with one DELETE.
+        Leaves committing, or rolling back on None, to the caller.
+        """
+        from models import Book, BookCoPurchase, CartItem, Order, OrderItem, StockReservation
+
+        quantities = {item.book_id: item.quantity for item in cart_items}
+        _, total = cls.totals(cart_items)
+        # Counts pairs against the purchase history, so it runs before the order exists
+        BookCoPurchase.record_purchase(user_id, list(quantities))
+
+        order = Order(
+            user_id=user_id,
+            total=total,
+            status='processing',
+            payment_intent_id=payment_intent_id,
+            payment_status='paid',
+            payment_method='card',
+            payment_date=datetime.utcnow()
+        )
+        db.session.add(order)
+        db.session.flush()
+
+        # Sell every ordered title and hand back all of the user's holds in one statement. Titles
+        # whose hold expired or fell short of the cart must still have enough unreserved copies,
+        # so a short one leaves a row unmatched; held titles no longer in the cart are only released
+        held = StockReservations.claim(StockReservation.user_id == user_id)
+        book_ids = sorted(set(quantities) | set(held))
+        sold = case(quantities, value=Book.id, else_=0)
+        released = case(held, value=Book.id, else_=0) if held else 0
+        updated = db.session.execute(
+            update(Book).where(Book.id.in_(book_ids), or_(Book.id.notin_(list(quantities)),
+                                                          Book.available_stock + released >= sold))
+            .values(stock=Book.stock - sold, reserved=Book.reserved - released)
+            .execution_options(synchronize_session=False)).rowcount
+        if updated != len(book_ids):
+            return None
+        for book_id in book_ids:
+            record_change(db.session, 'Book', book_id, attrs=('stock', 'reserved'))
+
+        db.session.execute(insert(OrderItem), [
+            {'order_id': order.id, 'book_id': item.book_id, 'quantity': item.quantity, 'price': item.book.price}
+            for item in cart_items])
+        # Bulk inserts bypass the flush listener that maintains preference profiles
+        PreferenceProfile.record(db.session, {(user_id, book_id): PURCHASE_WEIGHT for book_id in quantities})
+
+        db.session.execute(
+            delete(CartItem).where(CartItem.user_id == user_id, CartItem.id.in_([item.id for item in cart_items]))
+            .execution_options(synchronize_session=False))
+        return order
@@ -0,0 +1,93 @@
+from collections import Counter
+from sqlalchemy import func, case, and_, literal_column
+from utils.cache import TTLCache
+from utils.model_events import on_commit
+
+# Book columns that decide which facet a book counts under, or whether a search matches it
+FACET_FIELDS = {'category', 'price', 'language', 'tags', 'tag_list', 'title', 'author', 'description'}
+
+class Facets:
+    """Hit counts for one search, broken down by (category, price bucket, language).
+
+    Each facet is counted with the other two selections applied but not its
+    own, so every option shows how many books picking it would return.
+    """
+
+    CATEGORY, PRICE, LANGUAGE = range(3)
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def _counts(self, dimension, selected):
+        counts = Counter()
+        for row in self.rows:
+            if all(value is None or row[i] == value for i, value in enumerate(selected) if i != dimension):
+                counts[row[dimension]] += row[3]
+        return counts
+
+    def categories(self, selected):
+        return self._counts(self.CATEGORY, selected)
+
+    def price_ranges(self, selected):
+        return self._counts(self.PRICE, selected)
+
+    def languages(self, selected):
+        return self._counts(self.LANGUAGE, selected)
+
+    def total(self, selected):
+        return sum(row[3] for row in self.rows
+                   if all(value is None or row[i] == value for i, value in enumerate(selected)))
+
+class FacetEngine:
+    """Computes catalog facet counts for a search with a single grouped query"""
+
+    # Half-open [low, high) price buckets, keyed as the price_range URL parameter
+    PRICE_BUCKETS = [(0, 10), (10, 25), (25, 50), (50, 100), (100, 10000)]
+
+    _cache = TTLCache(maxsize=256, ttl=120)
+
+    @classmethod
+    def bucket_keys(cls):
+        return [f'{low}-{high}' for low, high in cls.PRICE_BUCKETS]
+
+    @classmethod
+    def compute(cls, query, key):
+        """Facet counts for a Book query (search filter applied, facet filters not)"""
+        from models import Book
+
+        def load():
+            # Literal bounds keep the CASE identical in SELECT and GROUP BY on PostgreSQL
+            bucket = case(*[
+                (and_(Book.price >= literal_column(str(low)), Book.price < literal_column(str(high))),
+                 literal_column(f"'{low}-{high}'"))
+                for low, high in cls.PRICE_BUCKETS
+            ])
+            rows = query.order_by(None).with_entities(
+                Book.category, bucket, Book.language, func.count(Book.id)
+            ).group_by(Book.category, bucket, Book.language).all()
+            return Facets([tuple(row) for row in rows])
+        return cls._cache.get_or_set(key, load)
+
+    @classmethod
+    def tag_counts(cls, query, key, limit=12):
+        """Most common tags among a Book query's results, counted through book_tags"""
+        from models import Book, Tag, book_tags
+
+        def load():
+            hits = func.count(Book.id)
+            rows = query.order_by(None)\
+                .join(book_tags, book_tags.c.book_id == Book.id)\
+                .join(Tag, Tag.id == book_tags.c.tag_id)\
+                .with_entities(Tag.name, hits)\
+                .group_by(Tag.name)\
+                .order_by(hits.desc(), Tag.name)\
+                .limit(limit).all()
+            return [tuple(row) for row in rows]
+        return cls._cache.get_or_set(('tags', key, limit), load)
+
+@on_commit('Book', 'Tag')
+def invalidate_facets(changes):
+    # Checkouts and reservations only write stock and reserved, which no facet counts
+    if any(change.model == 'Tag' or change.op != 'update' or change.attrs & FACET_FIELDS
+           for change in changes):
+        FacetEngine._cache.clear()
@@ -0,0 +1,212 @@
+import os
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+from extensions import db
+from utils.ann import RandomProjectionIndex
+
+logger = logging.getLogger(__name__)
+
+class CollaborativeModel:
+    """Matrix-factorization collaborative filtering trained with alternating least squares.
+
+    Implicit mode treats review ratings and purchases as confidence-weighted
+    evidence of interest (Hu, Koren & Volinsky); explicit mode fits the review
+    ratings themselves. Factors are saved under the instance folder and cached
+    per process, so scoring a user is one dense matrix-vector product; large
+    catalogs score only the candidates from a shared ANN index.
+    """
+
+    MODEL_FILE = 'als_model.npz'
+    INDEX_DIR = 'als_book_index'
+    # Above this many books, user scoring probes the ANN index instead of scanning every book
+    ANN_MIN_BOOKS = 20000
+    ANN_CANDIDATES = 500
+    ANN_PROBES = 2
+    # Seconds between checks for a newer model file written by the trainer
+    RELOAD_INTERVAL = 60
+
+    _lock = threading.Lock()
+    _model = None
+    _checked_at = 0
+    _mtime = None
+
+    @classmethod
+    def path(cls):
+        return os.path.join(current_app.instance_path, cls.MODEL_FILE)
+
+    @classmethod
+    def index_path(cls, version):
+        return os.path.join(current_app.instance_path, f'{cls.INDEX_DIR}.{version}')
+
+    @classmethod
+    def _prune_indexes(cls, keep):
+        """Delete index versions other than keep; workers still mapping them keep their open files"""
+        prefix = cls.INDEX_DIR + '.'
+        for name in os.listdir(current_app.instance_path):
+            if name.startswith(prefix) and name[len(prefix):] not in keep:
+                shutil.rmtree(os.path.join(current_app.instance_path, name), ignore_errors=True)
+
+    @staticmethod
+    def interactions(implicit=True):
+        """(user_ids, book_ids, values) arrays of training data"""
+        from models import Review, Order, OrderItem
+
+        totals = {}
+        for user_id, book_id, rating in db.session.query(Review.user_id, Review.book_id, Review.rating):
+            # Ratings on a 0-1 scale as implicit strength, as-is for explicit fitting
+            totals[(user_id, book_id)] = rating / 5.0 if implicit else float(rating)
+        if implicit:
+            purchases = db.session.query(Order.user_id, OrderItem.book_id, func.count(OrderItem.id))\
+                .join(Order).filter(OrderItem.book_id.isnot(None))\
+                .group_by(Order.user_id, OrderItem.book_id)
+            for user_id, book_id, count in purchases:
+                totals[(user_id, book_id)] = totals.get((user_id, book_id), 0) + count
+        keys = sorted(totals)
+        return (np.array([user_id for user_id, _ in keys], dtype=np.int64),
+                np.array([book_id for _, book_id in keys], dtype=np.int64),
+                np.array([totals[key] for key in keys], dtype=np.float32))
+
+    @staticmethod
+    def _solve(fixed, indptr, cols, values, regularization, alpha, implicit):
+        """Least-squares update of every row's factors given the other side's fixed factors"""
+        factors = fixed.shape[1]
+        identity = np.eye(factors, dtype=np.float64)
+        gram = fixed.T @ fixed if implicit else None
+        solved = np.zeros((len(indptr) - 1, factors), dtype=np.float32)
+        for row in range(len(indptr) - 1):
+            start, end = indptr[row], indptr[row + 1]
+            if start == end:
+                continue
+            local = fixed[cols[start:end]].astype(np.float64)
+            observed = values[start:end]
+            if implicit:
+                confidence = 1 + alpha * observed
+                a = gram + (local.T * (confidence - 1)) @ local + regularization * identity
+                b = local.T @ confidence
+            else:
+                a = local.T @ local + regularization * (end - start) * identity
+                b = local.T @ observed
+            solved[row] = np.linalg.solve(a, b)
+        return solved
+
+    @staticmethod
+    def _csr(rows, cols, values, n_rows):
+        order = np.argsort(rows, kind='stable')
+        rows, cols, values = rows[order], cols[order], values[order]
+        return np.searchsorted(rows, np.arange(n_rows + 1)), cols, values
+
+    @classmethod
+    def train(cls, factors=32, iterations=10, regularization=0.1, alpha=10.0, implicit=True,
+              warm_start=True, seed=0):
+        """Fit user and book factors on the current interactions and save them; returns the model dict"""
+        user_ids, book_ids, values = cls.interactions(implicit)
+        users, user_index = np.unique(user_ids, return_inverse=True)
+        books, book_index = np.unique(book_ids, return_inverse=True)
+
+        rng = np.random.default_rng(seed)
+        user_factors = (rng.standard_normal((len(users), factors)) * 0.01).astype(np.float32)
+        book_factors = (rng.standard_normal((len(books), factors)) * 0.01).astype(np.float32)
+
+        previous = cls.load() if warm_start else None
+        if previous is not None and previous['user_factors'].shape[1] == factors:
+            # Start known users and books from their previous factors
+            for ids, target, old_ids, old_factors in (
+                    (users, user_factors, previous['user_ids'], previous['user_factors']),
+                    (books, book_factors, previous['book_ids'], previous['book_factors'])):
+                if not len(old_ids):
+                    continue
+                positions = np.searchsorted(old_ids, ids)
+                known = (positions < len(old_ids)) & (old_ids[np.minimum(positions, len(old_ids) - 1)] == ids)
+                target[known] = old_factors[positions[known]]
+
+        by_user = cls._csr(user_index, book_index, values, len(users))
+        by_book = cls._csr(book_index, user_index, values, len(books))
+        for iteration in range(iterations):
+            user_factors = cls._solve(book_factors, *by_user, regularization, alpha, implicit)
+            book_factors = cls._solve(user_factors, *by_book, regularization, alpha, implicit)
+            logger.info(f"ALS iteration {iteration + 1}/{iterations} done")
+
+        # The index is written first under a new version, and the model file names that version,
+        # so a worker reloading at any moment sees either the old pair or the new one
+        version = str(time.time_ns())
+        RandomProjectionIndex.build(books, book_factors).save(cls.index_path(version))
+        model = {
+            'user_ids': users,
+            'book_ids': books,
+            'user_factors': user_factors,
+            'book_factors': book_factors,
+            'implicit': np.array(implicit),
+            'index_version': np.array(version)
+        }
+        cls.save(model)
+        # The previous version stays for workers that read the old model file but not yet its index
+        previous_version = str(previous['index_version']) if previous is not None and 'index_version' in previous else None
+        cls._prune_indexes({version, previous_version})
+        return model
+
+    @classmethod
+    def save(cls, model):
+        path = cls.path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(f, **model)
+        # Atomic swap so serving processes never read a half-written file
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls):
+        path = cls.path()
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    @classmethod
+    def current(cls):
+        """The saved model, reloaded when the trainer writes a new file"""
+        now = time.monotonic()
+        if now - cls._checked_at < cls.RELOAD_INTERVAL:
+            return cls._model
+        with cls._lock:
+            cls._checked_at = now
+            try:
+                mtime = os.path.getmtime(cls.path())
+            except OSError:
+                cls._model = cls._mtime = None
+                return None
+            if mtime != cls._mtime:
+                model = cls.load()
+                model['user_positions'] = {int(user_id): i for i, user_id in enumerate(model['user_ids'])}
+                index = None
+                if 'index_version' in model:
+                    index = RandomProjectionIndex.load(cls.index_path(str(model['index_version'])))
+                if index is not None and not np.array_equal(index.ids, model['book_ids']):
+                    logger.warning("ALS index does not match the model's books; scoring without it")
+                    index = None
+                model['index'] = index
+                if index is not None:
+                    # Score against the memory-mapped copy shared by every worker
+                    model['book_factors'] = index.vectors
+                cls._model, cls._mtime = model, mtime
+        return cls._model
+
+    @classmethod
+    def user_scores(cls, user_id):
+        """(book_ids, scores) predicted for a user, or None if the model has no factors for them"""
+        model = cls.current()
+        if model is None:
+            return None
+        position = model['user_positions'].get(user_id)
+        if position is None:
+            return None
+        user_vector = model['user_factors'][position]
+        index = model['index']
+        if index is not None and len(index) >= cls.ANN_MIN_BOOKS:
+            return index.query(user_vector, k=cls.ANN_CANDIDATES, probes=cls.ANN_PROBES, metric='dot')
+        return model['book_ids'], model['book_factors'] @ user_vector
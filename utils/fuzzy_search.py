@@ -0,0 +1,140 @@
+import re
+import math
+import logging
+from sqlalchemy import text, func, case, delete, insert
+from extensions import db
+from utils.model_events import on_commit
+
+logger = logging.getLogger(__name__)
+
+class FuzzySearch:
+    """Typo-tolerant title/author matching with a trigram index.
+
+    PostgreSQL uses pg_trgm's word_similarity with GIN trigram indexes. SQLite
+    uses the book_trigrams posting table maintained by a commit hook, scoring
+    each book by the share of the query's trigrams found in its title or author.
+    """
+
+    SIMILARITY_THRESHOLD = 0.45
+    # Fuzzy matching only runs when the exact search finds fewer hits than this
+    MIN_EXACT_HITS = 3
+    MAX_RESULTS = 50
+
+    @staticmethod
+    def words(value):
+        return re.findall(r'\w+', (value or '').lower())
+
+    @staticmethod
+    def trigrams(word):
+        """Trigrams of a word padded like pg_trgm: two spaces before, one after"""
+        padded = f'  {word} '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @classmethod
+    def book_trigrams(cls, title, author):
+        grams = set()
+        for word in cls.words(title) + cls.words(author):
+            grams |= cls.trigrams(word)
+        return grams
+
+    @classmethod
+    def ensure_index(cls):
+        """Create the trigram indexes, building the SQLite posting table if it is empty"""
+        from models import BookTrigram
+
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_books_title_trgm ON books USING GIN (title gin_trgm_ops)"))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_books_author_trgm ON books USING GIN (author gin_trgm_ops)"))
+            db.session.commit()
+        elif not db.session.query(BookTrigram.book_id).first():
+            cls.rebuild()
+        return True
+
+    @classmethod
+    def rebuild(cls):
+        """Re-populate the trigram posting table from every book"""
+        from models import Book, BookTrigram
+
+        db.session.execute(delete(BookTrigram))
+        rows = []
+        for book_id, title, author in db.session.query(Book.id, Book.title, Book.author):
+            rows.extend({'trigram': gram, 'book_id': book_id} for gram in cls.book_trigrams(title, author))
+        if rows:
+            db.session.execute(insert(BookTrigram), rows)
+        db.session.commit()
+
+    @classmethod
+    def search(cls, search_query):
+        """Best fuzzy title/author matches as [(book_id, score)], highest score first"""
+        from models import BookTrigram
+
+        words = cls.words(search_query)
+        if not words:
+            return []
+
+        if db.engine.dialect.name == 'postgresql':
+            phrase = ' '.join(words)
+            db.session.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+                               {'threshold': str(cls.SIMILARITY_THRESHOLD)})
+            rows = db.session.execute(text("""
+                SELECT id, GREATEST(word_similarity(:phrase, title), word_similarity(:phrase, author)) AS score
+                FROM books
+                WHERE :phrase <% title OR :phrase <% author
+                ORDER BY score DESC, id
+                LIMIT :limit
+            """), {'phrase': phrase, 'limit': cls.MAX_RESULTS}).all()
+            return [(book_id, float(score)) for book_id, score in rows]
+
+        grams = set()
+        for word in words:
+            grams |= cls.trigrams(word)
+        hits = func.count(BookTrigram.trigram)
+        rows = db.session.query(BookTrigram.book_id, hits)\
+            .filter(BookTrigram.trigram.in_(grams))\
+            .group_by(BookTrigram.book_id)\
+            .having(hits >= math.ceil(cls.SIMILARITY_THRESHOLD * len(grams)))\
+            .order_by(hits.desc(), BookTrigram.book_id)\
+            .limit(cls.MAX_RESULTS).all()
+        return [(book_id, count / len(grams)) for book_id, count in rows]
+
+    @classmethod
+    def filter(cls, query, search_query, exact_ids=()):
+        """Restrict a Book query to exact_ids plus fuzzy matches, ranked in that order.
+
+        Returns ``(query, rank)`` like SearchIndex.filter, or ``(None, None)``
+        when there are no fuzzy matches to add.
+        """
+        from models import Book
+
+        exact_ids = list(exact_ids)
+        fuzzy_ids = [book_id for book_id, _ in cls.search(search_query) if book_id not in exact_ids]
+        if not fuzzy_ids:
+            return None, None
+        ranked_ids = exact_ids + fuzzy_ids
+        rank = case({book_id: position for position, book_id in enumerate(ranked_ids)}, value=Book.id)
+        return query.filter(Book.id.in_(ranked_ids)), rank
+
+@on_commit('Book')
+def refresh_trigrams(changes):
+    from models import Book, BookTrigram
+
+    if db.engine.dialect.name == 'postgresql':
+        return
+    book_ids = {change.id for change in changes
+                if change.op != 'update' or change.attrs & {'title', 'author'}}
+    if not book_ids:
+        return
+    # The committed session cannot run SQL here, so write through a separate transaction
+    with db.engine.begin() as conn:
+        conn.execute(delete(BookTrigram).where(BookTrigram.book_id.in_(book_ids)))
+        books = conn.execute(
+            db.select(Book.id, Book.title, Book.author).where(Book.id.in_(book_ids))).all()
+        rows = []
+        for book_id, title, author in books:
+            rows.extend({'trigram': gram, 'book_id': book_id} for gram in FuzzySearch.book_trigrams(title, author))
+        if rows:
+            conn.execute(insert(BookTrigram), rows)
@@ -0,0 +1,78 @@
+import zlib
+from collections import Counter, defaultdict
+import numpy as np
+
+class MinHasher:
+    """MinHash signatures of token sets, split into bands for LSH bucketing.
+
+    Two sets share a band with probability close to 1 - (1 - J^rows)^bands
+    for Jaccard similarity J, so more bands with fewer rows find less similar
+    pairs. Permutations come from a fixed seed, so signatures are stable
+    across processes.
+    """
+
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm=64, bands=32, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        # a * crc32 + b stays below 2**64 with 31-bit coefficients
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+
+    @staticmethod
+    def token_hash(token):
+        return zlib.crc32(repr(token).encode())
+
+    def signature(self, tokens):
+        hashes = np.array([self.token_hash(token) for token in tokens], dtype=np.uint64)
+        if not len(hashes):
+            return None
+        return ((hashes[:, None] * self.a + self.b) % np.uint64(self.PRIME)).min(axis=0)
+
+    def band_keys(self, signature):
+        return [(band, row.tobytes()) for band, row in enumerate(signature.reshape(self.bands, self.rows))]
+
+class LSHIndex:
+    """In-memory LSH buckets mapping each band of a MinHash signature to the items sharing it"""
+
+    def __init__(self, hasher=None):
+        self.hasher = hasher or MinHasher()
+        self.buckets = defaultdict(set)
+        self.item_keys = {}
+
+    def __len__(self):
+        return len(self.item_keys)
+
+    def add(self, item, tokens):
+        self.remove(item)
+        signature = self.hasher.signature(tokens)
+        if signature is None:
+            return
+        keys = self.hasher.band_keys(signature)
+        for key in keys:
+            self.buckets[key].add(item)
+        self.item_keys[item] = keys
+
+    def remove(self, item):
+        for key in self.item_keys.pop(item, ()):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(item)
+                if not bucket:
+                    del self.buckets[key]
+
+    def candidates(self, tokens, exclude=None, limit=None):
+        """Items sharing at least one band with tokens, most shared bands first"""
+        signature = self.hasher.signature(tokens)
+        if signature is None:
+            return []
+        collisions = Counter()
+        for key in self.hasher.band_keys(signature):
+            collisions.update(self.buckets.get(key, ()))
+        collisions.pop(exclude, None)
+        return [item for item, _ in collisions.most_common(limit)]
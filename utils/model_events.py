@@ -0,0 +1,61 @@
+import logging
+from collections import namedtuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# op is 'insert', 'update' or 'delete'; attrs holds the changed attribute names for updates
+ModelChange = namedtuple('ModelChange', ['model', 'id', 'op', 'attrs'])
+
+_listeners = []
+
+def on_commit(*model_names):
+    """Register callback(changes) to run after a commit that flushed any of the named models.
+
+    Callbacks receive the list of ModelChange records for those models. They run
+    after the transaction has ended, so they must not use the committed session.
+    """
+    def decorator(f):
+        _listeners.append((frozenset(model_names), f))
+        return f
+    return decorator
+
+def _primary_key(obj):
+    pk = inspect(obj).mapper.primary_key_from_instance(obj)
+    return pk[0] if len(pk) == 1 else tuple(pk)
+
+@event.listens_for(Session, 'after_flush')
+def record_changes(session, flush_context):
+    changes = session.info.setdefault('model_changes', [])
+    for obj in session.new:
+        changes.append(ModelChange(type(obj).__name__, _primary_key(obj), 'insert', frozenset()))
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        state = inspect(obj)
+        attrs = frozenset(attr.key for attr in state.attrs if attr.history.has_changes())
+        changes.append(ModelChange(type(obj).__name__, _primary_key(obj), 'update', attrs))
+    for obj in session.deleted:
+        changes.append(ModelChange(type(obj).__name__, _primary_key(obj), 'delete', frozenset()))
+
+@event.listens_for(Session, 'after_commit')
+def dispatch_changes(session):
+    changes = session.info.pop('model_changes', None)
+    if not changes:
+        return
+    for model_names, callback in _listeners:
+        relevant = [change for change in changes if change.model in model_names]
+        if relevant:
+            try:
+                callback(relevant)
+            except Exception as e:
+                logger.error(f"Error in commit hook {callback.__name__}: {str(e)}")
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changes(session):
+    session.info.pop('model_changes', None)
+
+def record_change(session, model_name, id, op='update', attrs=()):
+    """Queue a change made by a bulk UPDATE or DELETE, which flush events never see, for the commit hooks"""
+    session.info.setdefault('model_changes', []).append(ModelChange(model_name, id, op, frozenset(attrs)))
@@ -0,0 +1,75 @@
+import json
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+from utils.cache import TTLCache
+
+# Filtered result counts are only used for display, so a short-lived copy is fine
+count_cache = TTLCache(maxsize=512, ttl=120)
+
+def cached_count(query, key):
+    """Approximate total for a query, counted at most once per TTL per key"""
+    return count_cache.get_or_set(key, lambda: query.order_by(None).count())
+
+def order_clauses(sort_columns):
+    """Turn [(column, descending), ...] into ORDER BY clauses"""
+    return [column.desc() if descending else column.asc() for column, descending in sort_columns]
+
+def encode_cursor(item, sort_columns):
+    """Encode the sort key of the last item on a page as an opaque URL-safe token"""
+    values = []
+    for column, _ in sort_columns:
+        value = getattr(item, column.key)
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, sort_columns):
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(sort_columns):
+        raise ValueError('Invalid cursor')
+    decoded = []
+    for (column, _), value in zip(sort_columns, values):
+        if value is not None and column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        decoded.append(value)
+    return decoded
+
+def _after(sort_columns, values):
+    """WHERE clause selecting rows that sort strictly after the given key"""
+    column, descending = sort_columns[0]
+    value = values[0]
+    beyond = column < value if descending else column > value
+    if len(sort_columns) == 1:
+        return beyond
+    return or_(beyond, and_(column == value, _after(sort_columns[1:], values[1:])))
+
+class KeysetPagination:
+    """A page of results fetched by seeking past the previous page's last sort key"""
+
+    def __init__(self, items, per_page, next_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+def keyset_paginate(query, sort_columns, cursor=None, per_page=12, total=None):
+    """Fetch one page of query ordered by sort_columns, starting after cursor.
+
+    sort_columns must end in a unique column (e.g. the primary key) so the
+    order is total. Raises ValueError for a malformed cursor.
+    """
+    if cursor:
+        query = query.filter(_after(sort_columns, decode_cursor(cursor, sort_columns)))
+    rows = query.order_by(*order_clauses(sort_columns)).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = encode_cursor(items[-1], sort_columns) if len(rows) > per_page else None
+    return KeysetPagination(items, per_page, next_cursor, total)
@@ -0,0 +1,198 @@
+import logging
+from datetime import datetime
+from sqlalchemy import event, select, delete, insert, inspect
+from sqlalchemy.orm import Session
+from extensions import db
+from utils.bulk import upsert_statement
+
+logger = logging.getLogger(__name__)
+
+# Interaction weights, as in User.get_book_weights_for
+POSITIVE_RATING = 4
+REVIEW_WEIGHT = 2
+PURCHASE_WEIGHT = 1
+READING_LIST_WEIGHT = 1
+
+_listeners = []
+
+def on_profile_change(f):
+    """Register callback(user_ids) to run after a commit that changed those users' preference profiles"""
+    _listeners.append(f)
+    return f
+
+class PreferenceProfile:
+    """Persisted per-user category, tag and author weights in user_preferences.
+
+    Profiles are adjusted inside the flush that adds or removes a positive
+    review, an order item or a reading-list item, so reading one is a single
+    indexed query. Edits to a book's category, author or tags are not
+    propagated to existing profiles; rebuild_preferences.py recomputes them.
+    """
+
+    KINDS = {'category': 'categories', 'tag': 'tags', 'author': 'authors'}
+
+    @staticmethod
+    def load(user_ids=None):
+        """{user_id: {(kind, value): weight}} for the given users, or for everyone"""
+        from models import UserPreference
+
+        query = db.session.query(UserPreference.user_id, UserPreference.kind,
+                                 UserPreference.value, UserPreference.weight)\
+            .filter(UserPreference.weight > 0)
+        if user_ids is not None:
+            query = query.filter(UserPreference.user_id.in_(list(user_ids)))
+        profiles = {}
+        for user_id, kind, value, weight in query:
+            profiles.setdefault(user_id, {})[(kind, value)] = weight
+        return profiles
+
+    @staticmethod
+    def book_features(conn, book_ids):
+        """{book_id: [(kind, value), ...]} read through conn"""
+        from models import Book, Tag, book_tags
+
+        features = {book_id: [] for book_id in book_ids}
+        for book_id, category, author in conn.execute(
+                select(Book.id, Book.category, Book.author).where(Book.id.in_(book_ids))):
+            if category:
+                features[book_id].append(('category', category))
+            if author:
+                features[book_id].append(('author', author))
+        for book_id, name in conn.execute(
+                select(book_tags.c.book_id, Tag.name).join(Tag, Tag.id == book_tags.c.tag_id)
+                .where(book_tags.c.book_id.in_(book_ids))):
+            features[book_id].append(('tag', name))
+        return features
+
+    @classmethod
+    def apply(cls, conn, book_deltas):
+        """Add {(user_id, book_id): delta} to the affected profiles through conn"""
+        from models import UserPreference, UserRecommendation
+
+        book_deltas = {key: delta for key, delta in book_deltas.items() if delta}
+        if not book_deltas:
+            return
+        features = cls.book_features(conn, {book_id for _, book_id in book_deltas})
+        deltas = {}
+        for (user_id, book_id), delta in book_deltas.items():
+            for kind, value in features.get(book_id, ()):
+                deltas[(user_id, kind, value)] = deltas.get((user_id, kind, value), 0) + delta
+        now = datetime.utcnow()
+        rows = [{'user_id': user_id, 'kind': kind, 'value': value, 'weight': delta, 'updated_at': now}
+                for (user_id, kind, value), delta in sorted(deltas.items()) if delta]
+        if rows:
+            conn.execute(upsert_statement(UserPreference, rows, keys=('user_id', 'kind', 'value'),
+                                          increment=('weight',), replace=('updated_at',)))
+            user_ids = {user_id for user_id, _ in book_deltas}
+            emptied = conn.execute(delete(UserPreference).where(
+                UserPreference.user_id.in_(user_ids), UserPreference.weight <= 0)).rowcount
+            if emptied:
+                # batch_recommendations.py only revisits users with a profile, so stored
+                # recommendations of a profile that is now empty would be served forever
+                has_profile = select(UserPreference.user_id)\
+                    .where(UserPreference.user_id == UserRecommendation.user_id).exists()
+                conn.execute(delete(UserRecommendation).where(
+                    UserRecommendation.user_id.in_(user_ids), ~has_profile))
+
+    @classmethod
+    def record(cls, session, book_deltas):
+        """Apply book deltas in the session's transaction and notify on_profile_change listeners after commit.
+
+        The flush listener calls this for ORM changes; code that writes
+        interactions with bulk statements, which flush never sees, calls it
+        directly.
+        """
+        book_deltas = {key: delta for key, delta in book_deltas.items() if delta}
+        if book_deltas:
+            cls.apply(session.connection(), book_deltas)
+            session.info.setdefault('profile_changes', set()).update(user_id for user_id, _ in book_deltas)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every profile from reviews, orders and reading lists; returns the number of users"""
+        from models import User, UserPreference
+        from utils.recommender import BookFeatures
+
+        matrix = BookFeatures.current()
+        book_weights = User.get_book_weights_for()
+        now = datetime.utcnow()
+        db.session.execute(delete(UserPreference))
+        rows = [{'user_id': user_id, 'kind': kind, 'value': value, 'weight': weight, 'updated_at': now}
+                for user_id, weights in book_weights.items()
+                for (kind, value), weight in matrix.features(weights).items()]
+        if rows:
+            db.session.execute(insert(UserPreference), rows)
+        return len(book_weights)
+
+def _owner_id(session, obj):
+    """User who owns a review, order item or reading-list item"""
+    from models import Review, Order, OrderItem, ReadingList, ReadingListItem
+
+    if isinstance(obj, Review):
+        return obj.user_id
+    # Parents are usually in the identity map already, so these rarely query
+    if isinstance(obj, OrderItem):
+        order = session.get(Order, obj.order_id)
+        return order.user_id if order else None
+    if isinstance(obj, ReadingListItem):
+        reading_list = session.get(ReadingList, obj.reading_list_id)
+        return reading_list.user_id if reading_list else None
+    return None
+
+def _weight(obj, rating=None):
+    from models import Review, OrderItem, ReadingListItem
+
+    if isinstance(obj, Review):
+        return REVIEW_WEIGHT if (obj.rating if rating is None else rating) >= POSITIVE_RATING else 0
+    if isinstance(obj, OrderItem):
+        return PURCHASE_WEIGHT
+    if isinstance(obj, ReadingListItem):
+        return READING_LIST_WEIGHT
+    return 0
+
+@event.listens_for(Session, 'after_flush')
+def update_profiles(session, flush_context):
+    from models import Review, User, Book
+
+    book_deltas = {}
+    # Deleting a user or book cascades to their interactions; the foreign keys then remove
+    # the profile rows, and writing deltas for them would violate those same keys
+    deleted_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    deleted_books = {obj.id for obj in session.deleted if isinstance(obj, Book)}
+
+    def add(obj, delta):
+        user_id = _owner_id(session, obj)
+        if user_id is None or user_id in deleted_users or obj.book_id in deleted_books:
+            return
+        if obj.book_id is not None and delta:
+            book_deltas[(user_id, obj.book_id)] = book_deltas.get((user_id, obj.book_id), 0) + delta
+
+    for obj in session.new:
+        add(obj, _weight(obj))
+    for obj in session.deleted:
+        add(obj, -_weight(obj))
+    for obj in session.dirty:
+        if isinstance(obj, Review):
+            history = inspect(obj).attrs.rating.history
+            if history.deleted:
+                add(obj, _weight(obj) - _weight(obj, rating=history.deleted[0]))
+
+    PreferenceProfile.record(session, book_deltas)
+    if deleted_users:
+        # Lets on_profile_change listeners drop them from in-memory indexes
+        session.info.setdefault('profile_changes', set()).update(deleted_users)
+
+@event.listens_for(Session, 'after_commit')
+def dispatch_profile_changes(session):
+    user_ids = session.info.pop('profile_changes', None)
+    if not user_ids:
+        return
+    for callback in _listeners:
+        try:
+            callback(user_ids)
+        except Exception as e:
+            logger.error(f"Error in profile hook {callback.__name__}: {str(e)}")
+
+@event.listens_for(Session, 'after_rollback')
+def discard_profile_changes(session):
+    session.info.pop('profile_changes', None)
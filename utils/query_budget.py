@@ -0,0 +1,51 @@
+import logging
+from contextvars import ContextVar
+from functools import wraps
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_active_counters = ContextVar('active_query_counters', default=())
+
+class QueryCounter:
+    """Counts SQL statements executed in the current thread while the block is active"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __enter__(self):
+        self._token = _active_counters.set(_active_counters.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_counters.reset(self._token)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active_counters.get():
+        counter.count += 1
+        counter.statements.append(statement)
+
+def query_budget(limit):
+    """Cap the number of SQL statements a view may issue, templates included.
+
+    Going over budget raises AssertionError under app.testing or when
+    QUERY_BUDGET_ENFORCED is set, so N+1 regressions fail tests; otherwise
+    it is logged as a warning.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with QueryCounter() as counter:
+                response = f(*args, **kwargs)
+            if counter.count > limit:
+                message = f"{request.endpoint} issued {counter.count} queries, over its budget of {limit}"
+                if current_app.testing or current_app.config.get('QUERY_BUDGET_ENFORCED'):
+                    raise AssertionError(message + ':\n' + '\n'.join(counter.statements))
+                logger.warning(message)
+            return response
+        return decorated_function
+    return decorator
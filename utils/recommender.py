@@ -0,0 +1,190 @@
+import time
+import threading
+import numpy as np
+from sqlalchemy import select
+from extensions import db
+from utils.model_events import on_commit
+
+# Book columns the feature matrix is built from; stock and reservation writes leave it valid
+FEATURE_FIELDS = {'category', 'author', 'tags', 'tag_list', 'rating_avg'}
+
+class FeatureMatrix:
+    """One immutable snapshot of the catalog's book features.
+
+    The book x feature one-hot matrix is kept in coordinate form (rows, cols),
+    sorted by row, over one column space shared by categories, tags and
+    authors, so X @ p is a gather plus np.bincount.
+    """
+
+    def __init__(self, ids, rows, cols, column_weights, ratings, vocabulary):
+        order = np.argsort(rows, kind='stable')
+        self.ids = ids
+        self.rows = rows[order]
+        self.cols = cols[order]
+        # Book at position p owns entries indptr[p]:indptr[p + 1], as in a CSR matrix
+        self.indptr = np.searchsorted(self.rows, np.arange(len(ids) + 1))
+        self.column_weights = column_weights
+        self.ratings = ratings
+        self.vocabulary = vocabulary
+        self.keys = sorted(vocabulary, key=vocabulary.get)
+        self.position_of = {int(book_id): i for i, book_id in enumerate(ids)}
+        # Best rated first, ties by id, for padding short recommendation lists
+        self.by_rating = np.lexsort((ids, -ratings))
+        self.loaded_at = time.monotonic()
+
+    def positions(self, book_ids):
+        return np.array([self.position_of[book_id] for book_id in book_ids if book_id in self.position_of],
+                        dtype=np.int64)
+
+    def vector(self, profile):
+        """Dense preference vector over the matrix columns from {(kind, value): weight}"""
+        preferences = np.zeros(len(self.column_weights), dtype=np.float32)
+        for key, weight in profile.items():
+            column = self.vocabulary.get(key)
+            if column is not None:
+                preferences[column] = weight
+        return preferences
+
+    def features(self, book_weights):
+        """{(kind, name): weight} for one user's weighted books, without touching the rest of the matrix"""
+        totals = {}
+        for book_id, weight in book_weights.items():
+            position = self.position_of.get(book_id)
+            if position is None:
+                continue
+            for col in self.cols[self.indptr[position]:self.indptr[position + 1]]:
+                totals[col] = totals.get(col, 0) + weight
+        return {self.keys[col]: weight for col, weight in totals.items()}
+
+    def score(self, preferences):
+        """Score every book against a preference vector, boosted by its average rating"""
+        weighted = (self.column_weights * preferences)[self.cols]
+        scores = np.bincount(self.rows, weights=weighted, minlength=len(self.ids))
+        return scores * (1 + self.ratings / 5.0)
+
+    def align(self, book_ids, values):
+        """Values keyed by arbitrary book ids, laid out by matrix position (0 for missing books)"""
+        aligned = np.zeros(len(self.ids), dtype=np.float32)
+        positions = np.searchsorted(self.ids, book_ids)
+        known = (positions < len(self.ids)) & (self.ids[np.minimum(positions, len(self.ids) - 1)] == book_ids)
+        aligned[positions[known]] = values[known]
+        return aligned
+
+    def top_k(self, scores, k, exclude=()):
+        """Ids of the k highest positive scores, padded with the best rated books"""
+        scores = scores.copy()
+        excluded = self.positions(exclude)
+        scores[excluded] = -np.inf
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.lexsort((self.ids[candidates], -scores[candidates]))]
+        result = [int(self.ids[p]) for p in candidates]
+        if len(result) < k:
+            taken = set(excluded.tolist()) | set(candidates.tolist())
+            for p in self.by_rating:
+                if len(result) >= k:
+                    break
+                if p not in taken:
+                    result.append(int(self.ids[p]))
+        return result
+
+class BookFeatures:
+    """Process-wide book feature matrix for recommendation scoring.
+
+    Built from two queries on first use and rebuilt lazily after a commit
+    touches books, tags or reviews; MAX_AGE bounds staleness in other worker
+    processes. Requests share one snapshot and never copy it.
+    """
+
+    # Same weights the per-book scoring loop used: category 2, tag 1, author 1.5
+    CATEGORY_WEIGHT = 2.0
+    TAG_WEIGHT = 1.0
+    AUTHOR_WEIGHT = 1.5
+    MAX_AGE = 300
+    # Share of the final score taken by the collaborative model when it knows the user
+    COLLABORATIVE_WEIGHT = 0.4
+
+    _lock = threading.Lock()
+    _matrix = None
+    _stale = True
+
+    @classmethod
+    def load(cls):
+        from models import Book, Tag, book_tags
+
+        books = db.session.execute(
+            select(Book.id, Book.category, Book.author, Book.rating_avg).order_by(Book.id)).all()
+        tags = db.session.execute(
+            select(book_tags.c.book_id, Tag.name).join(Tag, Tag.id == book_tags.c.tag_id)).all()
+
+        vocabulary = {}
+        weights = []
+
+        def column(key, weight):
+            if key not in vocabulary:
+                vocabulary[key] = len(weights)
+                weights.append(weight)
+            return vocabulary[key]
+
+        ids = np.array([book_id for book_id, _, _, _ in books], dtype=np.int64)
+        position_of = {book_id: i for i, book_id in enumerate(ids.tolist())}
+        rows, cols = [], []
+        for position, (book_id, category, author, _) in enumerate(books):
+            if category:
+                rows.append(position)
+                cols.append(column(('category', category), cls.CATEGORY_WEIGHT))
+            if author:
+                rows.append(position)
+                cols.append(column(('author', author), cls.AUTHOR_WEIGHT))
+        for book_id, name in tags:
+            if book_id in position_of:
+                rows.append(position_of[book_id])
+                cols.append(column(('tag', name), cls.TAG_WEIGHT))
+
+        ratings = np.array([rating or 0 for _, _, _, rating in books], dtype=np.float32)
+        return FeatureMatrix(ids, np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64),
+                             np.array(weights, dtype=np.float32), ratings, vocabulary)
+
+    @classmethod
+    def current(cls):
+        matrix = cls._matrix
+        if matrix is None or cls._stale or time.monotonic() - matrix.loaded_at > cls.MAX_AGE:
+            with cls._lock:
+                if cls._matrix is matrix:
+                    cls._stale = False
+                    cls._matrix = cls.load()
+            matrix = cls._matrix
+        return matrix
+
+    @classmethod
+    def recommend(cls, profile, exclude=(), limit=10, collaborative=None):
+        """Ids of the best books for a preference profile, excluding books already seen.
+
+        collaborative is an optional (book_ids, scores) pair from
+        CollaborativeModel.user_scores, blended in with COLLABORATIVE_WEIGHT
+        after scaling both scores to [0, 1].
+        """
+        matrix = cls.current()
+        if not len(matrix.ids):
+            return []
+        scores = matrix.score(matrix.vector(profile))
+        if collaborative is not None:
+            predicted = np.clip(matrix.align(*collaborative), 0, None)
+            content_max, predicted_max = scores.max(), predicted.max()
+            if predicted_max > 0:
+                content = scores / content_max if content_max > 0 else scores
+                scores = (1 - cls.COLLABORATIVE_WEIGHT) * content + \
+                    cls.COLLABORATIVE_WEIGHT * predicted / predicted_max
+        return matrix.top_k(scores, limit, exclude)
+
+    @classmethod
+    def invalidate(cls):
+        cls._stale = True
+
+@on_commit('Book', 'Tag')
+def invalidate_features(changes):
+    # New reviews reach the matrix as rating_avg updates recorded by the flush hook
+    if any(change.model == 'Tag' or change.op != 'update' or change.attrs & FEATURE_FIELDS
+           for change in changes):
+        BookFeatures.invalidate()
@@ -0,0 +1,93 @@
+from extensions import db
+from utils.cache import TTLCache
+from utils.model_events import on_commit
+
+# Attributes of a book shown wherever it appears as reference data
+BOOK_DISPLAY_FIELDS = {'title', 'author', 'description', 'price', 'image_url'}
+FEATURED_LIMIT = 5
+
+class ReferenceCache:
+    """Process-local cache of slow-changing catalog data used on every page.
+
+    Values are plain dicts rather than ORM objects so they can outlive the
+    session that loaded them. Entries are dropped by commit hooks when the
+    underlying rows change; the TTL bounds staleness in other worker processes.
+    """
+
+    _catalog = TTLCache(maxsize=16, ttl=300)
+    _series = TTLCache(maxsize=1024, ttl=300)
+
+    @classmethod
+    def get_categories(cls):
+        """Names of categories that have at least one book"""
+        from models import Book
+
+        def load():
+            rows = db.session.query(Book.category).distinct().all()
+            return [row[0] for row in rows if row[0]]
+        return cls._catalog.get_or_set('categories', load)
+
+    @classmethod
+    def get_featured_books(cls):
+        """Featured books for the homepage carousel"""
+        from models import Book
+
+        def load():
+            books = Book.query.filter_by(is_featured=True).order_by(Book.id).limit(FEATURED_LIMIT).all()
+            return [{
+                'id': book.id,
+                'title': book.title,
+                'author': book.author,
+                'description': book.description,
+                'price': book.price,
+                'image_url': book.image_url
+            } for book in books]
+        return cls._catalog.get_or_set('featured', load)
+
+    @classmethod
+    def featured_book_ids(cls):
+        return {book['id'] for book in cls._catalog.get('featured') or []}
+
+    @classmethod
+    def get_series_books(cls, series_id):
+        """Books of a series in reading order"""
+        from models import Book
+
+        if not series_id:
+            return []
+
+        def load():
+            books = Book.query.filter_by(series_id=series_id).order_by(Book.series_order).all()
+            return [{
+                'id': book.id,
+                'title': book.title,
+                'price': book.price,
+                'series_order': book.series_order
+            } for book in books]
+        return cls._series.get_or_set(series_id, load)
+
+    @classmethod
+    def clear(cls):
+        cls._catalog.clear()
+        cls._series.clear()
+
+@on_commit('Category')
+def invalidate_categories(changes):
+    # Renames cascade to books.category in the database, outside the ORM
+    ReferenceCache._catalog.delete('categories')
+
+@on_commit('BookSeries')
+def invalidate_series(changes):
+    ReferenceCache._series.clear()
+
+@on_commit('Book')
+def invalidate_book_references(changes):
+    featured_ids = ReferenceCache.featured_book_ids()
+    for change in changes:
+        if change.op != 'update' or 'category' in change.attrs:
+            ReferenceCache._catalog.delete('categories')
+        if change.op != 'update' or 'is_featured' in change.attrs or (
+                change.id in featured_ids and change.attrs & BOOK_DISPLAY_FIELDS):
+            ReferenceCache._catalog.delete('featured')
+        if change.op != 'update' or change.attrs & (BOOK_DISPLAY_FIELDS | {'series_id', 'series_order'}):
+            ReferenceCache._series.clear()
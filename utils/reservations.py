@@ -0,0 +1,115 @@
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, delete, insert, case
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+class StockReservations:
+    """Stock held for checkouts in progress.
+
+    create_payment_intent holds each title with one conditional UPDATE that
+    raises books.reserved only while stock - reserved still covers the
+    quantity, so concurrent checkouts of the same title cannot oversell and
+    no lock is held on the rest of the cart. Holds expire after TTL; new
+    checkouts and sweep_reservations.py hand expired holds back, and
+    payment_complete claims them when it decrements stock.
+    """
+
+    TTL = timedelta(minutes=15)
+
+    @classmethod
+    def hold(cls, user_id, quantities):
+        """Reserve {book_id: quantity} for a user; returns the ids of books short of stock.
+
+        The holds are only consistent when nothing is returned; the caller
+        rolls back otherwise. Leaves committing to the caller.
+        """
+        from models import Book, StockReservation
+
+        short = []
+        # Always in id order, so concurrent checkouts lock shared titles in the same order
+        for book_id, quantity in sorted(quantities.items()):
+            held = db.session.execute(
+                update(Book).where(Book.id == book_id, Book.available_stock >= quantity)
+                .values(reserved=Book.reserved + quantity)
+                .execution_options(synchronize_session=False)).rowcount
+            if not held:
+                short.append(book_id)
+        if short:
+            return short
+
+        now = datetime.utcnow()
+        db.session.execute(insert(StockReservation), [
+            {'user_id': user_id, 'book_id': book_id, 'quantity': quantity,
+             'created_at': now, 'expires_at': now + cls.TTL}
+            for book_id, quantity in sorted(quantities.items())])
+        return []
+
+    @staticmethod
+    def attach(user_id, payment_intent_id):
+        """Tie a user's unclaimed holds to the payment intent created for them"""
+        from models import StockReservation
+
+        db.session.execute(
+            update(StockReservation)
+            .where(StockReservation.user_id == user_id, StockReservation.payment_intent_id.is_(None))
+            .values(payment_intent_id=payment_intent_id)
+            .execution_options(synchronize_session=False))
+
+    @staticmethod
+    def payment_intents(user_id):
+        """Ids of the payment intents a user's holds are attached to"""
+        from models import StockReservation
+
+        rows = db.session.query(StockReservation.payment_intent_id).distinct()\
+            .filter(StockReservation.user_id == user_id, StockReservation.payment_intent_id.isnot(None))
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def claim(*criteria):
+        """Delete the matching holds; returns {book_id: quantity} that the caller must take off books.reserved.
+
+        Deleting with RETURNING means each hold is claimed by exactly one of
+        the sweeper, a new checkout or payment_complete.
+        """
+        from models import StockReservation
+
+        claimed = {}
+        rows = db.session.execute(
+            delete(StockReservation).where(*criteria)
+            .returning(StockReservation.book_id, StockReservation.quantity)
+            .execution_options(synchronize_session=False))
+        for book_id, quantity in rows:
+            claimed[book_id] = claimed.get(book_id, 0) + quantity
+        return claimed
+
+    @staticmethod
+    def unreserve(claimed):
+        """Hand claimed {book_id: quantity} back to the books in one UPDATE"""
+        from models import Book
+
+        if claimed:
+            db.session.execute(
+                update(Book).where(Book.id.in_(list(claimed)))
+                .values(reserved=Book.reserved - case(claimed, value=Book.id, else_=0))
+                .execution_options(synchronize_session=False))
+
+    @classmethod
+    def release(cls, *criteria):
+        """Delete the matching holds and hand their copies back; returns copies released"""
+        claimed = cls.claim(*criteria)
+        cls.unreserve(claimed)
+        return sum(claimed.values())
+
+    @classmethod
+    def release_expired(cls):
+        from models import StockReservation
+
+        return cls.release(StockReservation.expires_at < datetime.utcnow())
+
+    @classmethod
+    def release_for_user(cls, user_id):
+        from models import StockReservation
+
+        return cls.release(StockReservation.user_id == user_id)
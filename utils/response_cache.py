@@ -0,0 +1,67 @@
+import hashlib
+from functools import wraps
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from utils.cache import TTLCache
+from utils.model_events import on_commit
+
+# Query parameters that select what a catalog or detail page shows; anything else is ignored
+CACHE_KEY_PARAMS = ('search', 'tag', 'category', 'sort', 'price_range', 'language', 'page', 'cursor')
+# Stands in for the per-session CSRF token inside cached bodies
+CSRF_PLACEHOLDER = b'__CACHED_CSRF_TOKEN__'
+
+class ResponseCache:
+    """Rendered pages for logged-out visitors, keyed on endpoint and normalized query"""
+
+    _cache = TTLCache(maxsize=512, ttl=60)
+
+    @staticmethod
+    def make_key():
+        params = []
+        for name in CACHE_KEY_PARAMS:
+            value = request.args.get(name, '').strip()
+            if value:
+                params.append((name, value))
+        return (request.endpoint, tuple(sorted(request.view_args.items())), tuple(params))
+
+    @classmethod
+    def clear(cls):
+        cls._cache.clear()
+
+def cache_anonymous_response(f):
+    """Serve a GET view from the response cache for anonymous visitors.
+
+    Responses carry a strong ETag so browsers and proxies can revalidate
+    with If-None-Match and receive a 304 instead of the body. The ETag covers
+    the cached page plus the visitor's CSRF secret, whose signed token is
+    substituted into the page on every hit.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method != 'GET' or current_user.is_authenticated or session.get('_flashes'):
+            return f(*args, **kwargs)
+
+        key = ResponseCache.make_key()
+        entry = ResponseCache._cache.get(key)
+        if entry is None:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            body = response.get_data().replace(generate_csrf().encode(), CSRF_PLACEHOLDER)
+            entry = (body, response.mimetype, hashlib.sha256(body).hexdigest())
+            ResponseCache._cache.set(key, entry)
+
+        body, mimetype, digest = entry
+        token = generate_csrf()
+        response = current_app.response_class(body.replace(CSRF_PLACEHOLDER, token.encode()), mimetype=mimetype)
+        secret = session.get(current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token'), '')
+        response.set_etag(hashlib.sha256(f'{digest}:{secret}'.encode()).hexdigest())
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+    return decorated_function
+
+@on_commit('Book', 'BookFormat', 'BookSeries', 'Category', 'Review', 'Tag')
+def invalidate_responses(changes):
+    ResponseCache.clear()
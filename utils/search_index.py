@@ -0,0 +1,183 @@
+import re
+import time
+import logging
+from sqlalchemy import text, or_, func, inspect, literal_column, Integer, Float
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+class SearchIndex:
+    """Full-text index over the book catalog.
+
+    SQLite uses an external-content FTS5 table kept in sync by triggers on
+    ``books``; PostgreSQL uses a generated ``tsvector`` column with a GIN index.
+    Either way the database maintains the index itself, so inserts and edits
+    from the admin views (or any other writer) are picked up on commit.
+    """
+
+    FTS_TABLE = 'books_fts'
+    # bm25 column weights, in FTS column order: title, author, tags, description
+    BM25_WEIGHTS = (10.0, 6.0, 4.0, 1.0)
+    TS_CONFIG = 'english'
+    # Seconds before a process that found no index looks again, in case another process created it
+    RECHECK_INTERVAL = 60
+
+    _available = None
+    _checked_at = 0
+
+    @staticmethod
+    def tokenize(search_query):
+        """Split a search string into lowercase word tokens safe for MATCH/tsquery"""
+        return re.findall(r'\w+', (search_query or '').lower())
+
+    @classmethod
+    def _sqlite_statements(cls):
+        columns = 'title, author, tags, description'
+        return [
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {cls.FTS_TABLE} USING fts5(
+                {columns},
+                content='books', content_rowid='id',
+                tokenize='porter unicode61'
+            )""",
+            f"""CREATE TRIGGER IF NOT EXISTS {cls.FTS_TABLE}_ai AFTER INSERT ON books BEGIN
+                INSERT INTO {cls.FTS_TABLE}(rowid, {columns})
+                VALUES (new.id, new.title, new.author, new.tags, new.description);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {cls.FTS_TABLE}_ad AFTER DELETE ON books BEGIN
+                INSERT INTO {cls.FTS_TABLE}({cls.FTS_TABLE}, rowid, {columns})
+                VALUES ('delete', old.id, old.title, old.author, old.tags, old.description);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {cls.FTS_TABLE}_au
+                AFTER UPDATE OF title, author, tags, description ON books BEGIN
+                INSERT INTO {cls.FTS_TABLE}({cls.FTS_TABLE}, rowid, {columns})
+                VALUES ('delete', old.id, old.title, old.author, old.tags, old.description);
+                INSERT INTO {cls.FTS_TABLE}(rowid, {columns})
+                VALUES (new.id, new.title, new.author, new.tags, new.description);
+            END""",
+        ]
+
+    @classmethod
+    def _postgres_statements(cls):
+        cfg = cls.TS_CONFIG
+        return [
+            f"""ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('{cfg}', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('{cfg}', coalesce(author, '')), 'B') ||
+                    setweight(to_tsvector('{cfg}', coalesce(tags, '')), 'C') ||
+                    setweight(to_tsvector('{cfg}', coalesce(description, '')), 'D')
+                ) STORED""",
+            "CREATE INDEX IF NOT EXISTS ix_books_search_vector ON books USING GIN (search_vector)",
+        ]
+
+    @classmethod
+    def is_available(cls):
+        """Check whether the full-text index has been created; a missing one is re-checked every RECHECK_INTERVAL"""
+        if cls._available is None or (not cls._available and
+                                      time.monotonic() - cls._checked_at > cls.RECHECK_INTERVAL):
+            cls._checked_at = time.monotonic()
+            try:
+                dialect = db.engine.dialect.name
+                if dialect == 'sqlite':
+                    found = db.session.execute(
+                        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                        {'name': cls.FTS_TABLE}
+                    ).first()
+                elif dialect == 'postgresql':
+                    found = db.session.execute(text("""
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name = 'books' AND column_name = 'search_vector'
+                    """)).first()
+                else:
+                    found = None
+                cls._available = found is not None
+            except Exception as e:
+                logger.error(f"Error checking search index: {str(e)}")
+                db.session.rollback()
+                cls._available = False
+        return cls._available
+
+    @classmethod
+    def ensure_index(cls):
+        """Create the full-text index if missing and backfill it from existing books"""
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            statements = cls._sqlite_statements()
+        elif dialect == 'postgresql':
+            statements = cls._postgres_statements()
+        else:
+            logger.warning(f"Full-text search is not supported on {dialect}")
+            return False
+
+        cls._available = None
+        existed = cls.is_available()
+        for statement in statements:
+            db.session.execute(text(statement))
+        if dialect == 'sqlite' and not existed:
+            cls.rebuild()
+        db.session.commit()
+        cls._available = True
+        return True
+
+    @classmethod
+    def ensure_on_startup(cls):
+        """Create the index when the app starts, unless it exists or the books table does not yet.
+
+        Runs from create_app, so WSGI servers importing app:app get the index
+        too. Never raises: until the index exists, filter() falls back to ilike.
+        """
+        try:
+            if not cls.is_available() and inspect(db.engine).has_table('books'):
+                cls.ensure_index()
+                logger.info("Full-text search index created")
+        except Exception as e:
+            logger.error(f"Error creating search index: {str(e)}")
+            db.session.rollback()
+
+    @classmethod
+    def rebuild(cls):
+        """Re-populate the FTS5 table from ``books`` (the tsvector column needs no rebuild)"""
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(text(f"INSERT INTO {cls.FTS_TABLE}({cls.FTS_TABLE}) VALUES ('rebuild')"))
+
+    @classmethod
+    def filter(cls, query, search_query):
+        """Restrict a Book query to matches for ``search_query``.
+
+        Returns ``(query, rank)`` where ``rank`` is an ORDER BY clause putting the
+        best BM25-style matches first, or ``None`` when falling back to ``ilike``.
+        """
+        from models import Book
+
+        terms = cls.tokenize(search_query)
+        if not terms:
+            return query, None
+
+        if not cls.is_available():
+            conditions = []
+            for term in terms:
+                conditions.append(or_(
+                    Book.title.ilike(f'%{term}%'),
+                    Book.author.ilike(f'%{term}%'),
+                    Book.description.ilike(f'%{term}%'),
+                    Book.tags.ilike(f'%{term}%')
+                ))
+            return query.filter(or_(*conditions)), None
+
+        if db.engine.dialect.name == 'sqlite':
+            # Prefix-match every term, matching books that contain any of them
+            match = ' OR '.join(f'"{term}"*' for term in terms)
+            weights = ', '.join(str(w) for w in cls.BM25_WEIGHTS)
+            matches = text(f"""
+                SELECT rowid AS book_id, bm25({cls.FTS_TABLE}, {weights}) AS rank
+                FROM {cls.FTS_TABLE} WHERE {cls.FTS_TABLE} MATCH :match
+            """).bindparams(match=match).columns(book_id=Integer, rank=Float).subquery('fts')
+            query = query.join(matches, matches.c.book_id == Book.id)
+            # bm25() is negative, lower is a better match
+            return query, matches.c.rank.asc()
+
+        tsquery = func.to_tsquery(cls.TS_CONFIG, ' | '.join(f'{term}:*' for term in terms))
+        search_vector = literal_column('books.search_vector')
+        query = query.filter(search_vector.op('@@')(tsquery))
+        # Normalization 1 divides by 1 + log(document length), like BM25's length penalty
+        return query, func.ts_rank_cd(search_vector, tsquery, 1).desc()
@@ -0,0 +1,94 @@
+import logging
+from flask import session
+from flask_login import current_user
+from sqlalchemy import func
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Session key holding [user_id, cart item count] for the logged-in user
+CART_COUNT_KEY = 'cart_count'
+# One-shot flag telling cart.js that the server merged the guest cart, so it may clear localStorage
+GUEST_CART_MERGED_KEY = 'guest_cart_merged'
+
+class SessionState:
+    """Per-visitor state shown on every page: cart count, wishlist and user info.
+
+    The cart count lives in the signed session cookie, so rendering the navbar
+    costs no query. Cart mutations store the fresh count they already compute,
+    or drop it with invalidate_cart_count to have the next page re-count.
+    """
+
+    @staticmethod
+    def cart_count():
+        from models import CartItem
+
+        if not current_user.is_authenticated:
+            return 0
+        cached = session.get(CART_COUNT_KEY)
+        if cached and cached[0] == current_user.id:
+            return cached[1]
+        count = db.session.query(func.coalesce(func.sum(CartItem.quantity), 0))\
+            .filter(CartItem.user_id == current_user.id).scalar()
+        session[CART_COUNT_KEY] = [current_user.id, int(count)]
+        return int(count)
+
+    @staticmethod
+    def set_cart_count(count):
+        if current_user.is_authenticated:
+            session[CART_COUNT_KEY] = [current_user.id, int(count)]
+
+    @staticmethod
+    def invalidate_cart_count():
+        session.pop(CART_COUNT_KEY, None)
+
+    @staticmethod
+    def mark_guest_cart_merged():
+        session[GUEST_CART_MERGED_KEY] = True
+
+    @staticmethod
+    def pop_guest_cart_merged():
+        # Checking first keeps ordinary renders from marking the session modified and re-sending the cookie
+        if GUEST_CART_MERGED_KEY not in session:
+            return False
+        return session.pop(GUEST_CART_MERGED_KEY)
+
+    @staticmethod
+    def wishlist_book_ids():
+        from models import Wishlist
+
+        if not current_user.is_authenticated:
+            return []
+        return [book_id for (book_id,) in db.session.query(Wishlist.book_id)
+                .filter(Wishlist.user_id == current_user.id).order_by(Wishlist.book_id)]
+
+    @classmethod
+    def snapshot(cls):
+        """Everything client scripts need about the visitor, for /api/session-state"""
+        if not current_user.is_authenticated:
+            return {'authenticated': False, 'user': None, 'cart_count': 0, 'wishlist_book_ids': []}
+        return {
+            'authenticated': True,
+            'user': {
+                'id': current_user.id,
+                'username': current_user.username,
+                'is_admin': bool(current_user.is_admin)
+            },
+            'cart_count': cls.cart_count(),
+            'wishlist_book_ids': cls.wishlist_book_ids()
+        }
+
+def inject_session_state():
+    """Template context processor exposing the cached cart count and the guest cart merge flag.
+
+    Error pages render through it too, so a failing database must not raise
+    here again; the badge is simply left empty.
+    """
+    try:
+        cart_count = SessionState.cart_count()
+    except Exception as e:
+        logger.error(f"Error loading cart count: {str(e)}")
+        db.session.rollback()
+        cart_count = 0
+    return {'cart_count': cart_count,
+            'guest_cart_merged': SessionState.pop_guest_cart_merged()}
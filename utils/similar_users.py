@@ -0,0 +1,120 @@
+import time
+import logging
+import threading
+from flask import current_app
+from utils.lsh import LSHIndex
+from utils.preferences import PreferenceProfile, on_profile_change
+
+logger = logging.getLogger(__name__)
+
+class SimilarUsers:
+    """Similar-reader lookup through MinHash/LSH over category, tag and author preferences.
+
+    Each user's stored preference profile is kept in memory and its key set
+    indexed in LSH buckets. A lookup probes the buckets for candidates and
+    re-ranks only those by the exact overlap score, summing the smaller of
+    the two weights over shared preferences. Users whose profile changes are
+    re-indexed on the next lookup. Only the first lookup in a process indexes
+    everyone inline; after MAX_AGE, a background thread rebuilds the index to
+    pick up changes committed by other worker processes and swaps it in, while
+    lookups keep using the old one.
+    """
+
+    MAX_CANDIDATES = 200
+    MAX_AGE = 900
+
+    _lock = threading.Lock()
+    _index = LSHIndex()
+    _preferences = {}
+    _stale = set()
+    _loaded_at = None
+    _reloading = False
+    # Users re-indexed into the old index while a background rebuild was running
+    _resync = set()
+
+    @classmethod
+    def _refresh(cls, user_ids):
+        profiles = PreferenceProfile.load(user_ids)
+        for user_id in user_ids:
+            preferences = profiles.get(user_id)
+            if preferences:
+                cls._preferences[user_id] = preferences
+                cls._index.add(user_id, preferences)
+            else:
+                cls._preferences.pop(user_id, None)
+                cls._index.remove(user_id)
+
+    @classmethod
+    def _build(cls):
+        """A new (index, preferences) pair over every user's profile"""
+        index = LSHIndex(cls._index.hasher)
+        preferences = PreferenceProfile.load()
+        for user_id, profile in preferences.items():
+            index.add(user_id, profile)
+        return index, preferences
+
+    @classmethod
+    def _reload(cls, app):
+        try:
+            with app.app_context():
+                index, preferences = cls._build()
+            with cls._lock:
+                cls._index, cls._preferences = index, preferences
+                # The rebuild may have read their profiles before the change that marked them
+                cls._stale.update(cls._resync)
+                cls._resync = set()
+                cls._loaded_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error rebuilding similar users index: {str(e)}")
+        finally:
+            cls._reloading = False
+
+    @classmethod
+    def _sync(cls):
+        """Index every user on first use, otherwise only stale users; MAX_AGE rebuilds run in the background"""
+        if cls._loaded_at is None:
+            with cls._lock:
+                if cls._loaded_at is None:
+                    cls._stale.clear()
+                    cls._index, cls._preferences = cls._build()
+                    cls._loaded_at = time.monotonic()
+        elif time.monotonic() - cls._loaded_at > cls.MAX_AGE and not cls._reloading:
+            with cls._lock:
+                if not cls._reloading:
+                    cls._reloading = True
+                    cls._resync = set()
+                    threading.Thread(target=cls._reload, args=(current_app._get_current_object(),),
+                                     daemon=True).start()
+        if cls._stale:
+            with cls._lock:
+                stale, cls._stale = cls._stale, set()
+                cls._refresh(stale)
+                if cls._reloading:
+                    cls._resync.update(stale)
+
+    @staticmethod
+    def overlap(mine, theirs):
+        return sum(min(weight, theirs[key]) for key, weight in mine.items() if key in theirs)
+
+    @classmethod
+    def similar(cls, user_id, limit=5):
+        """Ids of the users whose preferences overlap most with user_id's, best first"""
+        cls._sync()
+        mine = cls._preferences.get(user_id)
+        if not mine:
+            return []
+        scored = []
+        for other_id in cls._index.candidates(mine, exclude=user_id, limit=cls.MAX_CANDIDATES):
+            theirs = cls._preferences.get(other_id)
+            score = cls.overlap(mine, theirs) if theirs else 0
+            if score > 0:
+                scored.append((-score, other_id))
+        return [other_id for _, other_id in sorted(scored)[:limit]]
+
+    @classmethod
+    def mark_stale(cls, user_ids):
+        cls._stale.update(user_ids)
+
+@on_profile_change
+def mark_users_stale(user_ids):
+    SimilarUsers.mark_stale(user_ids)
@@ -0,0 +1,245 @@
+import re
+import math
+import logging
+from datetime import datetime
+from collections import Counter
+import numpy as np
+from sqlalchemy import select, delete, insert, func
+from extensions import db
+from utils.model_events import on_commit
+from utils.ann import RandomProjectionIndex
+from utils.bulk import upsert_statement
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have he her his in into is it its of on or
+she that the their them they this to was were which who will with you your
+""".split())
+
+class SimilarityEngine:
+    """Content-based similar books from TF-IDF vectors of book metadata.
+
+    Each book becomes a sparse bag of description words plus prefixed tag,
+    author and category terms, weighted by TF-IDF and L2-normalized so a dot
+    product is the cosine similarity. The top TOP_K neighbours of every book
+    are stored in book_similarities, so serving them is one primary-key lookup.
+    Book edits only queue their ids; refreshing the neighbours takes a pass
+    over the catalog, so build_similarities.py --pending does it off the
+    request path.
+    """
+
+    TOP_K = 10
+    # Columns of the dense book x term matrix: 4 bytes x books x MAX_FEATURES of memory
+    MAX_FEATURES = 4096
+    # Structured fields say more about a book than any single description word
+    FIELD_WEIGHTS = {'tag': 3.0, 'author': 2.0, 'category': 2.0}
+    # Rows of the similarity matrix computed at once, bounding memory to BATCH_SIZE x books
+    BATCH_SIZE = 256
+    # Whole-catalog rebuilds at least this large take candidates from an LSH index
+    # instead of scoring every pair; incremental refreshes stay exact
+    ANN_MIN_BOOKS = 20000
+    ANN_PROBES = 2
+
+    @staticmethod
+    def words(value):
+        return [word for word in re.findall(r'[a-z0-9]+', (value or '').lower())
+                if len(word) > 2 and word not in STOP_WORDS]
+
+    @classmethod
+    def document(cls, description, tags, author, category):
+        """Weighted term frequencies for one book"""
+        terms = Counter()
+        for word, count in Counter(cls.words(description)).items():
+            terms[word] = 1 + math.log(count)
+        for tag in (tags or '').split(','):
+            tag = tag.strip().lower()
+            if tag:
+                terms[f'tag:{tag}'] = cls.FIELD_WEIGHTS['tag']
+        if author:
+            terms[f'author:{author.strip().lower()}'] = cls.FIELD_WEIGHTS['author']
+        if category:
+            terms[f'category:{category.strip().lower()}'] = cls.FIELD_WEIGHTS['category']
+        return terms
+
+    @classmethod
+    def vectorize(cls, rows):
+        """Book ids and their L2-normalized TF-IDF matrix from (id, description, tags, author, category) rows"""
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        documents = [cls.document(*row[1:]) for row in rows]
+        df = Counter(term for document in documents for term in document)
+        n = len(documents)
+        idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+
+        # A term found in one book cannot link it to another, so only shared terms
+        # get a column; norms still include every term so unique text dilutes similarity
+        shared = [term for term, count in df.most_common(cls.MAX_FEATURES) if count > 1]
+        columns = {term: i for i, term in enumerate(shared)}
+        matrix = np.zeros((n, len(columns)), dtype=np.float32)
+        for i, document in enumerate(documents):
+            weights = {term: tf * idf[term] for term, tf in document.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for term, weight in weights.items():
+                column = columns.get(term)
+                if column is not None:
+                    matrix[i, column] = weight / norm
+        return ids, matrix
+
+    @classmethod
+    def neighbours(cls, ids, matrix, positions):
+        """{book_id: [(similar_book_id, score), ...]} for the books at the given matrix positions"""
+        result = {}
+        k = min(cls.TOP_K, len(ids) - 1)
+        if len(ids) >= cls.ANN_MIN_BOOKS and len(positions) >= cls.ANN_MIN_BOOKS:
+            index = RandomProjectionIndex.build(ids, matrix)
+            for position in positions:
+                book_id = int(ids[position])
+                similar_ids, scores = index.query(matrix[position], k=k, probes=cls.ANN_PROBES,
+                                                  metric='dot', exclude=book_id)
+                result[book_id] = [(int(similar_id), float(score))
+                                   for similar_id, score in zip(similar_ids, scores) if score > 0]
+            return result
+        for start in range(0, len(positions), cls.BATCH_SIZE):
+            batch = np.asarray(positions[start:start + cls.BATCH_SIZE])
+            scores = matrix[batch] @ matrix.T
+            scores[np.arange(len(batch)), batch] = -1.0
+            if k <= 0:
+                result.update((int(ids[p]), []) for p in batch)
+                continue
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, position in enumerate(batch):
+                order = top[row][np.argsort(-scores[row, top[row]])]
+                result[int(ids[position])] = [(int(ids[j]), float(scores[row, j]))
+                                              for j in order if scores[row, j] > 0]
+        return result
+
+    @staticmethod
+    def _load(conn):
+        from models import Book
+
+        return conn.execute(select(Book.id, Book.description, Book.tags, Book.author, Book.category)
+                            .order_by(Book.id)).all()
+
+    @staticmethod
+    def _write(conn, neighbours):
+        from models import BookSimilarity
+
+        conn.execute(delete(BookSimilarity).where(BookSimilarity.book_id.in_(list(neighbours))))
+        rows = [{'book_id': book_id, 'rank': rank, 'similar_book_id': similar_id, 'score': score}
+                for book_id, similar in neighbours.items()
+                for rank, (similar_id, score) in enumerate(similar)]
+        if rows:
+            conn.execute(insert(BookSimilarity), rows)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the neighbour table for every book; returns the number of books indexed"""
+        from models import BookSimilarity, PendingSimilarity
+
+        started = datetime.utcnow()
+        with db.engine.begin() as conn:
+            rows = cls._load(conn)
+            conn.execute(delete(BookSimilarity))
+            if rows:
+                ids, matrix = cls.vectorize(rows)
+                cls._write(conn, cls.neighbours(ids, matrix, list(range(len(ids)))))
+            # This pass covered everything queued before it started
+            conn.execute(delete(PendingSimilarity).where(PendingSimilarity.queued_at <= started))
+        return len(rows)
+
+    @staticmethod
+    def enqueue(changed_ids, deleted_ids=()):
+        """Queue books for the next refresh pass; cheap enough to run after every commit"""
+        from models import PendingSimilarity
+
+        now = datetime.utcnow()
+        rows = [{'book_id': book_id, 'deleted': book_id in deleted_ids, 'queued_at': now}
+                for book_id in sorted(set(changed_ids) | set(deleted_ids))]
+        if rows:
+            with db.engine.begin() as conn:
+                conn.execute(upsert_statement(PendingSimilarity, rows, keys=('book_id',),
+                                              replace=('deleted', 'queued_at')))
+
+    @classmethod
+    def process_pending(cls):
+        """Refresh the neighbours of every queued book; returns the number of books recomputed"""
+        from models import PendingSimilarity
+
+        with db.engine.connect() as conn:
+            queued = conn.execute(select(PendingSimilarity.book_id, PendingSimilarity.deleted,
+                                         PendingSimilarity.queued_at)).all()
+        if not queued:
+            return 0
+        count = cls.refresh({book_id for book_id, deleted, _ in queued if not deleted},
+                            {book_id for book_id, deleted, _ in queued if deleted})
+        # Books queued again while this ran stay for the next pass
+        latest = max(queued_at for _, _, queued_at in queued)
+        with db.engine.begin() as conn:
+            conn.execute(delete(PendingSimilarity).where(
+                PendingSimilarity.book_id.in_([book_id for book_id, _, _ in queued]),
+                PendingSimilarity.queued_at <= latest))
+        return count
+
+    @classmethod
+    def refresh(cls, changed_ids, deleted_ids=()):
+        """Update the neighbour table after books were added, edited or deleted.
+
+        Recomputes the changed books plus every book whose top-k list they
+        leave or enter. Other books keep scores from the IDF weights of their
+        last computation until the next full rebuild.
+        """
+        from models import BookSimilarity
+
+        changed_ids, deleted_ids = set(changed_ids) - set(deleted_ids), set(deleted_ids)
+        with db.engine.begin() as conn:
+            rows = cls._load(conn)
+            if deleted_ids:
+                referencing = conn.execute(select(BookSimilarity.book_id).distinct()
+                                           .where(BookSimilarity.similar_book_id.in_(deleted_ids))).scalars()
+                changed_ids.update(referencing)
+                conn.execute(delete(BookSimilarity).where(BookSimilarity.book_id.in_(deleted_ids) |
+                                                          BookSimilarity.similar_book_id.in_(deleted_ids)))
+            if not rows:
+                return 0
+            ids, matrix = cls.vectorize(rows)
+            position_of = {int(book_id): i for i, book_id in enumerate(ids)}
+            changed = [position_of[book_id] for book_id in changed_ids if book_id in position_of]
+            if not changed:
+                return 0
+
+            # Books whose list mentions a changed book, or whose k-th best score it now beats
+            affected = set(changed)
+            referencing = conn.execute(select(BookSimilarity.book_id).distinct()
+                                       .where(BookSimilarity.similar_book_id.in_(changed_ids))).scalars()
+            affected.update(position_of[book_id] for book_id in referencing if book_id in position_of)
+            thresholds = np.zeros(len(ids), dtype=np.float32)
+            for book_id, lowest, count in conn.execute(
+                    select(BookSimilarity.book_id, func.min(BookSimilarity.score), func.count())
+                    .group_by(BookSimilarity.book_id)):
+                if book_id in position_of and count >= cls.TOP_K:
+                    thresholds[position_of[book_id]] = lowest
+            best = np.zeros(len(ids), dtype=np.float32)
+            for start in range(0, len(changed), cls.BATCH_SIZE):
+                scores = matrix[changed[start:start + cls.BATCH_SIZE]] @ matrix.T
+                best = np.maximum(best, scores.max(axis=0))
+            affected.update(np.flatnonzero(best > thresholds).tolist())
+
+            cls._write(conn, cls.neighbours(ids, matrix, sorted(affected)))
+        return len(affected)
+
+    @classmethod
+    def ensure_index(cls):
+        """Build the neighbour table if it is empty"""
+        from models import Book, BookSimilarity
+
+        if db.session.query(BookSimilarity.book_id).first() is None and db.session.query(Book.id).first():
+            cls.rebuild()
+        return True
+
+@on_commit('Book')
+def queue_similarity_refresh(changes):
+    changed = {change.id for change in changes
+               if change.op == 'insert' or change.attrs & {'description', 'tags', 'author', 'category'}}
+    deleted = {change.id for change in changes if change.op == 'delete'}
+    if changed or deleted:
+        SimilarityEngine.enqueue(changed, deleted)
@@ -0,0 +1,124 @@
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from extensions import db
+from utils.model_events import on_commit
+
+class SuggestIndex:
+    """In-memory prefix index over book titles, authors and tags for typeahead.
+
+    Terms live in one sorted list of (term, book_id) pairs, so a lookup is a
+    bisect to the first term >= prefix followed by a short forward scan. Full
+    normalized titles and author names are indexed alongside their individual
+    words, so multi-word prefixes like "clean co" match too. Changed books are
+    re-read in a single query on the next lookup after their commit; commits
+    in other worker processes are picked up by a full reload after MAX_AGE.
+    """
+
+    MIN_PREFIX = 2
+    MAX_AGE = 300
+
+    _lock = threading.Lock()
+    _terms = []
+    _books = {}
+    _stale = set()
+    _loaded_at = None
+
+    @staticmethod
+    def normalize(value):
+        """Lowercase, strip accents and collapse punctuation to single spaces"""
+        value = unicodedata.normalize('NFKD', value or '')
+        value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+        return ' '.join(re.findall(r'\w+', value.lower()))
+
+    @classmethod
+    def _terms_for(cls, title, author, tags):
+        terms = set()
+        for field in (title, author):
+            normalized = cls.normalize(field)
+            if normalized:
+                terms.add(normalized)
+                terms.update(normalized.split())
+        for tag in (tags or '').split(','):
+            normalized = cls.normalize(tag)
+            if normalized:
+                terms.add(normalized)
+        return terms
+
+    @classmethod
+    def _remove(cls, book_id):
+        entry = cls._books.pop(book_id, None)
+        if not entry:
+            return
+        for term in entry['terms']:
+            position = bisect_left(cls._terms, (term, book_id))
+            if position < len(cls._terms) and cls._terms[position] == (term, book_id):
+                del cls._terms[position]
+
+    @classmethod
+    def _add(cls, book_id, title, author, tags):
+        terms = cls._terms_for(title, author, tags)
+        cls._books[book_id] = {'title': title, 'author': author, 'terms': terms}
+        for term in terms:
+            insort(cls._terms, (term, book_id))
+
+    @classmethod
+    def _sync(cls):
+        """Load the index on first use or after MAX_AGE, otherwise re-read only books changed since"""
+        from models import Book
+
+        def expired():
+            return cls._loaded_at is None or time.monotonic() - cls._loaded_at > cls.MAX_AGE
+
+        if not expired() and not cls._stale:
+            return
+        with cls._lock:
+            if expired():
+                rows = db.session.query(Book.id, Book.title, Book.author, Book.tags).all()
+                cls._books = {}
+                entries = []
+                for book_id, title, author, tags in rows:
+                    terms = cls._terms_for(title, author, tags)
+                    cls._books[book_id] = {'title': title, 'author': author, 'terms': terms}
+                    entries.extend((term, book_id) for term in terms)
+                cls._terms = sorted(entries)
+                cls._stale.clear()
+                cls._loaded_at = time.monotonic()
+                return
+            stale, cls._stale = cls._stale, set()
+            rows = db.session.query(Book.id, Book.title, Book.author, Book.tags)\
+                             .filter(Book.id.in_(stale)).all()
+            for book_id in stale:
+                cls._remove(book_id)
+            for book_id, title, author, tags in rows:
+                cls._add(book_id, title, author, tags)
+
+    @classmethod
+    def suggest(cls, prefix, limit=8):
+        """Books whose title, author or a tag starts with prefix, without a database round trip"""
+        prefix = cls.normalize(prefix)
+        if len(prefix) < cls.MIN_PREFIX:
+            return []
+        cls._sync()
+        suggestions = []
+        seen = set()
+        with cls._lock:
+            position = bisect_left(cls._terms, (prefix,))
+            while position < len(cls._terms) and len(suggestions) < limit:
+                term, book_id = cls._terms[position]
+                if not term.startswith(prefix):
+                    break
+                if book_id not in seen:
+                    seen.add(book_id)
+                    entry = cls._books[book_id]
+                    suggestions.append({'id': book_id, 'title': entry['title'], 'author': entry['author']})
+                position += 1
+        return suggestions
+
+@on_commit('Book')
+def mark_books_stale(changes):
+    for change in changes:
+        if change.op != 'update' or change.attrs & {'title', 'author', 'tags'}:
+            SuggestIndex._stale.add(change.id)
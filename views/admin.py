@@ -63,9 +63,9 @@ def add_book():
                 publisher=form.publisher.data,
                 publication_date=form.publication_date.data,
                 page_count=form.page_count.data,
-                language=form.language.data,
-                tags=form.tags.data
+                language=form.language.data
             )
+            book.set_tags(form.tags.data)
 
             # Validate and handle series information
             if form.series_id.data:
@@ -153,7 +153,7 @@ def edit_book(book_id):
             book.publication_date = form.publication_date.data
             book.page_count = form.page_count.data
             book.language = form.language.data
-            book.tags = form.tags.data
+            book.set_tags(form.tags.data)
             
             # Update series information
             book.series_id = form.series_id.data
@@ -1,11 +1,33 @@
+import logging
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from models import db, User, UserActivity
 from forms import LoginForm, RegisterForm
 from utils.activity_logger import log_user_activity
+from utils.cart_service import CartService
+from utils.session_state import SessionState
 
 auth = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
+
+def merge_guest_cart(user, payload):
+    """Move the guest cart posted with the login or register form into the user's cart.
+
+    Committed together with the activity log entry that follows. Only a
+    successful merge lets cart.js clear the guest cart from localStorage.
+    """
+    if not payload:
+        return
+    try:
+        if CartService.merge_guest_cart(user.id, payload):
+            SessionState.invalidate_cart_count()
+        SessionState.mark_guest_cart_merged()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error merging guest cart: {str(e)}")
+        flash('We could not move the books from your guest cart into your account. '
+              'They are kept in this browser for now.', 'warning')
 
 @auth.route('/login', methods=['GET', 'POST'])
 def login():
@@ -17,6 +39,7 @@ def login():
         user = User.query.filter(User.email.ilike(form.email.data)).first()
         if user and check_password_hash(user.password_hash, form.password.data):
             login_user(user)
+            merge_guest_cart(user, form.guest_cart.data)
             log_user_activity(user, 'user_login', 'User logged in')
             flash('Logged in successfully!', 'success')
             
@@ -55,8 +78,9 @@ def register():
         db.session.add(user)
         db.session.commit()
         
-        log_user_activity(user, 'user_register', 'User registered')
         login_user(user)
+        merge_guest_cart(user, form.guest_cart.data)
+        log_user_activity(user, 'user_register', 'User registered')
         flash('Registration successful!', 'success')
         return redirect(url_for('main.index'))
     return render_template('auth/register.html', form=form)
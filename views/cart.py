@@ -1,19 +1,25 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, session
 from flask_login import login_required, current_user
-from models import CartItem, Book, Order, OrderItem, db
+from models import CartItem, Book, Order, db
 from utils.activity_logger import log_user_activity
+from utils.session_state import SessionState
+from utils.cart_service import CartService
+from utils.reservations import StockReservations
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 import stripe
-from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 cart = Blueprint('cart', __name__, url_prefix='/cart')
 
+# Guests keep their cart in localStorage (static/js/cart.js); these pages serve it without the database
+GUEST_ENDPOINTS = {'cart.view_cart', 'cart.get_cart_count'}
+
 @cart.before_request
 def require_login():
-    """Ensure all cart routes require authentication"""
-    if not current_user.is_authenticated:
+    """Ensure all cart routes except the guest cart pages require authentication"""
+    if not current_user.is_authenticated and request.endpoint not in GUEST_ENDPOINTS:
         if request.is_json:
             return jsonify({'success': False, 'error': 'Authentication required', 'redirect': url_for('auth.login')}), 401
         # Store the full path (including query parameters) in session for post-login redirect
@@ -22,9 +28,12 @@ def require_login():
 
 @cart.route('/')
 def view_cart():
+    if not current_user.is_authenticated:
+        # Rendered by cart.js from the guest cart; merged into cart_items at login
+        return render_template('cart/cart.html', guest=True, cart_items=[], total=0)
     try:
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-        total = sum(item.total for item in cart_items)
+        cart_items = CartService.items(current_user.id)
+        _, total = CartService.totals(cart_items)
         return render_template('cart/cart.html', cart_items=cart_items, total=total)
     except Exception as e:
         db.session.rollback()
@@ -35,12 +44,12 @@ def view_cart():
 @cart.route('/checkout')
 def checkout():
     try:
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+        cart_items = CartService.items(current_user.id)
         if not cart_items:
             flash('Your cart is empty.', 'warning')
             return redirect(url_for('main.index'))
             
-        total = sum(item.total for item in cart_items)
+        _, total = CartService.totals(cart_items)
         stripe_key = current_app.config.get('STRIPE_PUBLISHABLE_KEY')
         if not stripe_key:
             flash('Payment system is not properly configured.', 'danger')
@@ -66,12 +75,29 @@ def create_payment_intent():
             logger.error("Stripe secret key not configured")
             return jsonify({'success': False, 'error': 'Payment system not properly configured'}), 500
 
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-        if not cart_items:
+        count, total = CartService.summary(current_user.id)
+        if not count:
             return jsonify({'success': False, 'error': 'Cart is empty'}), 400
 
-        total = sum(item.total for item in cart_items)
-        amount = int(total * 100)  # Convert to cents for Stripe
+        amount = int(round(total * 100))  # Convert to cents for Stripe
+
+        # Hold the stock for this checkout, replacing holds from earlier attempts
+        quantities = dict(db.session.query(CartItem.book_id, CartItem.quantity)
+                          .filter(CartItem.user_id == current_user.id))
+        StockReservations.release_expired()
+        # Cancel the intents of earlier attempts, e.g. another tab, so they cannot be paid without a hold
+        for superseded_id in StockReservations.payment_intents(current_user.id):
+            try:
+                stripe.PaymentIntent.cancel(superseded_id)
+            except stripe.error.StripeError as e:
+                logger.warning(f"Could not cancel payment intent {superseded_id}: {str(e)}")
+        StockReservations.release_for_user(current_user.id)
+        short = StockReservations.hold(current_user.id, quantities)
+        if short:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Some items in your cart are no longer available.',
+                            'book_ids': short}), 409
+        db.session.commit()
 
         # Create payment intent
         try:
@@ -83,16 +109,28 @@ def create_payment_intent():
                     'email': current_user.email
                 }
             )
+            StockReservations.attach(current_user.id, intent.id)
+            db.session.commit()
             return jsonify({
                 'success': True,
                 'clientSecret': intent.client_secret
             })
         except stripe.error.StripeError as e:
             logger.error(f"Stripe error: {str(e)}")
+            StockReservations.release_for_user(current_user.id)
+            db.session.commit()
             return jsonify({'success': False, 'error': str(e)}), 400
 
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Error creating payment intent: {str(e)}")
+        # Holds committed before the failure would hide the copies from other shoppers until they expire
+        try:
+            StockReservations.release_for_user(current_user.id)
+            db.session.commit()
+        except Exception as release_error:
+            db.session.rollback()
+            logger.error(f"Error releasing stock holds: {str(release_error)}")
         return jsonify({'success': False, 'error': 'Failed to initialize payment'}), 500
 
 @cart.route('/payment-complete')
@@ -103,6 +141,15 @@ def payment_complete():
             flash('Invalid payment session.', 'danger')
             return redirect(url_for('cart.checkout'))
 
+        # Refreshing the return URL finds the order this payment already placed
+        placed_by = db.session.query(Order.user_id).filter_by(payment_intent_id=payment_intent_id).scalar()
+        if placed_by is not None:
+            if placed_by != current_user.id:
+                flash('Invalid payment session.', 'danger')
+                return redirect(url_for('cart.checkout'))
+            flash('Your order has already been placed.', 'info')
+            return redirect(url_for('main.orders'))
+
         stripe.api_key = current_app.config.get('STRIPE_SECRET_KEY')
         try:
             payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
@@ -115,44 +162,36 @@ def payment_complete():
             flash('Payment was not successful.', 'danger')
             return redirect(url_for('cart.checkout'))
 
-        # Create order
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-        total = sum(item.total for item in cart_items)
-
-        order = Order(
-            user_id=current_user.id,
-            total=total,
-            status='processing',
-            payment_intent_id=payment_intent_id,
-            payment_status='paid',
-            payment_method='card',
-            payment_date=datetime.utcnow()
-        )
-
-        # Add order items and update stock
-        for cart_item in cart_items:
-            order_item = OrderItem(
-                book_id=cart_item.book_id,
-                quantity=cart_item.quantity,
-                price=cart_item.book.price
-            )
-            order.items.append(order_item)
-            
-            # Update stock
-            cart_item.book.stock -= cart_item.quantity
-            if cart_item.book.stock < 0:
+        cart_items = CartService.items(current_user.id)
+        if not cart_items:
+            flash('Your cart is empty.', 'warning')
+            return redirect(url_for('cart.view_cart'))
+
+        try:
+            order = CartService.place_order(current_user.id, payment_intent_id, cart_items)
+            if order is None:
+                # The hold lapsed and the copies sold elsewhere, but the card was already charged
                 db.session.rollback()
-                flash('Some items in your cart are no longer available.', 'danger')
+                try:
+                    stripe.Refund.create(payment_intent=payment_intent_id)
+                    flash('Some items in your cart are no longer available. Your payment has been refunded.', 'danger')
+                except stripe.error.StripeError as e:
+                    logger.error(f"Refund failed for payment intent {payment_intent_id}: {str(e)}")
+                    flash('Some items in your cart are no longer available. '
+                          'Please contact support for a refund of your payment.', 'danger')
                 return redirect(url_for('cart.view_cart'))
+            log_user_activity(current_user, 'order_created', f'Created order #{order.id}', commit=False)
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            # A concurrent request for the same payment placed the order first
+            if db.session.query(Order.id).filter_by(payment_intent_id=payment_intent_id,
+                                                    user_id=current_user.id).scalar() is not None:
+                flash('Your order has already been placed.', 'info')
+                return redirect(url_for('main.orders'))
+            raise e
+        SessionState.set_cart_count(0)
 
-        # Clear cart
-        for item in cart_items:
-            db.session.delete(item)
-
-        db.session.add(order)
-        db.session.commit()
-
-        log_user_activity(current_user, 'order_created', f'Created order #{order.id}')
         flash('Thank you for your purchase! Your order has been placed.', 'success')
         return redirect(url_for('main.orders'))
 
@@ -165,11 +204,7 @@ def payment_complete():
 @cart.route('/count')
 def get_cart_count():
     try:
-        if not current_user.is_authenticated:
-            return jsonify({'success': True, 'count': 0})
-            
-        count = CartItem.query.filter_by(user_id=current_user.id).with_entities(func.sum(CartItem.quantity)).scalar() or 0
-        return jsonify({'success': True, 'count': int(count)})
+        return jsonify({'success': True, 'count': SessionState.cart_count()})
     except Exception as e:
         logger.error(f"Error in get_cart_count: {str(e)}")
         db.session.rollback()
@@ -187,14 +222,15 @@ def add_to_cart():
             
         book_id = data['book_id']
         book = Book.query.get_or_404(book_id)
+        available, _ = CartService.lines(current_user.id, [book.id])[book.id]
         
-        if not book.stock:
+        if not available:
             return jsonify({'success': False, 'error': 'Book is out of stock'}), 400
 
         cart_item = CartItem.query.filter_by(user_id=current_user.id, book_id=book_id).first()
         
         if cart_item:
-            if cart_item.quantity >= book.stock:
+            if cart_item.quantity >= available:
                 return jsonify({'success': False, 'error': 'Not enough stock available'})
             cart_item.quantity += 1
         else:
@@ -205,12 +241,46 @@ def add_to_cart():
         log_user_activity(current_user, 'cart_add', f'Added book #{book_id} to cart')
         
         count = CartItem.query.filter_by(user_id=current_user.id).with_entities(func.sum(CartItem.quantity)).scalar() or 0
+        SessionState.set_cart_count(count)
         return jsonify({'success': True, 'count': int(count)})
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error in add_to_cart: {str(e)}")
         return jsonify({'success': False, 'error': 'Failed to add item to cart'}), 500
 
+@cart.route('/batch', methods=['POST'])
+def batch_update_cart():
+    """Add or set several books in one request: {"items": [{"book_id", "quantity"}], "mode": "add"|"set"}"""
+    try:
+        if not request.is_json:
+            return jsonify({'success': False, 'error': 'Invalid request format'}), 400
+
+        data = request.get_json()
+        mode = data.get('mode', 'add') if isinstance(data, dict) else None
+        if mode not in ('add', 'set'):
+            return jsonify({'success': False, 'error': 'Invalid request data'}), 400
+        try:
+            quantities = CartService.parse_items(data.get('items'), replace=(mode == 'set'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        missing, unavailable = CartService.apply_batch(current_user.id, quantities, replace=(mode == 'set'))
+        if missing:
+            return jsonify({'success': False, 'error': 'Book not found', 'book_ids': missing}), 404
+        if unavailable:
+            return jsonify({'success': False, 'error': 'Not enough stock available', 'book_ids': unavailable})
+
+        log_user_activity(current_user, 'cart_batch', f'Updated {len(quantities)} books in cart', commit=False)
+        db.session.commit()
+
+        count, total = CartService.summary(current_user.id)
+        SessionState.set_cart_count(count)
+        return jsonify({'success': True, 'count': count, 'total': total})
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error in batch_update_cart: {str(e)}")
+        return jsonify({'success': False, 'error': 'Failed to update cart'}), 500
+
 @cart.route('/update/<int:item_id>', methods=['POST'])
 def update_cart(item_id):
     try:
@@ -225,23 +295,15 @@ def update_cart(item_id):
         if quantity < 0:
             return jsonify({'success': False, 'error': 'Invalid quantity'}), 400
 
-        cart_item = CartItem.query.filter_by(id=item_id, user_id=current_user.id).first_or_404()
-        
-        if quantity > cart_item.book.stock:
+        book_id, count, total = CartService.set_quantity(current_user.id, item_id, quantity)
+        if book_id is None:
+            # Nothing matched: either not this user's line (404) or not enough stock
+            CartItem.query.filter_by(id=item_id, user_id=current_user.id).first_or_404()
             return jsonify({'success': False, 'error': 'Not enough stock available'})
-        
-        if quantity == 0:
-            db.session.delete(cart_item)
-        else:
-            cart_item.quantity = quantity
             
         db.session.commit()
-        log_user_activity(current_user, 'cart_update', f'Updated quantity for book #{cart_item.book_id}')
-        
-        # Calculate new total
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-        total = sum(item.total for item in cart_items)
-        count = sum(item.quantity for item in cart_items)
+        log_user_activity(current_user, 'cart_update', f'Updated quantity for book #{book_id}')
+        SessionState.set_cart_count(count)
         
         return jsonify({
             'success': True, 
@@ -264,6 +326,7 @@ def remove_from_cart(item_id):
         
         # Get updated cart count
         count = CartItem.query.filter_by(user_id=current_user.id).with_entities(func.sum(CartItem.quantity)).scalar() or 0
+        SessionState.set_cart_count(count)
         return jsonify({'success': True, 'count': int(count)})
     except Exception as e:
         db.session.rollback()
@@ -1,45 +1,88 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import login_required, current_user
-from models import db, Book, Review, Order, OrderItem, Wishlist, ReadingList, ReadingListItem, UserActivity
+from models import db, Book, Tag, Review, Order, OrderItem, Wishlist, ReadingList, ReadingListItem, UserActivity
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import func, or_
+from sqlalchemy.orm import selectinload, joinedload
 from forms import ReviewForm, ProfileUpdateForm
 from utils.activity_logger import log_user_activity
+from utils.search_index import SearchIndex
+from utils.suggest_index import SuggestIndex
+from utils.fuzzy_search import FuzzySearch
+from utils.reference_cache import ReferenceCache
+from utils.facets import FacetEngine
+from utils.response_cache import cache_anonymous_response
+from utils.query_budget import query_budget
+from utils.session_state import SessionState
+from utils.pagination import cached_count, keyset_paginate, encode_cursor, order_clauses
 
 main = Blueprint('main', __name__)
 
+# Book, reviews with authors, formats, similar books, wishlist check and the logged-in user
+DETAIL_QUERY_BUDGET = 8
+
+# Catalog sort orders as (column, descending) keys; each ends in a unique column for keyset paging
+CATALOG_SORTS = {
+    'price_low': [(Book.price, False), (Book.id, False)],
+    'price_high': [(Book.price, True), (Book.id, True)],
+    'newest': [(Book.created_at, True), (Book.id, True)],
+    'rating': [(Book.rating_avg, True), (Book.id, True)],
+    'relevance': [(Book.id, False)],
+}
+
 @main.route('/')
+@cache_anonymous_response
 def index():
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     per_page = 12
     
     # Get featured books for carousel
-    featured_books = Book.query.filter_by(is_featured=True).limit(5).all()
+    featured_books = ReferenceCache.get_featured_books()
     
     # Get categories for the filter dropdown
-    categories = ['All Categories'] + [cat[0] for cat in Book.query.with_entities(Book.category).distinct() if cat[0]]
+    categories = ['All Categories'] + ReferenceCache.get_categories()
     
     # Get filter parameters
     search_query = request.args.get('search', '')
     current_category = request.args.get('category', 'All Categories')
     sort_by = request.args.get('sort', 'relevance')
     price_range = request.args.get('price_range', '')
+    current_language = request.args.get('language', '')
+    current_tag = request.args.get('tag', '')
     
     # Build the query
     query = Book.query
     
     # Apply search filter
+    search_rank = None
+    fuzzy_search = False
     if search_query:
-        search_terms = search_query.split()
-        conditions = []
-        for term in search_terms:
-            conditions.append(or_(
-                Book.title.ilike(f'%{term}%'),
-                Book.author.ilike(f'%{term}%'),
-                Book.description.ilike(f'%{term}%'),
-                Book.tags.ilike(f'%{term}%')
-            ))
-        query = query.filter(or_(*conditions))
+        query, search_rank = SearchIndex.filter(query, search_query)
+        
+        # Fall back to typo-tolerant matching when the exact search finds almost nothing
+        exact_ids = [book_id for (book_id,) in query.with_entities(Book.id).order_by(search_rank)
+                                                     .limit(FuzzySearch.MIN_EXACT_HITS)]
+        if len(exact_ids) < FuzzySearch.MIN_EXACT_HITS:
+            fuzzy_query, fuzzy_rank = FuzzySearch.filter(Book.query, search_query, exact_ids)
+            if fuzzy_query is not None:
+                query, search_rank, fuzzy_search = fuzzy_query, fuzzy_rank, True
+    
+    # Count the most common tags among the search results
+    tag_counts = FacetEngine.tag_counts(query, search_query)
+    
+    # Apply tag filter through the book_tags index
+    if current_tag:
+        query = query.filter(Book.tag_list.any(Tag.name == current_tag))
+    
+    # Count hits per category, price bucket and language for the search in one query
+    # (custom price ranges outside the buckets are left out of the facet selection)
+    facets = FacetEngine.compute(query, (search_query, current_tag))
+    selected = (
+        current_category if current_category != 'All Categories' else None,
+        price_range if price_range in FacetEngine.bucket_keys() else None,
+        current_language or None
+    )
     
     # Apply category filter
     if current_category and current_category != 'All Categories':
@@ -48,20 +91,41 @@ def index():
     # Apply price range filter
     if price_range:
         min_price, max_price = map(float, price_range.split('-'))
-        query = query.filter(Book.price >= min_price, Book.price <= max_price)
+        query = query.filter(Book.price >= min_price, Book.price < max_price)
+    
+    # Apply language filter
+    if current_language:
+        query = query.filter_by(language=current_language)
     
     # Apply sorting
-    if sort_by == 'price_low':
-        query = query.order_by(Book.price.asc())
-    elif sort_by == 'price_high':
-        query = query.order_by(Book.price.desc())
-    elif sort_by == 'newest':
-        query = query.order_by(Book.created_at.desc())
-    elif sort_by == 'rating':
-        query = query.order_by(Book.average_rating.desc())
+    sort_columns = CATALOG_SORTS.get(sort_by, CATALOG_SORTS['relevance'])
+    if sort_by == 'relevance' and search_rank is not None:
+        # Match rank is not a stable key, so ranked searches use page numbers only
+        query = query.order_by(search_rank, Book.id)
+        sort_columns = None
+    
+    if not price_range or selected[1]:
+        total = facets.total(selected)
+    else:
+        total = cached_count(query, (search_query, current_tag, current_category, price_range, current_language))
     
-    # Paginate results
-    pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    # Paginate results, seeking past the cursor's sort key when one is given
+    pagination = None
+    next_cursor = None
+    if cursor and sort_columns:
+        try:
+            pagination = keyset_paginate(query, sort_columns, cursor, per_page, total)
+            next_cursor = pagination.next_cursor
+        except ValueError:
+            pagination = None
+    if pagination is None:
+        cursor = None
+        if sort_columns:
+            query = query.order_by(*order_clauses(sort_columns))
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False, count=False)
+        pagination.total = total
+        if sort_columns and pagination.has_next:
+            next_cursor = encode_cursor(pagination.items[-1], sort_columns)
     books = pagination.items
     
     return render_template('index.html',
@@ -72,13 +136,41 @@ def index():
                          search_query=search_query,
                          current_category=current_category,
                          sort_by=sort_by,
-                         price_range=price_range)
+                         price_range=price_range,
+                         current_language=current_language,
+                         current_tag=current_tag,
+                         fuzzy_search=fuzzy_search,
+                         tag_counts=tag_counts,
+                         category_counts=facets.categories(selected),
+                         price_counts=facets.price_ranges(selected),
+                         language_counts=facets.languages(selected),
+                         price_buckets=FacetEngine.bucket_keys(),
+                         total=total,
+                         cursor=cursor,
+                         next_cursor=next_cursor)
 
 @main.route('/book/<int:book_id>')
+@cache_anonymous_response
+@query_budget(DETAIL_QUERY_BUDGET)
 def book_detail(book_id):
-    book = Book.query.get_or_404(book_id)
+    # Load everything the page shows up front instead of lazily from the template
+    book = Book.query.options(
+        selectinload(Book.reviews).joinedload(Review.user),
+        selectinload(Book.formats),
+        joinedload(Book.series)
+    ).filter_by(id=book_id).first_or_404()
     form = ReviewForm()
-    return render_template('books/detail.html', book=book, form=form)
+    series_books = ReferenceCache.get_series_books(book.series_id)
+    similar_books = book.get_similar_books()
+    in_wishlist = current_user.is_authenticated and db.session.query(
+        Wishlist.query.filter_by(user_id=current_user.id, book_id=book.id).exists()
+    ).scalar()
+    return render_template('books/detail.html',
+                         book=book,
+                         form=form,
+                         series_books=series_books,
+                         similar_books=similar_books,
+                         in_wishlist=in_wishlist)
 
 @main.route('/profile')
 @login_required
@@ -97,8 +189,9 @@ def profile():
 def recommendations():
     """Show personalized book recommendations"""
     try:
-        # Get recommended books for the user
-        recommended_books = current_user.get_recommended_books(limit=8)
+        # Serve the nightly batch results, scoring live for users it has not covered yet
+        recommended_books = current_user.get_stored_recommendations(limit=8) or \
+            current_user.get_recommended_books(limit=8)
         
         # Get similar users and their recommendations
         similar_users = current_user.get_similar_users(limit=3)
@@ -116,7 +209,8 @@ def api_recommendations():
     """API endpoint for getting recommendations"""
     try:
         limit = request.args.get('limit', 5, type=int)
-        recommended_books = current_user.get_recommended_books(limit=limit)
+        recommended_books = current_user.get_stored_recommendations(limit=limit) or \
+            current_user.get_recommended_books(limit=limit)
         
         return jsonify({
             'success': True,
@@ -133,6 +227,23 @@ def api_recommendations():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@main.route('/api/session-state')
+def api_session_state():
+    """Cart count, wishlist and user info for client scripts in a single request"""
+    response = jsonify({'success': True, **SessionState.snapshot()})
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+@main.route('/api/suggest')
+def api_suggest():
+    """Typeahead suggestions for the catalog search box"""
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 8, type=int), 20)
+    return jsonify({
+        'success': True,
+        'suggestions': SuggestIndex.suggest(query, limit=limit)
+    })
+
 @main.route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():